@@ -1,10 +1,39 @@
-from flask import Flask, request, redirect, url_for, flash, jsonify, make_response
+from flask import (
+    Flask,
+    request,
+    redirect,
+    url_for,
+    flash,
+    make_response,
+    session,
+    g,
+)
 from werkzeug.exceptions import abort
+import functools
 import requests
 import logging
 import os
-
-app = Flask(__name__)
+import threading
+import time
+
+from common import (
+    assets,
+    compression,
+    conditional,
+    health,
+    http_client,
+    metrics,
+    resilience,
+    tracing,
+    wire,
+)
+from common.cache import LRUCache
+
+# Static files are served from memory by static() below.
+app = Flask(__name__, static_folder=None)
+metrics.instrument(app)
+tracing.instrument(app, "gateway")
+compression.instrument(app)
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "your secret key")
 
 POST_SERVICE_URL = os.environ.get("POST_SERVICE_URL", "http://localhost:5002")
@@ -12,6 +41,47 @@ AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL", "http://localhost:5003")
 TEMPLATE_SERVICE_URL = os.environ.get("TEMPLATE_SERVICE_URL", "http://localhost:5004")
 COMMENT_SERVICE_URL = os.environ.get("COMMENT_SERVICE_URL", "http://localhost:5005")
 
+post_client = http_client.get_client("post", POST_SERVICE_URL)
+auth_client = http_client.get_client("auth", AUTH_SERVICE_URL)
+template_client = http_client.get_client("template", TEMPLATE_SERVICE_URL)
+comment_client = http_client.get_client("comment", COMMENT_SERVICE_URL)
+
+# Independent downstream calls of one request run concurrently on this pool,
+# bounded by a per-request deadline that is forwarded to the callee.
+REQUEST_DEADLINE = float(os.environ.get("GATEWAY_REQUEST_DEADLINE", 5.0))
+fanout_executor = tracing.ContextThreadPoolExecutor(
+    max_workers=int(os.environ.get("GATEWAY_FANOUT_WORKERS", 32)),
+    thread_name_prefix="fanout",
+)
+
+# Requests beyond this many in flight get a quick 503 instead of a thread
+# that waits on downstream services; 0 disables the limit.
+MAX_IN_FLIGHT = int(os.environ.get("GATEWAY_MAX_IN_FLIGHT", 64))
+inbound_limiter = resilience.shed_load(app, MAX_IN_FLIGHT)
+
+# Rendered anonymous pages, keyed by (endpoint, post_id, query string).
+# Writes handled by this process invalidate the affected pages; the TTL
+# bounds staleness from writes handled by other gateway replicas.
+PAGE_CACHE_ENABLED = os.environ.get("PAGE_CACHE_ENABLED", "1") == "1"
+page_cache = LRUCache(
+    int(os.environ.get("PAGE_CACHE_SIZE", 1000)),
+    ttl=float(os.environ.get("PAGE_CACHE_TTL", 30)),
+)
+# Bumped by every invalidation. A page whose render spanned one may show
+# the data from before the write, so it is not stored.
+page_generation = 0
+page_generation_lock = threading.Lock()
+
+# Page ETags are the upstream view's tag plus this version and whether the
+# visitor is logged in. The default changes on every start so new templates
+# are never hidden behind old tags; replicas must share one value (e.g. the
+# release id) to revalidate each other's pages.
+PAGE_ETAG_VERSION = os.environ.get("PAGE_ETAG_VERSION") or os.urandom(4).hex()
+
+static_assets = assets.AssetStore(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+)
+
 logging.basicConfig(level=logging.INFO)
 
 
@@ -19,87 +89,262 @@ def get_token():
     return request.cookies.get("token")
 
 
+def page_variant():
+    return f"{PAGE_ETAG_VERSION}{'u' if get_token() else 'a'}"
+
+
+def upstream_conditions():
+    """If-None-Match for the view behind this page, recovered from the
+    browser's ETag for the page."""
+    suffix = "." + page_variant()
+    for tag in request.if_none_match.as_set(include_weak=True):
+        if tag.endswith(suffix):
+            return conditional.if_none_match(tag[: -len(suffix)])
+    return {}
+
+
+def page_etag(response):
+    """The page's ETag for a view served with ``response``, or None."""
+    upstream = conditional.upstream_tag(response)
+    return f"{upstream}.{page_variant()}" if upstream else None
+
+
+def page_response(html, etag):
+    if etag and request.if_none_match.contains_weak(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(html)
+    if etag:
+        response.set_etag(etag)
+        # Revalidate on every use rather than trusting a heuristic lifetime.
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def cached_page(view):
+    """Serve ``view``'s page from the page cache and with an ETag.
+
+    Views return the rendered HTML, having set ``g.page_etag``, or a
+    response (e.g. a 304 when the upstream view was unchanged).
+    """
+
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+        # Pending flash messages make the page a one-off.
+        if session.get("_flashes"):
+            result = view(**kwargs)
+            return result if not isinstance(result, str) else make_response(result)
+
+        # Logged-in users get personalised output, so it is not shared.
+        shared = PAGE_CACHE_ENABLED and not get_token()
+        key = (request.endpoint, kwargs.get("post_id"), request.query_string)
+        entry = page_cache.get(key) if shared else None
+        if entry is None:
+            generation = page_generation
+            result = view(**kwargs)
+            if not isinstance(result, str):
+                return result
+            entry = (result, g.get("page_etag"))
+            # Degraded pages (e.g. comments missing) are not worth keeping.
+            if shared and not g.get("degraded"):
+                with page_generation_lock:
+                    if generation == page_generation:
+                        page_cache.set(key, entry)
+            status = "MISS"
+        else:
+            status = "HIT"
+        response = page_response(*entry)
+        if shared:
+            response.headers["X-Cache"] = status
+        return response
+
+    return wrapper
+
+
+def invalidate_pages(post_id=None):
+    global page_generation
+    # Listings show titles and comment counts, so every write touches them.
+    with page_generation_lock:
+        page_generation += 1
+        page_cache.discard_where(
+            lambda key: key[0] == "index" or (post_id is not None and key[1] == post_id)
+        )
+
+
+def upstream_error(e, description):
+    """Abort for a failed downstream call. Calls refused by a circuit
+    breaker or concurrency limit get a 503 telling the client when to
+    retry; other failures stay 500s."""
+    if isinstance(e, http_client.Unavailable):
+        abort(503, description=description, retry_after=e.retry_after)
+    abort(500, description=description)
+
+
 def render_template(template_name, **context):
     try:
-        response = requests.post(
-            f"{TEMPLATE_SERVICE_URL}/render",
+        response = template_client.post(
+            "/render",
             json={"template": template_name, "context": context},
+            headers={"Accept": "text/html"},
         )
         response.raise_for_status()
-        return response.json()["rendered"]
+        if response.headers.get("Content-Type", "").startswith("text/html"):
+            return response.content.decode()
+        return wire.decode(response)["rendered"]
     except requests.RequestException as e:
         logging.error(f"Template service error: {str(e)}")
-        abort(500, description="Error rendering template")
+        # The error page is rendered by the same service; see internal_error.
+        g.template_failed = True
+        upstream_error(e, "Error rendering template")
+
+
+# Downstream health is probed in the background; /health serves the last
+# round, and the gateway is unready once that is older than HEALTH_MAX_AGE.
+prober = health.Prober(
+    timeout=float(os.environ.get("GATEWAY_HEALTH_TIMEOUT", health.PROBE_TIMEOUT))
+)
+for name, client in (
+    ("post", post_client),
+    ("auth", auth_client),
+    ("template", template_client),
+    ("comment", comment_client),
+):
+    prober.dependency(name, client)
+health.instrument(
+    app,
+    prober,
+    extras=lambda: {
+        "connections": http_client.stats(),
+        "load_shedding": inbound_limiter.stats(),
+        "page_cache": page_cache.stats(),
+        "static": static_assets.stats(),
+    },
+)
+
+
+@app.route("/static/<path:filename>")
+def static(filename):
+    response = static_assets.response(filename)
+    if response is None:
+        # Plain, so a missing asset does not cost a template render.
+        return make_response("Not found", 404)
+    return response
+
+
+@app.route("/search")
+def search():
+    query = request.args.get("q", "").strip()
+    page = request.args.get("page", 1, type=int)
+    posts, comments, has_more = [], [], False
+    comments_unavailable = False
+    if query:
+        deadline = time.monotonic() + REQUEST_DEADLINE
+        params = {"q": query, "page": page}
+        posts_future = fanout_executor.submit(
+            post_client.get, "/search", params=params, deadline=deadline
+        )
+        comments_future = fanout_executor.submit(
+            comment_client.get, "/comments/search", params=params, deadline=deadline
+        )
+        try:
+            response = posts_future.result()
+            response.raise_for_status()
+            data = wire.decode(response)
+            posts, has_more = data["results"], data["has_more"]
+        except requests.RequestException as e:
+            logging.error(f"Post service error: {str(e)}")
+            upstream_error(e, "Error searching posts")
+        try:
+            response = comments_future.result()
+            response.raise_for_status()
+            data = wire.decode(response)
+            comments, has_more = data["results"], has_more or data["has_more"]
+        except requests.RequestException as e:
+            logging.warning(f"Comment service error: {str(e)}")
+            comments_unavailable = True
+
+    return render_template(
+        "search.html",
+        query=query,
+        page=page,
+        posts=posts,
+        comments=comments,
+        has_more=has_more,
+        comments_unavailable=comments_unavailable,
+    )
 
 
-@app.route("/health")
-def health():
-    services = {
-        "post": POST_SERVICE_URL,
-        "auth": AUTH_SERVICE_URL,
-        "template": TEMPLATE_SERVICE_URL,
-        "comment": COMMENT_SERVICE_URL,
+def page_args():
+    # Keyset pagination cursors: ids of the rows bordering the wanted page.
+    return {
+        key: request.args[key]
+        for key in ("after", "before")
+        if request.args.get(key, type=int) is not None
     }
-    health_status = {}
-    for service, url in services.items():
-        try:
-            response = requests.get(f"{url}/health")
-            health_status[service] = (
-                "healthy" if response.status_code == 200 else "unhealthy"
-            )
-        except requests.RequestException:
-            health_status[service] = "unhealthy"
-
-    overall_health = (
-        "healthy"
-        if all(status == "healthy" for status in health_status.values())
-        else "unhealthy"
-    )
-    return jsonify({"status": overall_health, "services": health_status})
 
 
 @app.route("/")
+@cached_page
 def index():
-    page = request.args.get("page", 1, type=int)
     try:
-        response = requests.get(f"{POST_SERVICE_URL}/?page={page}")
+        response = post_client.get(
+            "/", params=page_args(), headers=upstream_conditions()
+        )
+        # With sharded ids, the post a page link points at was deleted.
+        if response.status_code == 404:
+            abort(404)
         response.raise_for_status()
-        data = response.json()
+        if response.status_code == 304:
+            return page_response(None, page_etag(response))
+        data = wire.decode(response)
+        g.page_etag = page_etag(response)
         return render_template(
             "index.html",
             posts=data["posts"],
-            page=data["page"],
-            total_pages=data["total_pages"],
+            next_cursor=data["next_cursor"],
+            prev_cursor=data["prev_cursor"],
         )
     except requests.RequestException as e:
         logging.error(f"Post service error: {str(e)}")
-        abort(500, description="Error fetching posts")
+        upstream_error(e, "Error fetching posts")
 
 
 @app.route("/<int:post_id>")
+@cached_page
 def post(post_id):
+    deadline = time.monotonic() + REQUEST_DEADLINE
     try:
-        post_response = requests.get(f"{POST_SERVICE_URL}/{post_id}")
-        post_response.raise_for_status()
-        post = post_response.json()
-
-        page = request.args.get("page", 1, type=int)
-        comments_response = requests.get(
-            f"{COMMENT_SERVICE_URL}/comments/{post_id}?page={page}"
-        )
-        comments_response.raise_for_status()
-        comments_data = comments_response.json()
-
-        return render_template(
-            "post.html",
-            post=post,
-            comments=comments_data["comments"],
-            page=comments_data["page"],
-            total_pages=comments_data["total_pages"],
+        response = post_client.get(
+            f"/{post_id}/view",
+            params=page_args(),
+            headers=upstream_conditions(),
+            deadline=deadline,
         )
+        if response.status_code == 404:
+            abort(404)
+        response.raise_for_status()
+        if response.status_code == 304:
+            return page_response(None, page_etag(response))
+        view = wire.decode(response)
+        g.page_etag = page_etag(response)
     except requests.RequestException as e:
-        logging.error(f"Service error: {str(e)}")
-        abort(500, description="Error fetching post or comments")
+        logging.error(f"Post service error: {str(e)}")
+        upstream_error(e, "Error fetching post")
+
+    # post_service degrades the view when comments are slow or failing;
+    # such pages are not worth caching.
+    if view["comments_unavailable"]:
+        g.degraded = True
+
+    return render_template(
+        "post.html",
+        post=view["post"],
+        comments=view["comments"],
+        next_cursor=view["next_cursor"],
+        prev_cursor=view["prev_cursor"],
+        comment_count=view["stats"]["comment_count"],
+        comments_unavailable=view["comments_unavailable"],
+    )
 
 
 @app.route("/create", methods=("GET", "POST"))
@@ -116,11 +361,12 @@ def create():
             flash("Title is required!")
         else:
             try:
-                response = requests.post(
-                    f"{POST_SERVICE_URL}/create",
+                response = post_client.post(
+                    "/create",
                     json={"title": title, "content": content, "token": token},
                 )
                 response.raise_for_status()
+                invalidate_pages()
                 return redirect(url_for("index"))
             except requests.RequestException as e:
                 logging.error(f"Post service error: {str(e)}")
@@ -136,9 +382,9 @@ def edit(id):
         return redirect(url_for("login"))
 
     try:
-        response = requests.get(f"{POST_SERVICE_URL}/{id}")
+        response = post_client.get(f"/{id}")
         response.raise_for_status()
-        post = response.json()
+        post = wire.decode(response)
 
         if request.method == "POST":
             title = request.form["title"]
@@ -147,11 +393,12 @@ def edit(id):
             if not title:
                 flash("Title is required!")
             else:
-                response = requests.put(
-                    f"{POST_SERVICE_URL}/{id}/edit",
+                response = post_client.put(
+                    f"/{id}/edit",
                     json={"title": title, "content": content, "token": token},
                 )
                 response.raise_for_status()
+                invalidate_pages(id)
                 return redirect(url_for("index"))
     except requests.RequestException as e:
         logging.error(f"Post service error: {str(e)}")
@@ -167,13 +414,12 @@ def delete(id):
         return redirect(url_for("login"))
 
     try:
-        response = requests.delete(
-            f"{POST_SERVICE_URL}/{id}/delete", json={"token": token}
-        )
+        response = post_client.delete(f"/{id}/delete", json={"token": token})
         response.raise_for_status()
+        invalidate_pages(id)
         flash(
             '"{}" was successfully deleted!'.format(
-                response.json().get("title", "Post")
+                wire.decode(response).get("title", "Post")
             )
         )
     except requests.RequestException as e:
@@ -188,12 +434,12 @@ def login():
         username = request.form["username"]
         password = request.form["password"]
         try:
-            response = requests.post(
-                f"{AUTH_SERVICE_URL}/login",
+            response = auth_client.post(
+                "/login",
                 json={"username": username, "password": password},
             )
             response.raise_for_status()
-            token = response.json()["token"]
+            token = wire.decode(response)["token"]
             resp = make_response(redirect(url_for("index")))
             resp.set_cookie(
                 "token", token, httponly=True, secure=True, samesite="Strict"
@@ -211,8 +457,8 @@ def register():
         username = request.form["username"]
         password = request.form["password"]
         try:
-            response = requests.post(
-                f"{AUTH_SERVICE_URL}/register",
+            response = auth_client.post(
+                "/register",
                 json={"username": username, "password": password},
             )
             response.raise_for_status()
@@ -220,7 +466,7 @@ def register():
             return redirect(url_for("login"))
         except requests.RequestException as e:
             logging.error(f"Auth service error: {str(e)}")
-            flash("Registration failed. " + response.json().get("message", ""))
+            flash("Registration failed. " + wire.decode(response).get("message", ""))
     return render_template("register.html")
 
 
@@ -239,11 +485,12 @@ def add_comment(post_id):
 
     content = request.form["content"]
     try:
-        response = requests.post(
-            f"{COMMENT_SERVICE_URL}/comments",
+        response = comment_client.post(
+            "/comments",
             json={"post_id": post_id, "content": content, "token": token},
         )
         response.raise_for_status()
+        invalidate_pages(post_id)
         flash("Comment added successfully.")
     except requests.RequestException as e:
         logging.error(f"Comment service error: {str(e)}")
@@ -259,6 +506,9 @@ def not_found_error(error):
 @app.errorhandler(500)
 def internal_error(error):
     app.logger.error(f"Server Error: {error}, Path: {request.path}")
+    if g.get("template_failed"):
+        # Another render would wait on the failing service all over again.
+        return make_response("Internal server error", 500)
     return render_template("500.html"), 500
 
 
@@ -0,0 +1,99 @@
+"""auth_service ``/validate`` latency during a login storm.
+
+auth_service is served locally on a throwaway ``users.db``. Storm threads
+log in continuously while a probe thread measures ``/validate``; the run
+is repeated with password hashing inline in request threads and in the
+bounded process pool.
+
+    python -m benchmarks.auth_hash_bench [--storm-threads 16] [--duration 10]
+"""
+
+import argparse
+import collections
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks.support import ROOT, load_service, print_table, serve, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--storm-threads", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        conn = sqlite3.connect("users.db")
+        with open(os.path.join(ROOT, "users_schema.sql")) as f:
+            conn.executescript(f.read())
+        conn.close()
+
+        auth_service = load_service("auth_service")
+        url = serve(auth_service.app)[0]
+        session = requests.Session()
+        session.post(f"{url}/register", json={"username": "u", "password": "p"})
+        token = session.post(
+            f"{url}/login", json={"username": "u", "password": "p"}
+        ).json()["token"]
+        pool_workers = max(1, auth_service.HASH_WORKERS)
+
+        rows = []
+        for mode, workers in (("inline", 0), ("process pool", pool_workers)):
+            auth_service.HASH_WORKERS = workers
+            auth_service.hash_slots = threading.BoundedSemaphore(
+                workers + auth_service.HASH_QUEUE_SIZE
+            )
+            stop = time.monotonic() + args.duration
+            logins = collections.Counter()
+            lock = threading.Lock()
+
+            def storm():
+                client = requests.Session()
+                while time.monotonic() < stop:
+                    status = client.post(
+                        f"{url}/login", json={"username": "u", "password": "p"}
+                    ).status_code
+                    with lock:
+                        logins[status] += 1
+
+            storm_threads = [
+                threading.Thread(target=storm) for _ in range(args.storm_threads)
+            ]
+            for t in storm_threads:
+                t.start()
+            time.sleep(0.5)
+
+            samples = []
+            probe = requests.Session()
+            while time.monotonic() < stop:
+                start = time.perf_counter()
+                probe.post(f"{url}/validate", json={"token": token})
+                samples.append(time.perf_counter() - start)
+                time.sleep(0.01)
+            for t in storm_threads:
+                t.join()
+
+            stats = summarize(samples)
+            rows.append(
+                {
+                    "mode": mode,
+                    "hash_workers": workers,
+                    "logins_ok_per_s": round(logins[200] / args.duration, 1),
+                    "logins_503": logins[503],
+                    "validate_p50_ms": stats["p50_ms"],
+                    "validate_p99_ms": stats["p99_ms"],
+                }
+            )
+        os.chdir(ROOT)
+
+    print_table(f"/validate during a {args.storm_threads}-thread login storm", rows)
+
+
+if __name__ == "__main__":
+    main()
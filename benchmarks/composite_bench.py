@@ -0,0 +1,93 @@
+"""Requests and latency per post page view: separate calls vs post view.
+
+db_service, comment_service and post_service run for real on throwaway
+databases. The "separate" mode issues what the gateway used to send for
+``/<post_id>`` (post_service ``/<id>`` and comment_service
+``/comments/<id>``, concurrently); "composite" sends a single post_service
+``/<id>/view``. Inbound requests are counted at every service.
+
+    python -m benchmarks.composite_bench [--iterations 300]
+"""
+
+import argparse
+import collections
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import bulk_load
+from benchmarks.support import ROOT, load_service, print_table, serve, summarize, timed
+
+requests_seen = collections.Counter()
+
+
+def counting(name, wsgi_app):
+    def middleware(environ, start_response):
+        requests_seen[name] += 1
+        return wsgi_app(environ, start_response)
+
+    return middleware
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        bulk_load.load(".", users=100, posts=100, comments=5000)
+        db_service = load_service("db_service")
+        comment_service = load_service("comment_service")
+        os.environ["DB_SERVICE_URL"] = serve(counting("db", db_service.app))[0]
+        os.environ["COMMENT_SERVICE_URL"] = serve(
+            counting("comment", comment_service.app)
+        )[0]
+        post_service = load_service("post_service")
+        post_url = serve(counting("post", post_service.app))[0]
+
+        from common import http_client
+
+        post_client = http_client.get_client("bench-post", post_url)
+        comment_client = http_client.get_client(
+            "bench-comment", os.environ["COMMENT_SERVICE_URL"]
+        )
+        executor = ThreadPoolExecutor(max_workers=4)
+
+        def separate():
+            post = executor.submit(post_client.get, "/1")
+            comments = executor.submit(comment_client.get, "/comments/1")
+            assert post.result().status_code == 200
+            assert comments.result().status_code == 200
+            return 2
+
+        def composite():
+            assert post_client.get("/1/view").status_code == 200
+            return 1
+
+        rows = []
+        for mode, page_view in (("separate", separate), ("composite", composite)):
+            requests_seen.clear()
+            gateway_calls = page_view()
+            per_view = dict(requests_seen)
+            samples = timed(page_view, args.iterations)
+            rows.append(
+                {
+                    "mode": mode,
+                    "gateway_calls": gateway_calls,
+                    "internal_requests": sum(per_view.values()),
+                    **{
+                        f"{name}_requests": per_view.get(name, 0)
+                        for name in ("post", "comment", "db")
+                    },
+                    "p50_ms": summarize(samples)["p50_ms"],
+                    "p99_ms": summarize(samples)["p99_ms"],
+                }
+            )
+        os.chdir(ROOT)
+
+    print_table("Per post page view", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Bytes on the wire and CPU cost of response compression.
+
+The micro-benchmark compresses the bodies the gateway and the services
+send (the rendered index page, a post view and a 10-post listing as JSON,
+built as in ``wire_bench``) and ``static/css/style.css``. It does so with
+gzip at levels 1 (the default), 6 and 9, and with brotli when the
+``brotli`` package is installed. For each it reports the compressed size, compress and decompress
+time, and the break-even link speed. Below that speed the bytes saved take
+longer to send than the compression took, so compressing lowers latency.
+
+``--service`` also seeds a throwaway ``database.db`` and fetches a 100-post
+listing from db_service's Flask app in process, as identity, gzip with the
+compressed-body cache cold, and gzip with it warm (the same ETag again).
+
+    python -m benchmarks.compression_bench
+    python -m benchmarks.compression_bench --service
+"""
+
+import argparse
+import gzip
+import json
+import os
+import tempfile
+
+import bulk_load
+from benchmarks.support import ROOT, load_service, print_table, summarize, timed
+from benchmarks.wire_bench import payloads
+from common import compression
+
+LEVELS = [("gzip", 1), ("gzip", 6), ("gzip", 9)]
+if compression.brotli is not None:
+    LEVELS += [("br", 4), ("br", 5), ("br", 11)]
+
+
+def bodies():
+    samples = payloads()
+    with open(os.path.join(ROOT, "static", "css", "style.css"), "rb") as f:
+        css = f.read()
+    return {
+        "index page (html)": samples["rendered page"]["rendered"].encode(),
+        "post view (json)": json.dumps(samples["post view"]).encode(),
+        "10-post listing (json)": json.dumps(
+            samples["render context"]["context"]
+        ).encode(),
+        "style.css": css,
+    }
+
+
+def p50_seconds(fn, iterations):
+    return summarize(timed(fn, iterations))["p50_ms"] / 1000
+
+
+def decompress(data, encoding):
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    return compression.brotli.decompress(data)
+
+
+def micro(iterations):
+    rows = []
+    for name, data in bodies().items():
+        rows.append(
+            {
+                "body": name,
+                "codec": "identity",
+                "bytes": len(data),
+                "ratio": 1.0,
+                "compress_us": 0,
+                "decompress_us": 0,
+                "breakeven_mbit": "-",
+            }
+        )
+        for encoding, level in LEVELS:
+            compressed = compression.compress(data, encoding, level)
+            compress_s = p50_seconds(
+                lambda: compression.compress(data, encoding, level), iterations
+            )
+            decompress_s = p50_seconds(
+                lambda: decompress(compressed, encoding), iterations
+            )
+            saved_bits = (len(data) - len(compressed)) * 8
+            rows.append(
+                {
+                    "body": name,
+                    "codec": f"{encoding}-{level}",
+                    "bytes": len(compressed),
+                    "ratio": round(len(data) / len(compressed), 2),
+                    "compress_us": round(compress_s * 1e6, 1),
+                    "decompress_us": round(decompress_s * 1e6, 1),
+                    "breakeven_mbit": round(
+                        saved_bits / (compress_s + decompress_s) / 1e6, 1
+                    )
+                    if saved_bits > 0
+                    else "never",
+                }
+            )
+    print_table(f"Compression (p50 of {iterations})", rows)
+
+
+def service(iterations):
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        bulk_load.load(tmp, users=10, posts=1000, comments=0)
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            client = load_service("db_service").app.test_client()
+        finally:
+            os.chdir(cwd)
+        modes = {
+            "identity": ({"Accept-Encoding": "identity"}, False),
+            "gzip, cold": ({"Accept-Encoding": "gzip"}, True),
+            "gzip, cached": ({"Accept-Encoding": "gzip"}, False),
+        }
+        for mode, (headers, cold) in modes.items():
+            response = client.get("/posts?per_page=100", headers=headers)
+
+            def fetch():
+                if cold:
+                    compression._compressed.clear()
+                client.get("/posts?per_page=100", headers=headers)
+
+            stats = summarize(timed(fetch, iterations))
+            rows.append(
+                {
+                    "mode": mode,
+                    "bytes": len(response.data),
+                    "p50_ms": stats["p50_ms"],
+                    "p95_ms": stats["p95_ms"],
+                }
+            )
+    print_table(f"db_service GET /posts?per_page=100 (p50 of {iterations})", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--service", action="store_true", help="also time db_service")
+    args = parser.parse_args()
+
+    micro(args.iterations)
+    if args.service:
+        service(args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Gateway latency with sequential vs concurrent downstream fan-out.
+
+post_service runs for real; db, comment, template and auth services are
+stubs that sleep for a configurable time per call. ``/<post_id>`` (whose
+post view fans out in post_service) is measured with the fan-out pools
+and with a synchronous executor that reproduces the old
+one-after-the-other calls, then with a comment service slower than the
+request deadline.
+
+    python -m benchmarks.fanout_bench [--delay-ms 30] [--slow-ms 3000]
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import Future
+
+from flask import Flask, jsonify
+
+from benchmarks.support import load_service, print_table, serve, summarize, timed
+
+delays = {"db": 0.0, "comment": 0.0, "template": 0.0, "auth": 0.0}
+
+
+def stub(name, routes):
+    stub_app = Flask(f"{name}_stub")
+
+    @stub_app.route("/health/ready")
+    def health():
+        time.sleep(delays[name])
+        return jsonify({"status": "healthy"})
+
+    for rule, body in routes.items():
+        stub_app.add_url_rule(
+            rule,
+            rule,
+            lambda body=body, **kwargs: (time.sleep(delays[name]), jsonify(body))[1],
+            methods=["GET", "POST"],
+        )
+    return serve(stub_app)[0]
+
+
+class SynchronousExecutor:
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--delay-ms", type=float, default=30)
+    parser.add_argument("--slow-ms", type=float, default=3000)
+    parser.add_argument("--deadline", type=float, default=0.5)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    os.environ.update(
+        {
+            "DB_SERVICE_URL": stub(
+                "db", {"/posts/1": {"id": 1, "title": "Post", "content": "Body"}}
+            ),
+            "COMMENT_SERVICE_URL": stub(
+                "comment",
+                {
+                    "/comments/1": {
+                        "comments": [],
+                        "total": 0,
+                        "last_comment_at": None,
+                        "next_cursor": None,
+                        "prev_cursor": None,
+                    }
+                },
+            ),
+            "TEMPLATE_SERVICE_URL": stub("template", {"/render": {"rendered": "ok"}}),
+            "AUTH_SERVICE_URL": stub("auth", {}),
+            "PAGE_CACHE_ENABLED": "0",
+            "GATEWAY_REQUEST_DEADLINE": str(args.deadline),
+        }
+    )
+    post_service = load_service("post_service")
+    os.environ["POST_SERVICE_URL"] = serve(post_service.app)[0]
+    import app as gateway
+
+    client = gateway.app.test_client()
+    executors = {
+        gateway: gateway.fanout_executor,
+        post_service: post_service.fanout_executor,
+    }
+    rows = []
+
+    def measure(scenario, mode, route, iterations):
+        for module, executor in executors.items():
+            module.fanout_executor = (
+                executor if mode == "concurrent" else SynchronousExecutor()
+            )
+        statuses = set()
+        samples = timed(
+            lambda: statuses.add(client.get(route).status_code), iterations, warmup=0
+        )
+        rows.append(
+            {
+                "scenario": scenario,
+                "mode": mode,
+                "route": route,
+                "status": ",".join(str(status) for status in sorted(statuses)),
+                **summarize(samples),
+            }
+        )
+        return statuses
+
+    for name in delays:
+        delays[name] = args.delay_ms / 1000
+    for mode in ("sequential", "concurrent"):
+        measure("all healthy", mode, "/1", args.iterations)
+
+    delays["comment"] = args.slow_ms / 1000
+    statuses = measure(
+        "slow comments", "concurrent", "/1", max(1, args.iterations // 5)
+    )
+
+    print_table(
+        f"Gateway latency ({args.delay_ms:.0f}ms per hop, "
+        f"{args.deadline * 1000:.0f}ms deadline)",
+        rows,
+    )
+    # The post page must still be served, without comments, before the
+    # gateway's deadline.
+    assert statuses == {200}, f"slow comments answered {statuses}"
+
+
+if __name__ == "__main__":
+    main()
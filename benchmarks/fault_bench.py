@@ -0,0 +1,229 @@
+"""Gateway latency while a downstream service hangs.
+
+Seeds a throwaway data directory and boots the services as ``load_bench``
+does, except that the target (template_service, or post_service with
+``--target post``) is run by this bench with a ``POST /_fault`` route
+added. While a fault is set, every request to the target except the
+health endpoints sleeps ``--delay`` seconds before being served.
+
+Index and post pages are requested through the gateway at ``--rate`` per
+second, open loop, for three phases of ``--phase`` seconds: healthy,
+degraded (fault set) and recovered. The gateway runs with the page cache
+off so that every view calls through, once per mode:
+
+* ``unprotected``: no circuit breakers, fixed timeouts and no concurrency
+  limits (``HTTP_BREAKER_ENABLED=0``, ``HTTP_ADAPTIVE_TIMEOUT=0``,
+  ``HTTP_MAX_CONCURRENCY=0``, ``GATEWAY_MAX_IN_FLIGHT=0``).
+* ``protected``: the defaults.
+
+Latency is measured from each request's scheduled arrival and covers every
+response, errors included. ``breaker`` is the gateway's breaker state for
+the target at the end of the phase, from ``/health``.
+
+    python -m benchmarks.fault_bench [--target template] [--delay 10]
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import bulk_load
+from benchmarks.load_bench import SERVICES, wait_healthy
+from benchmarks.support import ROOT, print_table, summarize
+
+TARGETS = {"template": "template_service", "post": "post_service"}
+PHASES = ("healthy", "degraded", "recovered")
+MODES = {
+    "unprotected": {
+        "HTTP_BREAKER_ENABLED": "0",
+        "HTTP_ADAPTIVE_TIMEOUT": "0",
+        "HTTP_MAX_CONCURRENCY": "0",
+        "GATEWAY_MAX_IN_FLIGHT": "0",
+    },
+    "protected": {},
+}
+
+
+def serve(name):
+    """Run a service with the ``/_fault`` route added (child process)."""
+    from flask import jsonify, request
+
+    from benchmarks.support import load_service
+
+    service = load_service(TARGETS[name])
+    fault = {"delay": 0.0}
+
+    def inject():
+        if fault["delay"] and not request.path.startswith(("/health", "/_fault")):
+            time.sleep(fault["delay"])
+
+    def set_fault():
+        fault["delay"] = float(request.get_json()["delay"])
+        return jsonify(fault)
+
+    service.app.before_request(inject)
+    service.app.add_url_rule("/_fault", view_func=set_fault, methods=["POST"])
+    service.app.run(port=SERVICES[name][0], threaded=True)
+
+
+def start(data_dir, name, env, log):
+    port, command, in_data_dir = SERVICES[name]
+    if in_data_dir:
+        command = [os.path.join(ROOT, command[0])]
+    return subprocess.Popen(
+        [sys.executable, *command],
+        cwd=data_dir if in_data_dir else ROOT,
+        env={**os.environ, **env},
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def breaker_state(target):
+    try:
+        health = requests.get(
+            f"http://localhost:{SERVICES['gateway'][0]}/health", timeout=10
+        ).json()
+    except (requests.RequestException, ValueError):
+        return "?"
+    breaker = health["connections"][target]["breaker"]
+    return breaker["state"] if breaker else "-"
+
+
+def run(target, rate, phase, delay, posts, concurrency, seed):
+    """Drive the gateway through the three phases; one row per phase."""
+    base = f"http://localhost:{SERVICES['gateway'][0]}"
+    fault_url = f"http://localhost:{SERVICES[target][0]}/_fault"
+    rng = random.Random(seed)
+    samples = {name: [] for name in PHASES}
+    statuses = {name: Counter() for name in PHASES}
+    breakers = {}
+    lock = threading.Lock()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def call(url, scheduled, name):
+        try:
+            status = requests.get(url, timeout=60).status_code
+        except requests.RequestException:
+            status = "error"
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            samples[name].append(elapsed)
+            statuses[name][status] += 1
+
+    start = time.perf_counter()
+    scheduled = start
+    for index, name in enumerate(PHASES):
+        requests.post(fault_url, json={"delay": delay if name == "degraded" else 0})
+        end = start + (index + 1) * phase
+        while scheduled < end:
+            pause = scheduled - time.perf_counter()
+            if pause > 0:
+                time.sleep(pause)
+            if rng.random() < 0.5:
+                url = f"{base}/"
+            else:
+                url = f"{base}/{rng.randint(1, posts)}"
+            executor.submit(call, url, scheduled, name)
+            scheduled += 1.0 / rate
+        breakers[name] = breaker_state(target)
+    executor.shutdown(wait=True)
+
+    rows = []
+    for name in PHASES:
+        stats = summarize(samples[name])
+        counts = statuses[name]
+        rows.append(
+            {
+                "phase": name,
+                "requests": stats["n"],
+                "ok": counts[200],
+                "503": counts[503],
+                "other_errors": stats["n"] - counts[200] - counts[503],
+                "p50_ms": stats["p50_ms"],
+                "p99_ms": stats["p99_ms"],
+                "max_ms": round(max(samples[name], default=0) * 1000, 1),
+                "breaker": breakers[name],
+            }
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=sorted(TARGETS), default="template")
+    parser.add_argument("--delay", type=float, default=10.0)
+    parser.add_argument("--rate", type=float, default=20.0)
+    parser.add_argument("--phase", type=float, default=15.0)
+    parser.add_argument("--concurrency", type=int, default=400)
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--serve", choices=sorted(TARGETS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        os.chdir(os.environ["FAULT_BENCH_DATA"])
+        serve(args.serve)
+        return
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        bulk_load.load(data_dir, users=100, posts=args.posts, comments=args.posts)
+        log = open(os.path.join(data_dir, "services.log"), "w")
+        backends = {}
+        for name in SERVICES:
+            if name == args.target:
+                backends[name] = subprocess.Popen(
+                    [sys.executable, "-m", "benchmarks.fault_bench", "--serve", name],
+                    cwd=ROOT,
+                    env={
+                        **os.environ,
+                        "PYTHONPATH": ROOT,
+                        "FAULT_BENCH_DATA": data_dir,
+                    },
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                )
+            elif name != "gateway":
+                backends[name] = start(data_dir, name, {}, log)
+        try:
+            wait_healthy(backends)
+            for mode, env in MODES.items():
+                gateway = start(
+                    data_dir, "gateway", {"PAGE_CACHE_ENABLED": "0", **env}, log
+                )
+                try:
+                    wait_healthy({"gateway": gateway})
+                    rows = run(
+                        args.target,
+                        args.rate,
+                        args.phase,
+                        args.delay,
+                        args.posts,
+                        args.concurrency,
+                        args.seed,
+                    )
+                finally:
+                    gateway.terminate()
+                    gateway.wait()
+                print_table(
+                    f"{mode}: {args.target} hangs {args.delay}s per request while "
+                    f"degraded, {args.rate} req/s, {args.phase}s per phase",
+                    rows,
+                )
+        finally:
+            for process in backends.values():
+                process.terminate()
+                process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Front-page listing from the in-memory feed vs the keyset query.
+
+Seeds a throwaway ``database.db`` with ``bulk_load``, splits it into
+``--shards`` shards with ``shard_split`` and loads db_service in process.
+Each page is timed two ways: ``page`` is just the lookup
+(``front_page.page()`` against ``pagination.fetch_page`` on the shards)
+and ``GET /posts`` is the whole request through the Flask test client,
+served as usual or with ``source=query``. The pages are the first page
+and the fifth (by ``after`` cursor), both inside the default feed.
+
+    python -m benchmarks.feed_bench [--posts 100000] [--shards 1,4]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+import bulk_load
+import shard_split
+from benchmarks.support import load_service, print_table, summarize, timed
+from common import pagination
+
+
+def load(data_dir, shards):
+    """A fresh import of db_service over the shards in ``data_dir``."""
+    os.environ["DB_SHARDS"] = str(shards)
+    cwd = os.getcwd()
+    os.chdir(data_dir)
+    try:
+        sys.modules.pop("db_service", None)
+        return load_service("db_service")
+    finally:
+        os.chdir(cwd)
+
+
+def run(posts, shards, iterations):
+    rows = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        bulk_load.load(data_dir, users=100, posts=posts, comments=0)
+        count = 1
+        while count < shards:
+            shard_split.split(os.path.join(data_dir, "database.db"))
+            count *= 2
+        service = load(data_dir, count)
+        client = service.app.test_client()
+
+        cursor = None
+        for _ in range(4):
+            cursor = service.front_page.page(after=cursor)["next_cursor"]
+        pages = {"first page": {}, "page 5": {"after": cursor}}
+
+        for name, args in pages.items():
+
+            def query():
+                with service.shards.connections() as conns:
+                    pagination.fetch_page(conns, "posts", **args)
+
+            def from_feed():
+                service.front_page.page(**args)
+
+            modes = {
+                ("page", "query"): query,
+                ("page", "feed"): from_feed,
+                ("GET /posts", "query"): lambda: client.get(
+                    "/posts", query_string={**args, "source": "query"}
+                ),
+                ("GET /posts", "feed"): lambda: client.get("/posts", query_string=args),
+            }
+            for (level, mode), fn in modes.items():
+                stats = summarize(timed(fn, iterations))
+                rows.append(
+                    {
+                        "shards": count,
+                        "page": name,
+                        "timed": level,
+                        "source": mode,
+                        "p50_ms": stats["p50_ms"],
+                        "p95_ms": stats["p95_ms"],
+                    }
+                )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--shards", default="1,4")
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    rows = []
+    for shards in [int(n) for n in args.shards.split(",")]:
+        rows.extend(run(args.posts, shards, args.iterations))
+    print_table(
+        f"Listing {args.posts} posts, 10 per page (p50 of {args.iterations})", rows
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Comment insert throughput: a commit per insert vs group commit.
+
+Writer threads insert comments for a fixed duration into a ``comments``
+table built from ``comments_schema.sql``, either each in its own
+transaction (what ``add_comment`` does by default) or through a
+``db.GroupCommitWriter`` with a range of batch windows. Each mode runs with
+the service default ``synchronous=NORMAL`` and with ``FULL``, where every
+commit waits for an fsync and batching pays off most.
+
+    python -m benchmarks.group_commit_bench [--writers 32] [--windows 0,1,2,5,10]
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from benchmarks.support import ROOT, print_table, summarize
+from common import db
+
+INSERT = "INSERT INTO comments (post_id, content, author) VALUES (?, ?, ?)"
+
+
+def build_database(path):
+    conn = sqlite3.connect(path)
+    with open(os.path.join(ROOT, "comments_schema.sql")) as f:
+        conn.executescript(f.read())
+    conn.close()
+
+
+def direct_insert(pool):
+    def insert(params):
+        with pool.connection() as conn:
+            return conn.execute(INSERT, params).lastrowid
+
+    return insert
+
+
+def run(insert, writers, duration):
+    samples = []
+    ids = []
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def worker(n):
+        local, rowids = [], []
+        params = (n % 100 + 1, "A comment of typical length. " * 4, f"user{n}")
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            rowids.append(insert(params))
+            local.append(time.perf_counter() - start)
+        with lock:
+            samples.extend(local)
+            ids.extend(rowids)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # Every caller must have got back its own row id.
+    assert len(set(ids)) == len(ids), "duplicate lastrowid returned"
+    return samples
+
+
+def mean_batch(name):
+    series = db.GROUP_COMMIT_BATCH_SIZE._series.get((name,))
+    if not series:
+        return 1.0
+    return round(series[-1] / sum(series[:-1]), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--max-batch", type=int, default=db.GROUP_COMMIT_BATCH)
+    parser.add_argument(
+        "--windows", default="0,1,2,5,10", help="batch windows in milliseconds"
+    )
+    args = parser.parse_args()
+    windows = [float(w) for w in args.windows.split(",")]
+
+    table = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for synchronous in ("NORMAL", "FULL"):
+            for window in [None] + windows:
+                mode = "direct" if window is None else f"group {window:g}ms"
+                name = f"{synchronous}-{mode.replace(' ', '-')}.db"
+                path = os.path.join(tmp, name)
+                build_database(path)
+                pool = db.ConnectionPool(
+                    path, size=args.writers + 1, synchronous=synchronous
+                )
+                if window is None:
+                    insert = direct_insert(pool)
+                else:
+                    writer = db.GroupCommitWriter(
+                        pool, max_batch=args.max_batch, window=window / 1000
+                    )
+
+                    def insert(params, writer=writer):
+                        return writer.execute(INSERT, params)
+
+                samples = run(insert, args.writers, args.duration)
+                stats = summarize(samples)
+                table.append(
+                    {
+                        "synchronous": synchronous,
+                        "mode": mode,
+                        "comments_per_s": round(len(samples) / args.duration, 1),
+                        "mean_batch": mean_batch(name),
+                        "p50_ms": stats["p50_ms"],
+                        "p99_ms": stats["p99_ms"],
+                    }
+                )
+
+    print_table(
+        f"{args.writers} writers for {args.duration}s, batches of up to "
+        f"{args.max_batch}",
+        table,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Health probe latency and downstream calls, per probe vs from the snapshot.
+
+post_service runs in process against db and auth stubs whose
+``/health/ready`` sleeps ``--delay-ms``. Its readiness endpoint is probed
+``--iterations`` times two ways:
+
+* ``probe per request``: a round of checks runs before every answer, as
+  ``/health`` did before the background prober.
+* ``snapshot``: the answer comes from the last background round.
+
+``downstream_calls`` counts the stub calls made while probing, background
+rounds included. The ``slow db`` scenario makes db_service's check slower
+than the probe timeout.
+
+    python -m benchmarks.health_bench [--delay-ms 20] [--slow-ms 3000]
+"""
+
+import argparse
+import os
+import threading
+import time
+
+from flask import Flask, jsonify
+
+from benchmarks.support import load_service, print_table, serve, summarize, timed
+
+delays = {"db": 0.0, "auth": 0.0}
+calls = {"count": 0}
+calls_lock = threading.Lock()
+
+
+def stub(name):
+    stub_app = Flask(f"{name}_stub")
+
+    @stub_app.route("/health/ready")
+    def ready():
+        with calls_lock:
+            calls["count"] += 1
+        time.sleep(delays[name])
+        return jsonify({"status": "healthy"})
+
+    return serve(stub_app)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--delay-ms", type=float, default=20)
+    parser.add_argument("--slow-ms", type=float, default=3000)
+    parser.add_argument("--timeout", type=float, default=0.5)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ.update(
+        {
+            "DB_SERVICE_URL": stub("db"),
+            "AUTH_SERVICE_URL": stub("auth"),
+            "HEALTH_PROBE_INTERVAL": str(args.interval),
+            "HEALTH_PROBE_TIMEOUT": str(args.timeout),
+            "HTTP_MAX_RETRIES": "0",
+            "HTTP_BREAKER_ENABLED": "0",
+        }
+    )
+    post_service = load_service("post_service")
+    client = post_service.app.test_client()
+    prober = post_service.prober
+
+    def per_request():
+        prober.run_once()
+        return client.get("/health/ready")
+
+    modes = {
+        "probe per request": per_request,
+        "snapshot": lambda: client.get("/health/ready"),
+    }
+    scenarios = {"all healthy": args.delay_ms, "slow db": args.slow_ms}
+    rows = []
+    for scenario, db_delay in scenarios.items():
+        delays["db"] = db_delay / 1000
+        delays["auth"] = args.delay_ms / 1000
+        # Let a background round see the new delays first.
+        time.sleep(args.interval + args.timeout)
+        for mode, fn in modes.items():
+            # The slow db's hung checks make long runs of the first mode slow.
+            iterations = args.iterations if db_delay < 1000 else 10
+            status = fn().status_code
+            before = calls["count"]
+            samples = timed(fn, iterations, warmup=0)
+            stats = summarize(samples)
+            rows.append(
+                {
+                    "scenario": scenario,
+                    "mode": mode,
+                    "status": status,
+                    "probes": iterations,
+                    "downstream_calls": calls["count"] - before,
+                    "p50_ms": stats["p50_ms"],
+                    "p99_ms": stats["p99_ms"],
+                }
+            )
+
+    print_table(
+        f"post_service /health/ready ({args.delay_ms:.0f}ms per dependency check, "
+        f"{args.timeout * 1000:.0f}ms probe timeout)",
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
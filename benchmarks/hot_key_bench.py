@@ -0,0 +1,143 @@
+"""db_service calls and post read latency when one post is hot.
+
+Seeds a throwaway ``database.db``, boots db_service as a process on its
+default port and runs post_service in process. ``--clients`` threads then
+read ``GET /<post_id>`` from post_service back to back for ``--duration``
+seconds. ``--hot-share`` of the reads ask for post 1 and the rest pick a
+post at random. It runs once for each way post_service can read posts:
+
+* ``uncoalesced``: every read calls db_service, as before single-flight.
+* ``single-flight``: concurrent reads of a post share one call.
+* ``single-flight + cache``: results are also kept for ``--ttl`` seconds.
+
+``db_calls`` counts the calls post_service made to db_service.
+
+    python -m benchmarks.hot_key_bench [--clients 32] [--hot-share 0.9]
+"""
+
+import argparse
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+import bulk_load
+from benchmarks.load_bench import SERVICES, wait_healthy
+from benchmarks.support import ROOT, load_service, print_table, serve, summarize
+from common import singleflight
+from common.cache import LRUCache
+
+
+class Uncoalesced:
+    def do(self, key, fn):
+        return fn()
+
+    def forget(self, key):
+        pass
+
+
+def drive(url, clients, duration, hot_share, posts, seed):
+    samples = []
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+
+    def client(index):
+        rng = random.Random(seed + index)
+        session = requests.Session()
+        local = []
+        while time.perf_counter() < stop:
+            post_id = 1 if rng.random() < hot_share else rng.randint(1, posts)
+            start = time.perf_counter()
+            session.get(f"{url}/{post_id}").raise_for_status()
+            local.append(time.perf_counter() - start)
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--hot-share", type=float, default=0.9)
+    parser.add_argument("--ttl", type=float, default=0.5)
+    parser.add_argument("--posts", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    modes = {
+        "uncoalesced": lambda: Uncoalesced(),
+        "single-flight": lambda: singleflight.Group("post"),
+        "single-flight + cache": lambda: singleflight.Group(
+            "post",
+            cache=LRUCache(1000, ttl=args.ttl),
+            cacheable=lambda response: response.status_code == 200,
+        ),
+    }
+    rows = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        bulk_load.load(data_dir, users=100, posts=args.posts, comments=0)
+        port, command, _ = SERVICES["db"]
+        db = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, command[0])],
+            cwd=data_dir,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_healthy({"db": db})
+            os.environ["DB_SERVICE_URL"] = f"http://localhost:{port}"
+            post_service = load_service("post_service")
+            # One span per read would dominate the run.
+            logging.getLogger("trace").setLevel(logging.WARNING)
+            url, server = serve(post_service.app)
+            for mode, group in modes.items():
+                post_service.post_reads = group()
+                before = post_service.db_client.stats()["requests"]
+                samples = drive(
+                    url,
+                    args.clients,
+                    args.duration,
+                    args.hot_share,
+                    args.posts,
+                    args.seed,
+                )
+                db_calls = post_service.db_client.stats()["requests"] - before
+                stats = summarize(samples)
+                rows.append(
+                    {
+                        "mode": mode,
+                        "reads": stats["n"],
+                        "reads_per_s": round(stats["n"] / args.duration, 1),
+                        "db_calls": db_calls,
+                        "db_calls_per_read": round(db_calls / stats["n"], 3),
+                        "p50_ms": stats["p50_ms"],
+                        "p99_ms": stats["p99_ms"],
+                    }
+                )
+            server.shutdown()
+        finally:
+            db.terminate()
+            db.wait()
+
+    print_table(
+        f"{args.clients} clients, {args.hot_share:.0%} of reads on one post, "
+        f"{args.duration}s per mode",
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
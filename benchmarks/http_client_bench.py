@@ -0,0 +1,108 @@
+"""Gateway latency for ``/`` and ``/<post_id>`` with and without pooling.
+
+Stub post, comment and template services are served locally so only the
+cost of the inter-service hops is measured. The "unpooled" run replaces
+the shared client's session with a fresh ``requests`` call per hop, which
+is what the gateway did before ``common.http_client`` existed.
+
+    python -m benchmarks.http_client_bench [--iterations 500]
+"""
+
+import argparse
+import os
+
+import requests
+from flask import Flask, jsonify
+
+from benchmarks.support import print_table, serve, summarize, timed
+
+
+def stub_services():
+    posts = Flask("post_stub")
+
+    @posts.route("/")
+    def index():
+        return jsonify(
+            {
+                "posts": [{"id": i, "title": f"Post {i}"} for i in range(10)],
+                "next_cursor": 9,
+                "prev_cursor": None,
+            }
+        )
+
+    @posts.route("/<int:post_id>")
+    def post(post_id):
+        return jsonify({"id": post_id, "title": "Post", "content": "Body"})
+
+    @posts.route("/<int:post_id>/view")
+    def post_view(post_id):
+        return jsonify(
+            {
+                "post": {"id": post_id, "title": "Post", "content": "Body"},
+                "comments": [],
+                "next_cursor": None,
+                "prev_cursor": None,
+                "stats": {"comment_count": 0, "last_comment_at": None},
+                "comments_unavailable": False,
+            }
+        )
+
+    comments = Flask("comment_stub")
+
+    @comments.route("/comments/<int:post_id>")
+    def get_comments(post_id):
+        return jsonify({"comments": [], "next_cursor": None, "prev_cursor": None})
+
+    templates = Flask("template_stub")
+
+    @templates.route("/render", methods=["POST"])
+    def render():
+        return jsonify({"rendered": "<html></html>"})
+
+    return {
+        "POST_SERVICE_URL": serve(posts)[0],
+        "COMMENT_SERVICE_URL": serve(comments)[0],
+        "TEMPLATE_SERVICE_URL": serve(templates)[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    os.environ.update(stub_services())
+    os.environ["PAGE_CACHE_ENABLED"] = "0"
+    import app as gateway
+    from common import http_client
+
+    client = gateway.app.test_client()
+    routes = ["/", "/1"]
+
+    pooled_request = http_client.ServiceClient.request
+
+    def unpooled_request(self, method, path, deadline=None, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return requests.request(method, self.base_url + path, **kwargs)
+
+    rows = []
+    for mode, request_fn in (
+        ("unpooled", unpooled_request),
+        ("pooled", pooled_request),
+    ):
+        http_client.ServiceClient.request = request_fn
+        for route in routes:
+            assert client.get(route).status_code == 200
+            samples = timed(lambda: client.get(route), args.iterations)
+            rows.append({"mode": mode, "route": route, **summarize(samples)})
+    http_client.ServiceClient.request = pooled_request
+
+    print_table("Gateway route latency", rows)
+    print_table(
+        "Pooled connections per target",
+        [{"target": name, **s} for name, s in http_client.stats().items()],
+    )
+
+
+if __name__ == "__main__":
+    main()
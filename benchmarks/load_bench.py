@@ -0,0 +1,377 @@
+"""End-to-end load test of the gateway and the five services.
+
+Seeds a throwaway data directory with ``bulk_load``, boots ``app.py`` and
+every service as separate processes on their default ports (5000-5005),
+then drives a mixed open-loop workload at fixed arrival rates per route:
+index paging, post views, comment posting and logins. Latency is measured
+from each request's scheduled arrival, so queueing inside the stack is not
+hidden when it falls behind.
+
+Reports throughput and p50/p95/p99 per route and CPU seconds per service
+(including child processes, e.g. auth_service's hash workers, from
+``/proc``). ``--output`` saves the results as JSON; ``--baseline`` compares
+against a saved run and exits 1 when a route's p95 or a service's CPU time
+grows, or a route's throughput drops, by more than ``--threshold``.
+
+    python -m benchmarks.load_bench --duration 30 --output run.json
+    python -m benchmarks.load_bench --baseline run.json --threshold 0.25
+"""
+
+import argparse
+import bisect
+import datetime
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import bulk_load
+from benchmarks.support import ROOT, print_table, summarize
+
+# name -> (port, command, run in the data directory)
+SERVICES = {
+    "db": (5001, ["services/db_service/db_service.py"], True),
+    "post": (5002, ["services/post_service/post_service.py"], True),
+    "auth": (5003, ["services/auth_service/auth_service.py"], True),
+    "template": (5004, ["services/template_service/template_service.py"], True),
+    "comment": (5005, ["services/comment_service/comment_service.py"], True),
+    # app.py's __main__ runs the debug reloader, which would fork the server
+    # into a child process; run it plainly instead.
+    "gateway": (
+        5000,
+        ["-c", "from app import app; app.run(port=5000, threaded=True)"],
+        False,
+    ),
+}
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+CURSOR = re.compile(r'href="\?after=(\d+)"')
+
+
+def start_services(data_dir):
+    log = open(os.path.join(data_dir, "services.log"), "w")
+    processes = {}
+    for name, (port, command, in_data_dir) in SERVICES.items():
+        if in_data_dir:
+            command = [os.path.join(ROOT, command[0])]
+        processes[name] = subprocess.Popen(
+            [sys.executable, *command],
+            cwd=data_dir if in_data_dir else ROOT,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    return processes
+
+
+def wait_healthy(processes, timeout=60):
+    deadline = time.monotonic() + timeout
+    pending = dict(processes)
+    while pending:
+        for name, process in list(pending.items()):
+            if process.poll() is not None:
+                raise RuntimeError(f"{name} exited with {process.returncode}")
+            try:
+                port = SERVICES[name][0]
+                if requests.get(f"http://localhost:{port}/health/ready").ok:
+                    del pending[name]
+            except requests.RequestException:
+                pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Not healthy after {timeout}s: {', '.join(pending)}")
+        time.sleep(0.2)
+
+
+def cpu_seconds(pid):
+    """User + system CPU time of ``pid`` and its live descendants."""
+    parents = {}
+    times = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Fields after the parenthesised command name.
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        parents[int(entry)] = int(fields[1])
+        times[int(entry)] = int(fields[11]) + int(fields[12])
+    tree = {pid}
+    changed = True
+    while changed:
+        children = {p for p, parent in parents.items() if parent in tree} - tree
+        tree |= children
+        changed = bool(children)
+    return sum(times.get(p, 0) for p in tree) / CLOCK_TICKS
+
+
+class Workload:
+    """The gateway requests issued per route, each returning ok/not ok."""
+
+    def __init__(self, url, posts, users, seed):
+        self.url = url
+        self.posts = posts
+        self.users = users
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.post_weights = bulk_load.zipf_cum_weights(posts, 1.1)
+        self.local = threading.local()
+        self.tokens = []
+        self.next_cursor = None
+
+    @property
+    def session(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def random(self):
+        with self.rng_lock:
+            return self.rng.random()
+
+    def login(self, username=None):
+        if username is None:
+            username = f"user{int(self.random() * self.users) + 1}"
+        response = self.session.post(
+            f"{self.url}/login",
+            data={"username": username, "password": "password"},
+            allow_redirects=False,
+        )
+        token = response.cookies.get("token")
+        return response.status_code == 302 and token is not None, token
+
+    def index(self):
+        # Walk the pager like a reader would, restarting at the first page.
+        cursor = self.next_cursor if self.random() < 0.8 else None
+        response = self.session.get(
+            f"{self.url}/", params={"after": cursor} if cursor else None
+        )
+        match = CURSOR.search(response.text)
+        self.next_cursor = match.group(1) if match else None
+        return response.status_code == 200
+
+    def post(self):
+        total = self.post_weights[-1]
+        post_id = bisect.bisect(self.post_weights, self.random() * total) + 1
+        return self.session.get(f"{self.url}/{post_id}").status_code == 200
+
+    def comment(self):
+        post_id = int(self.random() * self.posts) + 1
+        token = self.tokens[int(self.random() * len(self.tokens))]
+        response = self.session.post(
+            f"{self.url}/add_comment/{post_id}",
+            data={"content": "Load test comment"},
+            cookies={"token": token},
+            allow_redirects=False,
+        )
+        return response.status_code == 302
+
+    def routes(self):
+        return {
+            "index": self.index,
+            "post": self.post,
+            "comment": self.comment,
+            "login": lambda: self.login()[0],
+        }
+
+
+def drive(workload, rates, duration, concurrency):
+    """Issue each route at its rate for ``duration`` seconds (open loop)."""
+    results = {route: {"samples": [], "errors": 0} for route in rates}
+    lock = threading.Lock()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    routes = workload.routes()
+    start = time.perf_counter()
+
+    def call(route, scheduled):
+        try:
+            ok = routes[route]()
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            if ok:
+                results[route]["samples"].append(elapsed)
+            else:
+                results[route]["errors"] += 1
+
+    def schedule(route, rate):
+        interval = 1.0 / rate
+        scheduled = start
+        while scheduled < start + duration:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(call, route, scheduled)
+            scheduled += interval
+
+    schedulers = [
+        threading.Thread(target=schedule, args=(route, rate))
+        for route, rate in rates.items()
+        if rate > 0
+    ]
+    for t in schedulers:
+        t.start()
+    for t in schedulers:
+        t.join()
+    executor.shutdown(wait=True)
+    elapsed = time.perf_counter() - start
+
+    report = {}
+    for route, result in results.items():
+        stats = summarize(result["samples"])
+        report[route] = {
+            "rate": rates[route],
+            "ok": stats["n"],
+            "errors": result["errors"],
+            "throughput_rps": round(stats["n"] / elapsed, 2),
+            "p50_ms": stats["p50_ms"],
+            "p95_ms": stats["p95_ms"],
+            "p99_ms": stats["p99_ms"],
+        }
+    return report
+
+
+def compare(current, baseline, threshold):
+    """Return (rows, regressed) comparing ``current`` against ``baseline``."""
+    rows = []
+    regressed = False
+
+    def check(name, metric, now, before, higher_is_worse=True):
+        nonlocal regressed
+        if before is None:
+            return
+        change = (now - before) / before if before else 0.0
+        worse = change > threshold if higher_is_worse else change < -threshold
+        regressed |= worse
+        rows.append(
+            {
+                "name": name,
+                "metric": metric,
+                "baseline": before,
+                "current": now,
+                "change": f"{change:+.1%}",
+                "status": "REGRESSED" if worse else "ok",
+            }
+        )
+
+    for route, stats in current["routes"].items():
+        old = baseline["routes"].get(route)
+        if old:
+            check(route, "p95_ms", stats["p95_ms"], old["p95_ms"])
+            check(
+                route,
+                "throughput_rps",
+                stats["throughput_rps"],
+                old["throughput_rps"],
+                higher_is_worse=False,
+            )
+    for service, seconds in current["cpu_seconds"].items():
+        check(service, "cpu_s", seconds, baseline["cpu_seconds"].get(service))
+    return rows, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--index-rate", type=float, default=20.0)
+    parser.add_argument("--post-rate", type=float, default=20.0)
+    parser.add_argument("--comment-rate", type=float, default=2.0)
+    parser.add_argument("--login-rate", type=float, default=1.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=10_000)
+    parser.add_argument("--comments", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args()
+
+    # Everything that shapes the workload; baselines must match it.
+    config = {
+        k: v
+        for k, v in vars(args).items()
+        if k not in ("output", "baseline", "threshold")
+    }
+    rates = {
+        "index": args.index_rate,
+        "post": args.post_rate,
+        "comment": args.comment_rate,
+        "login": args.login_rate,
+    }
+    with tempfile.TemporaryDirectory() as data_dir:
+        bulk_load.load(data_dir, args.users, args.posts, args.comments, args.seed)
+        processes = start_services(data_dir)
+        try:
+            wait_healthy(processes)
+            workload = Workload(
+                f"http://localhost:{SERVICES['gateway'][0]}",
+                args.posts,
+                args.users,
+                args.seed,
+            )
+            for i in range(8):
+                ok, token = workload.login(f"user{i + 1}")
+                if not ok:
+                    raise RuntimeError("Could not log in through the gateway")
+                workload.tokens.append(token)
+            if args.warmup:
+                drive(workload, rates, args.warmup, args.concurrency)
+
+            cpu_before = {n: cpu_seconds(p.pid) for n, p in processes.items()}
+            routes = drive(workload, rates, args.duration, args.concurrency)
+            cpu_after = {n: cpu_seconds(p.pid) for n, p in processes.items()}
+        except Exception:
+            with open(os.path.join(data_dir, "services.log")) as f:
+                sys.stderr.write(f.read()[-4000:])
+            raise
+        finally:
+            for process in processes.values():
+                process.terminate()
+            for process in processes.values():
+                process.wait()
+
+    results = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "config": config,
+        "routes": routes,
+        "cpu_seconds": {
+            name: round(cpu_after[name] - cpu_before[name], 2) for name in processes
+        },
+    }
+    print_table(
+        f"Per route over {args.duration}s",
+        [{"route": route, **stats} for route, stats in routes.items()],
+    )
+    print_table(
+        "CPU seconds per service",
+        [{"service": n, "cpu_s": s} for n, s in results["cpu_seconds"].items()],
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["config"] != config:
+            sys.exit(
+                f"{args.baseline} was run with a different config: {baseline['config']}"
+            )
+        rows, regressed = compare(results, baseline, args.threshold)
+        print_table(f"Against {args.baseline} (threshold {args.threshold:.0%})", rows)
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
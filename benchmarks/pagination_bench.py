@@ -0,0 +1,84 @@
+"""Page fetch latency at increasing depth: keyset cursors vs LIMIT/OFFSET.
+
+Builds a throwaway ``posts`` table with ``bulk_load`` holding ``--rows`` rows
+and fetches one page at several depths with ``common.pagination.fetch_page``
+(what db_service ``GET /posts`` runs) and with the equivalent OFFSET query.
+
+    python -m benchmarks.pagination_bench [--rows 1000000] [--per-page 10]
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+
+import bulk_load
+from benchmarks.support import print_table, summarize, timed
+from common import pagination
+
+
+def build_database(path, rows):
+    for row in bulk_load.load(path, users=1, posts=rows, comments=0):
+        if row["table"] == "posts":
+            print(f"Loaded {rows} rows at {row['rows_per_s']} rows/s")
+    conn = sqlite3.connect(os.path.join(path, "database.db"))
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--per-page", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = build_database(tmp, args.rows)
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM posts WHERE (created, id) < (?, ?) "
+            "ORDER BY created DESC, id DESC LIMIT ?",
+            ("2021-01-01", 1, args.per_page),
+        ).fetchall()
+        print("Keyset plan:", "; ".join(row["detail"] for row in plan))
+
+        depths = [10**i for i in range(len(str(args.rows)) - 1)]
+        depths.append(args.rows - args.per_page)
+        rows = []
+        for depth in depths:
+            offset = depth - 1
+            cursor = conn.execute(
+                "SELECT id FROM posts ORDER BY created DESC, id DESC LIMIT 1 OFFSET ?",
+                (offset,),
+            ).fetchone()["id"]
+
+            keyset = timed(
+                lambda: pagination.fetch_page(
+                    conn, "posts", per_page=args.per_page, after=cursor
+                ),
+                args.iterations,
+                warmup=2,
+            )
+            offset_samples = timed(
+                lambda: conn.execute(
+                    "SELECT * FROM posts ORDER BY created DESC, id DESC "
+                    "LIMIT ? OFFSET ?",
+                    (args.per_page, offset),
+                ).fetchall(),
+                max(1, args.iterations // 10),
+                warmup=1,
+            )
+            rows.append(
+                {
+                    "depth": depth,
+                    "keyset_p50_ms": summarize(keyset)["p50_ms"],
+                    "offset_p50_ms": summarize(offset_samples)["p50_ms"],
+                }
+            )
+        conn.close()
+
+    print_table(f"Page fetch latency ({args.per_page} rows per page)", rows)
+
+
+if __name__ == "__main__":
+    main()
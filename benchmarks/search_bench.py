@@ -0,0 +1,100 @@
+"""Full-text search latency and index build time on a large corpus.
+
+Builds throwaway ``database.db`` and ``comments.db`` files with ``bulk_load``
+(reporting how long the FTS5 rebuild took), then runs
+``common.search.search`` (what the ``/posts/search`` and
+``/comments/search`` endpoints run). Queries use words of increasing
+rarity from the generator's vocabulary, a two-word query and a prefix.
+
+    python -m benchmarks.search_bench [--posts 1000000] [--comments 2000000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+
+import bulk_load
+from benchmarks.support import print_table, summarize, timed
+from common import search
+
+TARGETS = {
+    "posts": dict(
+        fts_table="posts_fts",
+        columns=("id", "created", "title"),
+        snippet_column=1,
+        weights=(10.0, 1.0),
+    ),
+    "comments": dict(
+        fts_table="comments_fts",
+        columns=("id", "post_id", "created", "author"),
+        snippet_column=0,
+    ),
+}
+
+
+def queries(seed):
+    # load() draws the vocabulary first from Random(seed), so this matches.
+    words = bulk_load.vocabulary(random.Random(seed))
+    return {
+        "common word": words[4],
+        "rank 100 word": words[100],
+        "rank 2000 word": words[2000],
+        "rank 15000 word": words[15000],
+        "two words": f"{words[100]} {words[300]}",
+        "prefix": words[500][:3] + "*",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=1_000_000)
+    parser.add_argument("--comments", type=int, default=2_000_000)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stats = bulk_load.load(
+            tmp, users=1000, posts=args.posts, comments=args.comments, seed=args.seed
+        )
+        print_table("Load", [row for row in stats if row["table"] != "users"])
+
+        rows = []
+        for table, options in TARGETS.items():
+            filename = bulk_load.DATABASES[table][0]
+            conn = sqlite3.connect(os.path.join(tmp, filename))
+            conn.row_factory = sqlite3.Row
+            for label, text in queries(args.seed).items():
+                matches = conn.execute(
+                    f"SELECT count(*) FROM {options['fts_table']} "
+                    f"WHERE {options['fts_table']} MATCH ?",
+                    (search.match_query(text),),
+                ).fetchone()[0]
+                for page in (1, 10):
+                    samples = timed(
+                        lambda: search.search(
+                            conn, table, text=text, page=page, **options
+                        ),
+                        args.iterations,
+                        warmup=2,
+                    )
+                    summary = summarize(samples)
+                    rows.append(
+                        {
+                            "table": table,
+                            "query": f"{label} ({text})",
+                            "matches": matches,
+                            "page": page,
+                            "p50_ms": summary["p50_ms"],
+                            "p99_ms": summary["p99_ms"],
+                        }
+                    )
+            conn.close()
+
+    print_table(f"Search over {args.posts} posts / {args.comments} comments", rows)
+
+
+if __name__ == "__main__":
+    main()
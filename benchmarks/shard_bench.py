@@ -0,0 +1,126 @@
+"""Post insert throughput against the number of shards.
+
+Writer threads insert posts for a fixed duration the way db_service's
+``POST /posts`` does: an id from the shard set's ``IdAllocator``, then a
+commit on the shard that id routes to. Every shard is a fresh file built
+from ``schema.sql``, so each insert also updates its shard's full-text
+index. Each shard count runs with the service default ``synchronous=NORMAL``
+and with ``FULL``, where every commit waits for an fsync while holding its
+file's write lock.
+
+``--processes`` splits the writers across that many processes sharing the
+same files and id counter, as several db_service workers would, so the
+result is not bounded by one interpreter. ``cpu_busy`` is the share of the
+machine's CPUs the writers kept busy: near 1.0 the inserts are CPU-bound
+and more shards cannot help, since shards only remove waiting on a file's
+write lock.
+
+    python -m benchmarks.shard_bench [--shards 1,2,4,8] [--writers 16]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.group_commit_bench import run
+from benchmarks.support import ROOT, print_table, summarize
+from common import sharding
+
+INSERT = "INSERT INTO posts (id, title, content) VALUES (?, ?, ?)"
+CPUS = os.cpu_count() or 1
+CONTENT = "A post body of a few sentences about running services. " * 20
+
+
+def build_shards(path, count):
+    for index, shard in enumerate(sharding.shard_paths(path, count)):
+        conn = sqlite3.connect(shard)
+        with open(os.path.join(ROOT, "schema.sql")) as f:
+            conn.executescript(f.read())
+        conn.execute("UPDATE shard_layout SET shard = ?, count = ?", (index, count))
+        conn.commit()
+        conn.close()
+
+
+def writer(args):
+    path, count, synchronous, writers, duration = args
+    shards = sharding.ShardSet(
+        path, count, "posts", size=writers + 1, synchronous=synchronous
+    )
+    shards.check_layout()
+
+    def insert(params):
+        post_id = shards.new_id()
+        with shards.connection(post_id) as conn:
+            return conn.execute(
+                INSERT, (post_id, f"A post by {params[2]}", CONTENT)
+            ).lastrowid
+
+    start = time.process_time()
+    samples = run(insert, writers, duration)
+    return samples, time.process_time() - start
+
+
+def measure(path, count, synchronous, writers, processes, duration):
+    """Return insert latencies and the CPU seconds the writers used."""
+    if processes == 1:
+        return writer((path, count, synchronous, writers, duration))
+    jobs = [(path, count, synchronous, writers // processes, duration)] * processes
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        results = pool.map(writer, jobs)
+    return (
+        [sample for samples, _ in results for sample in samples],
+        sum(cpu for _, cpu in results),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", default="1,2,4,8")
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    table = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for synchronous in ("NORMAL", "FULL"):
+            baseline = None
+            for count in [int(n) for n in args.shards.split(",")]:
+                path = os.path.join(tmp, f"{synchronous}-{count}", "database.db")
+                os.makedirs(os.path.dirname(path))
+                build_shards(path, count)
+                samples, cpu = measure(
+                    path,
+                    count,
+                    synchronous,
+                    args.writers,
+                    args.processes,
+                    args.duration,
+                )
+                rate = len(samples) / args.duration
+                baseline = baseline or rate
+                stats = summarize(samples)
+                table.append(
+                    {
+                        "synchronous": synchronous,
+                        "shards": count,
+                        "posts_per_s": round(rate, 1),
+                        "speedup": round(rate / baseline, 2),
+                        "p50_ms": stats["p50_ms"],
+                        "p99_ms": stats["p99_ms"],
+                        "cpu_busy": round(cpu / (args.duration * CPUS), 2),
+                    }
+                )
+
+    print_table(
+        f"{args.writers} writers in {args.processes} process(es) for "
+        f"{args.duration}s on {CPUS} CPU(s)",
+        table,
+    )
+
+
+if __name__ == "__main__":
+    main()
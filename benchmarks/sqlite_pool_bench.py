@@ -0,0 +1,141 @@
+"""Concurrent read/write throughput: connection per request vs pooled WAL.
+
+Reader threads fetch a listing page and a post by id while writer threads
+insert posts, for a fixed duration, against a ``posts`` table built from
+``schema.sql``. The "per-request" mode opens a fresh rollback-journal
+connection per operation, as the services did before ``common.db``.
+
+    python -m benchmarks.sqlite_pool_bench [--readers 8] [--writers 2]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from benchmarks.support import ROOT, print_table, summarize
+from common import db, pagination
+
+
+def build_database(path, rows):
+    conn = sqlite3.connect(path)
+    with open(os.path.join(ROOT, "schema.sql")) as f:
+        conn.executescript(f.read())
+    conn.executemany(
+        "INSERT INTO posts (title, content) VALUES (?, ?)",
+        ((f"Post {i}", "x" * 500) for i in range(rows)),
+    )
+    conn.commit()
+    conn.close()
+
+
+class PerRequestConnection:
+    def __init__(self, path):
+        self.path = path
+
+    def connection(self):
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        return _Closing(conn)
+
+
+class _Closing:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        with self.conn:
+            pass
+        self.conn.close()
+        return False
+
+
+def run(source, rows, readers, writers, duration):
+    samples = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def read():
+        with source.connection() as conn:
+            pagination.fetch_page(conn, "posts")
+            conn.execute(
+                "SELECT * FROM posts WHERE id = ?", (random.randint(1, rows),)
+            ).fetchone()
+
+    def write():
+        with source.connection() as conn:
+            conn.execute(
+                "INSERT INTO posts (title, content) VALUES (?, ?)", ("New", "y" * 500)
+            )
+
+    def worker(kind, op):
+        local, failed = [], 0
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            try:
+                op()
+                local.append(time.perf_counter() - start)
+            except sqlite3.OperationalError:
+                failed += 1
+        with lock:
+            samples[kind].extend(local)
+            errors[kind] += failed
+
+    threads = [
+        threading.Thread(target=worker, args=("read", read)) for _ in range(readers)
+    ] + [threading.Thread(target=worker, args=("write", write)) for _ in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    table = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("per-request", "pooled WAL"):
+            path = os.path.join(tmp, f"{mode.replace(' ', '-')}.db")
+            build_database(path, args.rows)
+            if mode == "per-request":
+                source = PerRequestConnection(path)
+            else:
+                source = db.ConnectionPool(path, size=args.readers + args.writers)
+            samples, errors = run(
+                source, args.rows, args.readers, args.writers, args.duration
+            )
+            for kind in ("read", "write"):
+                stats = summarize(samples[kind])
+                table.append(
+                    {
+                        "mode": mode,
+                        "op": kind,
+                        "ops_per_s": round(len(samples[kind]) / args.duration, 1),
+                        "errors": errors[kind],
+                        "p50_ms": stats["p50_ms"],
+                        "p99_ms": stats["p99_ms"],
+                    }
+                )
+
+    print_table(
+        f"{args.readers} readers / {args.writers} writers for {args.duration}s",
+        table,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Peak memory and time to first byte of full-table listings.
+
+Seeds a throwaway ``database.db`` with ``bulk_load`` and boots db_service
+and post_service as separate processes. Then it fetches every post in
+these ways:
+
+* ``ndjson``: ``GET /posts/export``, streamed in keyset batches.
+* ``ndjson via post``: ``GET /export`` on post_service, relayed byte for
+  byte with ``streaming.passthrough``.
+* ``buffered`` and ``buffered via post``: the earlier pattern. db_service
+  builds a list of dicts and ``jsonify``s it; post_service calls
+  ``response.json()`` and ``jsonify``s it again. The bench adds these
+  routes to the processes it starts; the services do not ship them.
+
+For each it reports time to first byte, total time, bytes, and how far the
+request raised each process's peak RSS. Peak RSS comes from ``VmHWM`` in
+``/proc``, which is reset before every request.
+
+    python -m benchmarks.stream_bench [--posts 200000]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+import bulk_load
+from benchmarks.support import ROOT, print_table
+
+PORTS = {"db": 5001, "post": 5002}
+# Streamed modes go first: memory freed after a buffered run stays in the
+# process and would hide what a later streamed run allocates.
+MODES = {
+    "ndjson": ("db", "/posts/export"),
+    "ndjson via post": ("post", "/export"),
+    "buffered": ("db", "/posts/export-buffered"),
+    "buffered via post": ("post", "/export-buffered"),
+}
+
+
+def serve(name):
+    """Run a service with the buffered baseline route added (child process)."""
+    from flask import jsonify
+
+    from benchmarks.support import load_service
+
+    service = load_service(f"{name}_service")
+    if name == "db":
+
+        def export_buffered():
+            with service.get_db_connection() as conn:
+                rows = conn.execute(
+                    "SELECT * FROM posts ORDER BY created DESC, id DESC"
+                ).fetchall()
+            return jsonify({"posts": [dict(row) for row in rows]})
+
+        service.app.add_url_rule("/posts/export-buffered", view_func=export_buffered)
+    else:
+
+        def export_buffered():
+            response = service.db_client.get("/posts/export-buffered")
+            response.raise_for_status()
+            return jsonify(response.json())
+
+        service.app.add_url_rule("/export-buffered", view_func=export_buffered)
+    service.app.run(port=PORTS[name], threaded=True)
+
+
+def start(data_dir):
+    log = open(os.path.join(data_dir, "services.log"), "w")
+    processes = {
+        name: subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.stream_bench", "--serve", name],
+            cwd=ROOT,
+            env={**os.environ, "PYTHONPATH": ROOT, "STREAM_BENCH_DATA": data_dir},
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        for name in PORTS
+    }
+    deadline = time.monotonic() + 60
+    for name, process in processes.items():
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"{name} exited with {process.returncode}")
+            try:
+                requests.get(
+                    f"http://localhost:{PORTS[name]}/metrics"
+                ).raise_for_status()
+                break
+            except requests.RequestException:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{name} did not start")
+                time.sleep(0.2)
+    return processes
+
+
+def memory_kib(pid, field):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def reset_peak(pid):
+    # Writing 5 to clear_refs resets VmHWM to the current RSS.
+    with open(f"/proc/{pid}/clear_refs", "w") as f:
+        f.write("5")
+
+
+def fetch(url):
+    start = time.perf_counter()
+    first = None
+    size = 0
+    with requests.get(url, stream=True) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=None):
+            if first is None:
+                first = time.perf_counter() - start
+            size += len(chunk)
+    return first, time.perf_counter() - start, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--serve", choices=sorted(PORTS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        os.chdir(os.environ["STREAM_BENCH_DATA"])
+        serve(args.serve)
+        return
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        bulk_load.load(tmp, users=100, posts=args.posts, comments=0)
+        processes = start(tmp)
+        try:
+            for mode, (service, path) in MODES.items():
+                runs = []
+                for _ in range(args.repeat):
+                    base = {}
+                    for process in processes.values():
+                        reset_peak(process.pid)
+                        base[process.pid] = memory_kib(process.pid, "VmRSS")
+                    ttfb, total, size = fetch(
+                        f"http://localhost:{PORTS[service]}{path}"
+                    )
+                    peak = {
+                        name: memory_kib(p.pid, "VmHWM") - base[p.pid]
+                        for name, p in processes.items()
+                    }
+                    runs.append((ttfb, total, size, peak))
+                ttfb, total, size, peak = sorted(runs, key=lambda run: run[1])[
+                    len(runs) // 2
+                ]
+                rows.append(
+                    {
+                        "mode": mode,
+                        "ttfb_ms": round(ttfb * 1000, 1),
+                        "total_ms": round(total * 1000, 1),
+                        "mib": round(size / 2**20, 1),
+                        "db_peak_mib": round(peak["db"] / 1024, 1),
+                        "post_peak_mib": round(peak["post"] / 1024, 1)
+                        if service == "post"
+                        else "-",
+                    }
+                )
+        finally:
+            for process in processes.values():
+                process.terminate()
+                process.wait()
+
+    print_table(f"Listing all {args.posts} posts (median of {args.repeat})", rows)
+
+
+if __name__ == "__main__":
+    main()
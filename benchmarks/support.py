@@ -0,0 +1,97 @@
+"""Helpers shared by the benchmark scripts.
+
+Benchmarks are run from the repository root as modules, e.g.
+``python -m benchmarks.http_client_bench``.
+"""
+
+import importlib
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+# Request logging from the stub servers would dominate the timings.
+logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_service(name):
+    """Import ``services/<name>/<name>.py`` as a module."""
+    path = os.path.join(ROOT, "services", name)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return importlib.import_module(name)
+
+
+def serve(wsgi_app, port=0):
+    """Serve ``wsgi_app`` on a background thread and return (url, server)."""
+    server = make_server("127.0.0.1", port, wsgi_app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Summarize latencies given in seconds as milliseconds."""
+    return {
+        "n": len(samples),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def timed(fn, iterations, warmup=10):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_concurrently(fn, threads, iterations):
+    """Call ``fn`` ``iterations`` times on each of ``threads`` threads."""
+    samples = []
+    lock = threading.Lock()
+
+    def worker():
+        local = timed(fn, iterations, warmup=0)
+        with lock:
+            samples.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return samples, time.perf_counter() - start
+
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    widths = [max(len(str(c)), *(len(str(r[c])) for r in rows)) for c in columns]
+    print("  ".join(str(c).ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(w) for c, w in zip(columns, widths)))
@@ -0,0 +1,121 @@
+"""template_service cold-start first render and steady-state renders/s.
+
+Cold start is measured in fresh interpreter processes with and without
+boot-time warmup and with an empty or pre-populated bytecode cache.
+Steady state renders ``post.html`` in-process with hot reload off
+(production) and on (development).
+
+    python -m benchmarks.template_bench [--iterations 2000]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.support import ROOT, load_service, print_table
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {service_dir!r})
+import template_service
+imported = time.perf_counter()
+if template_service.WARMUP:
+    template_service.warmup_thread.join()
+ready = time.perf_counter()
+client = template_service.app.test_client()
+render_start = time.perf_counter()
+response = client.post("/render", json={{"template": "post.html", "context": {context!r}}})
+assert response.status_code == 200, response.get_data(as_text=True)
+done = time.perf_counter()
+print(json.dumps({{
+    "import_ms": round((imported - start) * 1000, 2),
+    "ready_ms": round((ready - start) * 1000, 2),
+    "first_render_ms": round((done - render_start) * 1000, 2),
+}}))
+"""
+
+
+def post_context(comments=10):
+    return {
+        "post": {"id": 1, "title": "Post", "created": "2024-01-01", "content": "x"},
+        "comments": [
+            {"id": i, "author": "a", "created": "2024-01-01", "content": "c" * 80}
+            for i in range(comments)
+        ],
+        "next_cursor": 10,
+        "prev_cursor": None,
+    }
+
+
+def cold_start(warmup, cache_dir):
+    code = CHILD.format(
+        service_dir=os.path.join(ROOT, "services", "template_service"),
+        context=post_context(),
+    )
+    env = dict(
+        os.environ,
+        TEMPLATE_WARMUP="1" if warmup else "0",
+        TEMPLATE_CACHE_DIR=cache_dir,
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for warmup in (False, True):
+            for bytecode in ("empty", "populated"):
+                cache_dir = os.path.join(tmp, f"{warmup}-{bytecode}")
+                os.makedirs(cache_dir)
+                if bytecode == "populated":
+                    cold_start(True, cache_dir)
+                rows.append(
+                    {
+                        "warmup": warmup,
+                        "bytecode_cache": bytecode,
+                        **cold_start(warmup, cache_dir),
+                    }
+                )
+    print_table("Cold start (fresh process)", rows)
+
+    template_service = load_service("template_service")
+    template_service.warmup_thread.join()
+    client = template_service.app.test_client()
+    payload = {"template": "post.html", "context": post_context()}
+
+    rows = []
+    for hot_reload in (False, True):
+        template_service.HOT_RELOAD = hot_reload
+        template_service.app.jinja_env.auto_reload = hot_reload
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            client.post("/render", json=payload)
+        elapsed = time.perf_counter() - start
+        rows.append(
+            {
+                "hot_reload": hot_reload,
+                "renders_per_s": round(args.iterations / elapsed, 1),
+                "mean_ms": round(elapsed * 1000 / args.iterations, 3),
+            }
+        )
+    print_table("Steady state /render of post.html", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""post_service write throughput with local vs remote token verification.
+
+auth_service is served locally and db_service is stubbed, so the runs
+differ only in how ``validate_token`` checks the token: a ``/validate``
+round trip per write, or in-process HS256 verification with the
+verified-token cache.
+
+    python -m benchmarks.token_bench [--threads 8] [--iterations 200]
+"""
+
+import argparse
+import datetime
+import os
+
+import jwt
+from flask import Flask, jsonify
+
+from benchmarks.support import (
+    load_service,
+    print_table,
+    run_concurrently,
+    serve,
+    summarize,
+)
+
+
+def stub_db_service():
+    db = Flask("db_stub")
+
+    @db.route("/posts", methods=["POST"])
+    def create_post():
+        return jsonify({"id": 1, "message": "Post created successfully"}), 201
+
+    return serve(db)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    auth_service = load_service("auth_service")
+    os.environ["AUTH_SERVICE_URL"] = serve(auth_service.app)[0]
+    os.environ["DB_SERVICE_URL"] = stub_db_service()
+    post_service = load_service("post_service")
+    from common import tokens
+
+    token = jwt.encode(
+        {
+            "user_id": 1,
+            "username": "bench",
+            "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1),
+        },
+        auth_service.app.config["SECRET_KEY"],
+        algorithm="HS256",
+    )
+    payload = {"title": "Benchmark", "content": "Body", "token": token}
+
+    def create():
+        client = post_service.app.test_client()
+        response = client.post("/create", json=payload)
+        assert response.status_code == 201, response.get_data(as_text=True)
+
+    rows = []
+    for mode in ("remote", "local"):
+        post_service.token_verifier = tokens.TokenVerifier(
+            post_service.auth_client, mode=mode
+        )
+        samples, elapsed = run_concurrently(create, args.threads, args.iterations)
+        rows.append(
+            {
+                "mode": mode,
+                "writes_per_s": round(len(samples) / elapsed, 1),
+                **summarize(samples),
+            }
+        )
+
+    print_table("post_service /create", rows)
+    print_table("Verified-token cache", [post_service.token_verifier.cache.stats()])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Inter-service payload encoding: JSON vs MessagePack, and raw HTML.
+
+The micro-benchmark encodes and decodes the payloads that cross the
+busiest hops, built from ``bulk_load`` text:
+
+* the ``index.html`` render context (gateway -> template_service)
+* a post view with its comments (post_service -> gateway)
+* the rendered page coming back, wrapped in ``{"rendered": ...}`` (JSON,
+  MessagePack) or as the raw ``text/html`` body
+
+``--e2e`` also boots the whole stack (as ``load_bench`` does) once per
+``INTERNAL_WIRE_FORMAT``. It drives index and post pages with the gateway
+page cache off, so every request renders, and reports latency and CPU
+seconds per service.
+
+    python -m benchmarks.wire_bench
+    python -m benchmarks.wire_bench --e2e --duration 20
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+
+import bulk_load
+from benchmarks import load_bench
+from benchmarks.support import load_service, print_table, summarize, timed
+from common import wire
+
+
+def payloads(seed=0):
+    rng = random.Random(seed)
+    text = bulk_load.TextSource(rng)
+    posts = [
+        {
+            "id": 1000 - i,
+            "created": bulk_load.timestamp(bulk_load.START_TIME + i * 3600),
+            "title": text.take(40, 0.4, 200),
+            "content": text.take(1500),
+            "comment_count": rng.randint(0, 200),
+            "last_comment_at": bulk_load.timestamp(bulk_load.START_TIME),
+        }
+        for i in range(10)
+    ]
+    context = {"posts": posts, "next_cursor": 990, "prev_cursor": None}
+    view = {
+        "post": posts[0],
+        "comments": [
+            {
+                "id": i,
+                "post_id": posts[0]["id"],
+                "created": bulk_load.timestamp(bulk_load.START_TIME + i),
+                "author": f"user{i}",
+                "content": text.take(200),
+            }
+            for i in range(10)
+        ],
+        "next_cursor": 10,
+        "prev_cursor": None,
+        "stats": {"comment_count": 120, "last_comment_at": None},
+        "comments_unavailable": False,
+    }
+    template_service = load_service("template_service")
+    with template_service.app.test_request_context():
+        html = template_service.render_template("index.html", **context)
+    return {
+        "render context": {"template": "index.html", "context": context},
+        "post view": view,
+        "rendered page": {"rendered": html},
+    }
+
+
+def micro(iterations):
+    rows = []
+    for name, obj in payloads().items():
+        encoded = {"json": json.dumps(obj).encode(), "msgpack": wire.packb(obj)}
+        codecs = {
+            "json": (
+                lambda: json.dumps(obj).encode(),
+                lambda: json.loads(encoded["json"]),
+            ),
+            "msgpack": (
+                lambda: wire.packb(obj),
+                lambda: wire.unpackb(encoded["msgpack"]),
+            ),
+        }
+        if name == "rendered page":
+            html = obj["rendered"]
+            encoded["raw html"] = html.encode()
+            codecs["raw html"] = (
+                lambda: html.encode(),
+                lambda: encoded["raw html"].decode(),
+            )
+        for codec, (encode, decode) in codecs.items():
+            rows.append(
+                {
+                    "payload": name,
+                    "codec": codec,
+                    "bytes": len(encoded[codec]),
+                    "encode_us": round(
+                        summarize(timed(encode, iterations))["p50_ms"] * 1000, 1
+                    ),
+                    "decode_us": round(
+                        summarize(timed(decode, iterations))["p50_ms"] * 1000, 1
+                    ),
+                }
+            )
+    print_table(f"Serialization (p50 of {iterations})", rows)
+
+
+def e2e(args):
+    rates = {"index": args.rate, "post": args.rate, "comment": 0, "login": 0}
+    results = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        bulk_load.load(data_dir, args.users, args.posts, args.comments, args.seed)
+        for fmt in ("json", "msgpack"):
+            os.environ.update(INTERNAL_WIRE_FORMAT=fmt, PAGE_CACHE_ENABLED="0")
+            processes = load_bench.start_services(data_dir)
+            try:
+                load_bench.wait_healthy(processes)
+                workload = load_bench.Workload(
+                    f"http://localhost:{load_bench.SERVICES['gateway'][0]}",
+                    args.posts,
+                    args.users,
+                    args.seed,
+                )
+                load_bench.drive(workload, rates, args.warmup, args.concurrency)
+                before = {
+                    n: load_bench.cpu_seconds(p.pid) for n, p in processes.items()
+                }
+                routes = load_bench.drive(
+                    workload, rates, args.duration, args.concurrency
+                )
+                after = {n: load_bench.cpu_seconds(p.pid) for n, p in processes.items()}
+            except Exception:
+                with open(os.path.join(data_dir, "services.log")) as f:
+                    sys.stderr.write(f.read()[-4000:])
+                raise
+            finally:
+                for process in processes.values():
+                    process.terminate()
+                for process in processes.values():
+                    process.wait()
+            for route in ("index", "post"):
+                stats = routes[route]
+                results.append(
+                    {
+                        "format": fmt,
+                        "route": route,
+                        "ok": stats["ok"],
+                        "errors": stats["errors"],
+                        "p50_ms": stats["p50_ms"],
+                        "p95_ms": stats["p95_ms"],
+                    }
+                )
+            cpu = {n: round(after[n] - before[n], 2) for n in processes}
+            results.append(
+                {
+                    "format": fmt,
+                    "route": "cpu_s",
+                    "ok": " ".join(f"{n}={s}" for n, s in cpu.items()),
+                    "errors": "",
+                    "p50_ms": "",
+                    "p95_ms": "",
+                }
+            )
+    print_table(
+        f"{args.rate}/s each of index and post pages for {args.duration}s, "
+        "page cache off",
+        results,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--e2e", action="store_true", help="also run the full stack")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--rate", type=float, default=15.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--comments", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    micro(args.iterations)
+    if args.e2e:
+        e2e(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+DROP TABLE IF EXISTS comments_fts;
+DROP TABLE IF EXISTS comments;
+
+CREATE TABLE comments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    post_id INTEGER NOT NULL,
+    created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    author TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+
+CREATE INDEX idx_comments_post_created_id ON comments (post_id, created, id);
+
+-- Per-post comment stats, kept current by the triggers below so readers
+-- never have to COUNT(*) the comments of a post. version changes with every
+-- comment added or removed, so it validates a post's comment listing.
+DROP TABLE IF EXISTS post_stats;
+
+CREATE TABLE post_stats (
+    post_id INTEGER PRIMARY KEY,
+    comment_count INTEGER NOT NULL DEFAULT 0,
+    last_comment_at TIMESTAMP,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER comments_stats_insert AFTER INSERT ON comments
+BEGIN
+    INSERT INTO post_stats (post_id, comment_count, last_comment_at, version)
+    VALUES (NEW.post_id, 1, NEW.created, 1)
+    ON CONFLICT (post_id) DO UPDATE SET
+        comment_count = comment_count + 1,
+        version = version + 1,
+        last_comment_at = MAX(COALESCE(last_comment_at, ''), excluded.last_comment_at);
+END;
+
+CREATE TRIGGER comments_stats_delete AFTER DELETE ON comments
+BEGIN
+    UPDATE post_stats SET
+        comment_count = comment_count - 1,
+        version = version + 1,
+        last_comment_at = (
+            SELECT MAX(created) FROM comments WHERE post_id = OLD.post_id
+        )
+    WHERE post_id = OLD.post_id;
+END;
+
+-- Full-text index over comment content (external content, see schema.sql).
+CREATE VIRTUAL TABLE comments_fts USING fts5(
+    content, content='comments', content_rowid='id',
+    tokenize='porter unicode61', prefix='2 3'
+);
+
+CREATE TRIGGER comments_fts_insert AFTER INSERT ON comments
+BEGIN
+    INSERT INTO comments_fts (rowid, content) VALUES (NEW.id, NEW.content);
+END;
+
+CREATE TRIGGER comments_fts_delete AFTER DELETE ON comments
+BEGIN
+    INSERT INTO comments_fts (comments_fts, rowid, content)
+    VALUES ('delete', OLD.id, OLD.content);
+END;
@@ -0,0 +1,140 @@
+"""Static files served from memory under content-hashed names.
+
+Every file under the static directory is read once at startup, hashed and,
+when it is a compressible type, compressed with each available encoding at
+the highest level, since that cost is paid once per process rather than per
+request. ``css/style.css`` is then served as ``css/style.<hash>.css`` with
+``Cache-Control: immutable`` and a one-year lifetime: an edit changes the
+name, so browsers never need to revalidate. The plain name still works,
+revalidated through its ETag, and so does a fingerprint this process does
+not know (a page rendered against another release), which gets the current
+file with a short lifetime.
+
+Pages link to assets through the fingerprinted URL from ``url(name)``;
+template_service computes the same names with ``fingerprints()`` from its
+own copy of the directory.
+"""
+
+import hashlib
+import mimetypes
+import os
+
+from flask import Response, request
+
+from common import compression
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+UNKNOWN_VERSION = "public, max-age=60"
+DIGEST_LENGTH = 10
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=DIGEST_LENGTH // 2).hexdigest()
+
+
+def _fingerprinted(name, digest):
+    root, ext = os.path.splitext(name)
+    return f"{root}.{digest}{ext}"
+
+
+def _walk(root):
+    for directory, _, files in os.walk(root):
+        for filename in sorted(files):
+            path = os.path.join(directory, filename)
+            yield os.path.relpath(path, root).replace(os.sep, "/"), path
+
+
+def fingerprints(root):
+    """``{name: fingerprinted name}`` for every file under ``root``."""
+    result = {}
+    for name, path in _walk(root):
+        with open(path, "rb") as f:
+            result[name] = _fingerprinted(name, _digest(f.read()))
+    return result
+
+
+class _Asset:
+    __slots__ = ("name", "digest", "mimetype", "bodies")
+
+    def __init__(self, name, data):
+        self.name = name
+        self.digest = _digest(data)
+        self.mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.bodies = {None: data}
+        if self.mimetype in compression.COMPRESSIBLE_TYPES:
+            for encoding in compression.ENCODINGS:
+                body = compression.compress(
+                    data, encoding, 9 if encoding == "gzip" else 11
+                )
+                if len(body) < len(data):
+                    self.bodies[encoding] = body
+
+
+class AssetStore:
+    def __init__(self, root, prefix="/static/"):
+        self.root = root
+        self.prefix = prefix
+        self._by_name = {}
+        self._by_fingerprint = {}
+        for name, path in _walk(root) if os.path.isdir(root) else ():
+            with open(path, "rb") as f:
+                asset = _Asset(name, f.read())
+            self._by_name[name] = asset
+            self._by_fingerprint[_fingerprinted(name, asset.digest)] = asset
+
+    def url(self, name):
+        """The fingerprinted URL of ``name``, or its plain URL if unknown."""
+        asset = self._by_name.get(name)
+        if asset is None:
+            return self.prefix + name
+        return self.prefix + _fingerprinted(name, asset.digest)
+
+    def _lookup(self, filename):
+        asset = self._by_fingerprint.get(filename)
+        if asset is not None:
+            return asset, IMMUTABLE
+        asset = self._by_name.get(filename)
+        if asset is not None:
+            return asset, REVALIDATE
+        # name.<other hash>.ext: serve what this process has.
+        root, ext = os.path.splitext(filename)
+        base, _, digest = root.rpartition(".")
+        if base and len(digest) == DIGEST_LENGTH:
+            asset = self._by_name.get(base + ext)
+            if asset is not None:
+                return asset, UNKNOWN_VERSION
+        return None, None
+
+    def response(self, filename):
+        """The response for ``/static/<filename>``, or None if unknown."""
+        asset, cache_control = self._lookup(filename)
+        if asset is None:
+            return None
+        encoding = compression.negotiate([e for e in asset.bodies if e])
+        # Each encoding is different bytes, so it gets its own strong tag.
+        tag = f"{asset.digest}-{encoding}" if encoding else asset.digest
+        if request.if_none_match.contains_weak(tag):
+            response = Response(status=304)
+        else:
+            response = Response(asset.bodies[encoding], mimetype=asset.mimetype)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+        response.set_etag(tag)
+        response.headers["Cache-Control"] = cache_control
+        if len(asset.bodies) > 1:
+            response.vary.add("Accept-Encoding")
+        return response
+
+    def stats(self):
+        return {
+            "files": len(self._by_name),
+            "bytes": {
+                encoding or "identity": sum(
+                    len(asset.bodies[encoding])
+                    for asset in self._by_name.values()
+                    if encoding in asset.bodies
+                )
+                for encoding in (None, *compression.ENCODINGS)
+            },
+        }
@@ -0,0 +1,138 @@
+"""Response compression negotiated from ``Accept-Encoding``.
+
+``instrument(app)`` compresses a finished response when the client accepts
+gzip, or br if the optional ``brotli`` package is installed, the body is at
+least ``COMPRESS_MIN_SIZE`` bytes and its type is textual (HTML, CSS, JSON,
+MessagePack, ...). Streamed responses, such as NDJSON exports and bodies
+relayed from upstream, and responses that already have a
+``Content-Encoding`` are left alone. Compressible types always get
+``Vary: Accept-Encoding``.
+
+A strong ETag names exact bytes, so a compressed response's tag is made
+weak; ``If-None-Match`` compares weakly, so revalidating with either form
+still gets a 304. Since a strong tag does identify the body, the compressed
+bytes of recently served tagged responses are kept and reused, which makes
+repeat views of the same page or listing cost a cache lookup.
+
+Services call each other with ``Accept-Encoding: identity`` by default (see
+``HTTP_ACCEPT_ENCODING`` in ``common.http_client``), so only browsers and
+other outside clients get compressed bodies unless that is changed.
+
+    COMPRESS_MIN_SIZE        bytes (default 1024)
+    COMPRESS_GZIP_LEVEL      1-9 (default 1)
+    COMPRESS_BROTLI_QUALITY  0-11 (default 5)
+    COMPRESS_CACHE_SIZE      compressed bodies kept by ETag (default 256)
+"""
+
+import gzip
+import os
+import time
+
+from flask import request
+
+from common import metrics
+from common.cache import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+# Level 1 gets most of level 6's saving on HTML and JSON for a third of the
+# CPU (benchmarks/compression_bench.py); bodies are compressed per response.
+GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", 1))
+BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", 5))
+CACHE_SIZE = int(os.environ.get("COMPRESS_CACHE_SIZE", 256))
+
+# Preferred first: brotli is smaller at a similar cost.
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+COMPRESSIBLE_TYPES = frozenset(
+    (
+        "application/javascript",
+        "application/json",
+        "application/x-msgpack",
+        "image/svg+xml",
+        "text/css",
+        "text/html",
+        "text/javascript",
+        "text/plain",
+    )
+)
+
+COMPRESSION_DURATION = metrics.Histogram(
+    "http_compression_duration_seconds",
+    "Time spent compressing response bodies.",
+    ("encoding",),
+    buckets=metrics.FAST_BUCKETS,
+)
+COMPRESSION_BYTES = metrics.Counter(
+    "http_compression_bytes",
+    "Response body bytes before (in) and after (out) compression.",
+    ("encoding", "stage"),
+)
+
+_compressed = LRUCache(CACHE_SIZE)
+
+
+def compress(data, encoding, level=None):
+    """``data`` compressed with ``encoding`` at ``level`` (or the default)."""
+    if encoding == "gzip":
+        return gzip.compress(data, GZIP_LEVEL if level is None else level, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, quality=BROTLI_QUALITY if level is None else level)
+    raise ValueError(f"Unsupported encoding {encoding}")
+
+
+def negotiate(available=ENCODINGS):
+    """The encoding from ``available`` the client prefers, or None."""
+    accept = request.accept_encodings
+    best, best_quality = None, 0
+    for encoding in available:
+        quality = accept[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _compress_response(response):
+    if (
+        response.status_code != 200
+        or response.is_streamed
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_TYPES
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate()
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        return response
+
+    tag, weak = response.get_etag()
+    key = (tag, encoding) if tag and not weak else None
+    body = _compressed.get(key) if key else None
+    if body is None:
+        start = time.perf_counter()
+        body = compress(data, encoding)
+        COMPRESSION_DURATION.observe(time.perf_counter() - start, encoding)
+        if key:
+            _compressed.set(key, body)
+    if len(body) >= len(data):
+        return response
+    COMPRESSION_BYTES.inc(encoding, "in", amount=len(data))
+    COMPRESSION_BYTES.inc(encoding, "out", amount=len(body))
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    if tag:
+        response.set_etag(tag, weak=True)
+    return response
+
+
+def instrument(app):
+    """Compress ``app``'s responses as described above."""
+    app.after_request(_compress_response)
+    return app
@@ -0,0 +1,117 @@
+"""ETags, Last-Modified and 304 responses for the read endpoints.
+
+Tags are derived from row versions, so an endpoint can answer
+``If-None-Match`` before it builds (or even reads) the body. A tag covers
+one representation and includes the negotiated ``common.wire`` format;
+responses carry ``Vary: Accept``.
+
+Views composed from several upstream responses tag themselves with
+``combine(tag, tag, ...)``, which keeps the upstream tags readable.
+``parts()`` recovers them from the caller's ``If-None-Match``, so the
+composing service can send each upstream its own condition and answer 304
+when every upstream did, without fetching any body.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+
+from flask import Response, make_response, request
+from werkzeug.http import unquote_etag
+
+from common import wire
+
+# Request headers that carry validators, forwarded when relaying a read.
+CONDITIONAL_HEADERS = ("If-None-Match", "If-Modified-Since")
+
+
+def etag(*parts):
+    """Opaque tag for a representation built from ``parts``."""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(repr((parts, wire.negotiated())).encode())
+    return digest.hexdigest()
+
+
+def _format_code():
+    return "m" if wire.negotiated() == wire.MSGPACK_TYPE else "j"
+
+
+def combine(*tags):
+    """Tag for a view composed of upstream responses tagged ``tags``, or
+    None if any of them was untagged."""
+    if not all(tags):
+        return None
+    return ".".join((*tags, _format_code()))
+
+
+def parts(count):
+    """The ``count`` upstream tags of the ``combine`` tag the caller holds
+    for this view, or None."""
+    for tag in request.if_none_match.as_set(include_weak=True):
+        pieces = tag.split(".")
+        if len(pieces) == count + 1 and pieces[-1] == _format_code():
+            return pieces[:-1]
+    return None
+
+
+def if_none_match(tag):
+    """Header that makes an upstream answer 304 if it still has ``tag``."""
+    return {"If-None-Match": f'"{tag}"'} if tag else {}
+
+
+def upstream_tag(response):
+    """The ETag of a ``requests`` response, or None. A weak tag is taken as
+    is: ``common.compression`` only weakens tags of bodies it compressed."""
+    header = response.headers.get("ETag")
+    if not header:
+        return None
+    return unquote_etag(header)[0]
+
+
+def forwarded():
+    """The current request's validators, for relaying it upstream."""
+    return {
+        name: request.headers[name]
+        for name in CONDITIONAL_HEADERS
+        if name in request.headers
+    }
+
+
+def timestamp(value):
+    """Parse a ``YYYY-MM-DD HH:MM:SS`` UTC column value, or None."""
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+
+
+def is_fresh(tag, last_modified=None):
+    """Whether the caller's copy is current. ``If-None-Match`` wins over
+    ``If-Modified-Since`` when both are sent."""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(tag)
+    since = request.if_modified_since
+    return since is not None and last_modified is not None and last_modified <= since
+
+
+def set_validators(response, tag, last_modified=None):
+    """Set the validators on ``response``."""
+    response.set_etag(tag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.vary.add("Accept")
+    return response
+
+
+def not_modified(tag, last_modified=None):
+    """A 304 for ``tag`` if the caller already has it, else None."""
+    if tag and is_fresh(tag, last_modified):
+        return set_validators(Response(status=304), tag, last_modified)
+    return None
+
+
+def respond(obj, tag, last_modified=None, status=200):
+    """``wire.respond`` with validators, or 304 if the caller is current."""
+    if tag is None:
+        return wire.respond(obj, status)
+    return not_modified(tag, last_modified) or set_validators(
+        make_response(wire.respond(obj, status)), tag, last_modified
+    )
@@ -0,0 +1,327 @@
+"""Pooled, tuned SQLite connections shared by the storage-backed services.
+
+Connections are opened once per process, put in WAL mode so readers and
+writers stop blocking each other, and reused across requests with their
+prepared-statement cache intact. A thread gets back the connection it used
+last when that one is idle.
+
+``pool.connection()`` is used like a ``sqlite3`` connection in a ``with``
+block: it commits on success, rolls back on error, then returns the
+connection to the pool.
+
+``GroupCommitWriter`` funnels single-statement writes from many request
+threads through one writer thread that commits them in batches, so a burst
+of inserts pays for one commit, and with ``SQLITE_SYNCHRONOUS=FULL`` one
+fsync, per batch instead of per row.
+
+    SQLITE_POOL_SIZE           connections per database file (default 8)
+    SQLITE_JOURNAL_MODE        default WAL
+    SQLITE_SYNCHRONOUS         default NORMAL (durable at checkpoints in WAL)
+    SQLITE_CACHE_SIZE          page cache, negative = KiB (default -16000)
+    SQLITE_MMAP_SIZE           bytes (default 134217728)
+    SQLITE_BUSY_TIMEOUT        milliseconds (default 5000)
+    SQLITE_STATEMENT_CACHE     prepared statements per connection (default 256)
+    SQLITE_CHECKPOINT_INTERVAL seconds between WAL checkpoints, 0 disables
+                               (default 30)
+    SQLITE_GROUP_COMMIT_BATCH  most writes per group commit (default 64)
+    SQLITE_GROUP_COMMIT_WINDOW_MS
+                               how long a batch waits for more writes after
+                               the first (default 0: take what queued up
+                               while the previous batch was committing)
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from common import metrics, tracing
+
+POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", 8))
+JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE", -16000))
+MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 134217728))
+BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000))
+STATEMENT_CACHE = int(os.environ.get("SQLITE_STATEMENT_CACHE", 256))
+CHECKPOINT_INTERVAL = float(os.environ.get("SQLITE_CHECKPOINT_INTERVAL", 30))
+GROUP_COMMIT_BATCH = int(os.environ.get("SQLITE_GROUP_COMMIT_BATCH", 64))
+GROUP_COMMIT_WINDOW = float(os.environ.get("SQLITE_GROUP_COMMIT_WINDOW_MS", 0)) / 1000
+
+GROUP_COMMIT_BATCH_SIZE = metrics.Histogram(
+    "sqlite_group_commit_batch_size",
+    "Writes committed together by a group-commit writer.",
+    ("database",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    pass
+
+
+class _TimedConnection(sqlite3.Connection):
+    """Records each statement's execution time in
+    ``sqlite_query_duration_seconds`` and, in sampled traces, as a span.
+    Only ``execute`` and ``executemany`` on the connection are timed, not
+    those on cursors from ``cursor()``, so callers use these."""
+
+    def _observe(self, sql, elapsed):
+        statement = metrics.statement_label(sql)
+        metrics.SQLITE_QUERY_DURATION.observe(elapsed, self.metrics_name, statement)
+        tracing.record(
+            "sql", "sql", elapsed, database=self.metrics_name, statement=statement
+        )
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._observe(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            self._observe(sql, time.perf_counter() - start)
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        path,
+        size=POOL_SIZE,
+        journal_mode=JOURNAL_MODE,
+        synchronous=SYNCHRONOUS,
+        cache_size=CACHE_SIZE,
+        mmap_size=MMAP_SIZE,
+        busy_timeout=BUSY_TIMEOUT,
+        statement_cache=STATEMENT_CACHE,
+    ):
+        self.path = path
+        self.size = size
+        self.pragmas = (
+            ("journal_mode", journal_mode),
+            ("synchronous", synchronous),
+            ("cache_size", cache_size),
+            ("mmap_size", mmap_size),
+            ("busy_timeout", busy_timeout),
+        )
+        self.busy_timeout = busy_timeout
+        self.statement_cache = statement_cache
+        self._cond = threading.Condition()
+        self._affinity = threading.local()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = []
+        self._opened = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout / 1000,
+            check_same_thread=False,
+            cached_statements=self.statement_cache,
+            factory=_TimedConnection,
+        )
+        conn.metrics_name = os.path.basename(self.path)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas:
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def acquire(self):
+        deadline = time.monotonic() + self.busy_timeout / 1000
+        with self._cond:
+            if self._pid != os.getpid():
+                # Connections must not be shared with a forked parent.
+                self._reset()
+            while True:
+                preferred = getattr(self._affinity, "conn", None)
+                if preferred is not None and preferred in self._idle:
+                    self._idle.remove(preferred)
+                    return preferred
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._opened < self.size:
+                    self._opened += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"No free connection to {self.path}")
+                self._cond.wait(remaining)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._opened -= 1
+                    self._cond.notify()
+                raise
+        self._affinity.conn = conn
+        return conn
+
+    def release(self, conn):
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def connection(self):
+        return _PooledConnection(self)
+
+    def checkpoint(self, mode="PASSIVE"):
+        with self.connection() as conn:
+            return tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+
+    def start_checkpointer(self, interval=CHECKPOINT_INTERVAL):
+        """Checkpoint the WAL every ``interval`` seconds on a daemon thread so
+        it does not grow without bound between automatic checkpoints."""
+        if not interval or self.pragmas[0][1].upper() != "WAL":
+            return None
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.checkpoint()
+                except Exception as e:
+                    logging.warning(f"WAL checkpoint of {self.path} failed: {str(e)}")
+
+        thread = threading.Thread(
+            target=run, daemon=True, name=f"checkpoint-{self.path}"
+        )
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self._cond:
+            return {"path": self.path, "opened": self._opened, "idle": len(self._idle)}
+
+
+class _PooledConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+
+    def __enter__(self):
+        self.conn = self.pool.acquire()
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            self.pool.release(self.conn)
+            self.conn = None
+        return False
+
+
+class _Write:
+    __slots__ = ("sql", "params", "done", "lastrowid", "error")
+
+    def __init__(self, sql, params):
+        self.sql = sql
+        self.params = params
+        self.done = threading.Event()
+        self.lastrowid = None
+        self.error = None
+
+
+class GroupCommitWriter:
+    """Run single-statement writes on one thread, committed in batches.
+
+    ``execute`` queues a statement and blocks until the transaction holding
+    it has committed, then returns its ``lastrowid`` or raises its error.
+    A batch closes when it holds ``max_batch`` writes or ``window`` seconds
+    after its first write. Each write runs inside its own savepoint, so a
+    failing statement is rolled back alone and the rest of its batch still
+    commits.
+    """
+
+    def __init__(self, pool, max_batch=GROUP_COMMIT_BATCH, window=GROUP_COMMIT_WINDOW):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.window = window
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # Started lazily, and again after fork, since threads do not survive.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                threading.Thread(
+                    target=self._run,
+                    args=(self._queue,),
+                    daemon=True,
+                    name=f"group-commit-{self.pool.path}",
+                ).start()
+                self._pid = os.getpid()
+
+    def execute(self, sql, params=()):
+        self._ensure_started()
+        write = _Write(sql, params)
+        self._queue.put(write)
+        write.done.wait()
+        if write.error is not None:
+            raise write.error
+        return write.lastrowid
+
+    def _collect(self, pending):
+        batch = [pending.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    batch.append(pending.get(timeout=remaining))
+                else:
+                    batch.append(pending.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, pending):
+        while True:
+            batch = self._collect(pending)
+            try:
+                self._commit(batch)
+            except Exception as e:
+                logging.error(f"Group commit to {self.pool.path} failed: {str(e)}")
+                for write in batch:
+                    write.lastrowid = None
+                    write.error = e
+            for write in batch:
+                write.done.set()
+
+    def _commit(self, batch):
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for write in batch:
+                conn.execute("SAVEPOINT group_write")
+                try:
+                    write.lastrowid = conn.execute(write.sql, write.params).lastrowid
+                except sqlite3.Error as e:
+                    write.error = e
+                    conn.execute("ROLLBACK TO group_write")
+                conn.execute("RELEASE group_write")
+        GROUP_COMMIT_BATCH_SIZE.observe(len(batch), os.path.basename(self.pool.path))
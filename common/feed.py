@@ -0,0 +1,145 @@
+"""The front page's listing kept in memory and updated on every write.
+
+``Feed`` holds the newest ``size`` rows of a table ordered by
+``created, id``, the order ``common.pagination`` lists them in. It is
+loaded once, then kept current by the service that owns the table: it
+calls ``upsert(row)`` with the committed row after a create or an edit and
+``remove(id)`` after a delete. A page inside the feed is then a bisect
+and a slice of ``per_page`` rows, with no query, merge across shards or
+sort. ``page()`` returns None for pages the feed does not cover (past its
+end, or addressed by a cursor it does not hold), and callers fall back
+to ``pagination.fetch_page``, whose output it matches.
+
+Writers may apply their updates in a different order than they committed.
+An edit only replaces an older version, ids are never reused, so a
+recently deleted id is not let back in, and new rows are placed by key.
+Writes that bypass the owning service (``bulk_load.py``,
+``shard_split.py``) need a restart or ``rebuild()``. Deletes shrink the feed; below half its size it
+reloads on the next read.
+"""
+
+import bisect
+import threading
+
+from common import pagination
+
+
+class Feed:
+    def __init__(self, load, size):
+        """``load(limit)`` returns the newest ``limit`` rows, newest first."""
+        self.load = load
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        # Ascending (created, id) keys, so the newest row is the last one.
+        self._keys = []
+        self._rows = {}
+        # Recently deleted ids, in deletion order.
+        self._deleted = {}
+        # Whether the feed holds every row of the table.
+        self._complete = False
+        self._stale = True
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(row):
+        return (row["created"], row["id"])
+
+    def _reload(self):
+        rows = self.load(self.size + 1)
+        self._complete = len(rows) <= self.size
+        rows = rows[: self.size]
+        self._rows = {row["id"]: row for row in rows}
+        self._keys = sorted(self._key(row) for row in rows)
+        self._deleted = {}
+        self._stale = False
+        self.rebuilds += 1
+
+    def rebuild(self):
+        with self._lock:
+            self._reload()
+
+    def upsert(self, row):
+        """Add a created row or replace an edited one."""
+        with self._lock:
+            if self._stale or row["id"] in self._deleted:
+                return
+            current = self._rows.get(row["id"])
+            if current is not None:
+                if row["version"] > current["version"]:
+                    self._rows[row["id"]] = row
+                return
+            key = self._key(row)
+            if not self._complete and (not self._keys or key < self._keys[0]):
+                # Older than the feed's oldest row; outside what it covers.
+                return
+            bisect.insort(self._keys, key)
+            self._rows[row["id"]] = row
+            if len(self._keys) > self.size:
+                del self._rows[self._keys.pop(0)[1]]
+                self._complete = False
+
+    def remove(self, row_id):
+        with self._lock:
+            # Remembered in case the create or an edit is applied after the
+            # delete. Those races are short, so only the latest ``size``
+            # deletes are kept, oldest dropped first.
+            self._deleted[row_id] = None
+            if len(self._deleted) > max(self.size, 1):
+                del self._deleted[next(iter(self._deleted))]
+            row = self._rows.pop(row_id, None)
+            if row is not None:
+                del self._keys[bisect.bisect_left(self._keys, self._key(row))]
+                if not self._complete and len(self._keys) < self.size // 2:
+                    self._stale = True
+
+    def page(self, per_page=None, after=None, before=None):
+        """A newest-first page like ``pagination.fetch_page``'s, or None."""
+        per_page = pagination.clamp_per_page(per_page)
+        with self._lock:
+            if self._stale:
+                self._reload()
+            cursor = before if before is not None else after
+            if cursor is not None and cursor not in self._rows:
+                self.misses += 1
+                return None
+            if before is None:
+                if after is None:
+                    end = len(self._keys)
+                else:
+                    end = bisect.bisect_left(self._keys, self._key(self._rows[after]))
+                start = max(0, end - per_page - 1)
+                if end - start <= per_page and not self._complete:
+                    self.misses += 1
+                    return None
+                window = self._keys[start:end][::-1]
+                has_more = len(window) > per_page
+                items = [self._rows[key[1]] for key in window[:per_page]]
+            else:
+                begin = bisect.bisect_right(self._keys, self._key(self._rows[before]))
+                window = self._keys[begin : begin + per_page + 1]
+                has_more = len(window) > per_page
+                items = [self._rows[key[1]] for key in window[:per_page]][::-1]
+            self.hits += 1
+
+        next_cursor = prev_cursor = None
+        if items:
+            if before is None:
+                next_cursor = items[-1]["id"] if has_more else None
+                prev_cursor = items[0]["id"] if after is not None else None
+            else:
+                prev_cursor = items[0]["id"] if has_more else None
+                next_cursor = items[-1]["id"]
+        return {"items": items, "next_cursor": next_cursor, "prev_cursor": prev_cursor}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "rows": len(self._keys),
+                "complete": self._complete,
+                "hits": self.hits,
+                "misses": self.misses,
+                "rebuilds": self.rebuilds,
+            }
@@ -0,0 +1,232 @@
+"""Health checks run in the background and served from the last snapshot.
+
+A ``Prober`` runs its registered checks on a daemon thread every
+``interval`` seconds and keeps the outcome: pass or fail, latency and
+error per check, and when the round finished. ``instrument(app, prober)``
+serves it on three endpoints, none of which does any checking itself:
+
+* ``/health/live``: 200 whenever the process answers at all.
+* ``/health/ready``: 200 while every critical check passed in the last
+  round and that round is no older than ``max_age``, otherwise 503.
+* ``/health``: the whole snapshot with its age, plus ``extras()``.
+
+Checks run concurrently, each bounded by ``timeout``. A check still
+running when the next round starts is reported as failed rather than
+started again, so a hung database or dependency costs one thread, not one
+per probe. Dependencies are checked at their own ``/health/ready``, which
+is answered from their snapshot, so probes never cascade through the
+call graph. Dependency checks are not critical by default: a service
+whose dependency is down reports ``degraded`` but stays ready, since
+taking every replica out of rotation would not bring the dependency back.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait as wait_all
+
+from flask import jsonify
+
+from common import metrics
+
+PROBE_INTERVAL = float(os.environ.get("HEALTH_PROBE_INTERVAL", 5.0))
+PROBE_TIMEOUT = float(os.environ.get("HEALTH_PROBE_TIMEOUT", 2.0))
+# A snapshot older than this (default three rounds) makes the service unready.
+MAX_AGE = float(os.environ.get("HEALTH_MAX_AGE", 0)) or None
+
+CHECK_UP = metrics.Gauge(
+    "health_check_up", "1 if the check passed in the last round, else 0.", ("check",)
+)
+CHECK_DURATION = metrics.Histogram(
+    "health_check_duration_seconds", "Health check latency.", ("check",)
+)
+
+HEALTHY, DEGRADED, UNHEALTHY, STARTING = "healthy", "degraded", "unhealthy", "starting"
+
+
+class Prober:
+    def __init__(
+        self,
+        interval=PROBE_INTERVAL,
+        timeout=PROBE_TIMEOUT,
+        max_age=MAX_AGE,
+        clock=time.monotonic,
+    ):
+        self.interval = interval
+        self.timeout = timeout
+        self.max_age = max_age or 3 * interval
+        self.clock = clock
+        self.rounds = 0
+        self._checks = {}
+        self._running = {}
+        self._results = {}
+        self._finished_at = None
+        self._finished_wall = None
+        self._pid = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def check(self, name, fn, critical=True):
+        """Register ``fn()``: it raises on failure and may return a dict of
+        details to report with the result."""
+        self._checks[name] = (fn, critical)
+        return fn
+
+    def dependency(self, name, client, critical=False):
+        """Check an ``http_client`` target at its ``/health/ready``."""
+
+        def probe():
+            response = client.probe("/health/ready", self.timeout)
+            try:
+                status = response.json().get("status")
+            except ValueError:
+                status = None
+            if response.status_code != 200:
+                raise RuntimeError(f"{response.status_code} {status or ''}".strip())
+            return {"remote_status": status}
+
+        return self.check(name, probe, critical)
+
+    def _timed(self, fn):
+        start = time.perf_counter()
+        try:
+            return {"ok": True, **(fn() or {})}, time.perf_counter() - start
+        except Exception as e:
+            return {"ok": False, "error": str(e)}, time.perf_counter() - start
+
+    def run_once(self):
+        """Run one round of checks and store the snapshot."""
+        if self._executor is None:
+            self._reset()
+        started = {}
+        results = {}
+        for name, (fn, critical) in self._checks.items():
+            running = self._running.get(name)
+            if running is not None and not running[0].done():
+                waited = time.perf_counter() - running[1]
+                results[name] = {
+                    "ok": False,
+                    "error": f"still running after {waited:.1f}s",
+                    "latency_ms": round(waited * 1000, 1),
+                }
+                continue
+            future = self._executor.submit(self._timed, fn)
+            started[name] = future
+            self._running[name] = (future, time.perf_counter())
+        wait_all(list(started.values()), timeout=self.timeout)
+        for name, future in started.items():
+            if future.done():
+                result, elapsed = future.result()
+                self._running.pop(name, None)
+            else:
+                elapsed = self.timeout
+                result = {"ok": False, "error": f"timed out after {self.timeout}s"}
+            results[name] = {**result, "latency_ms": round(elapsed * 1000, 1)}
+            CHECK_DURATION.observe(elapsed, name)
+        for name, result in results.items():
+            result["critical"] = self._checks[name][1]
+            CHECK_UP.set(1 if result["ok"] else 0, name)
+            # Logged on changes only, not once per round.
+            if result["ok"] != self._results.get(name, {}).get("ok", True):
+                if result["ok"]:
+                    logging.info(f"Health check {name} recovered")
+                else:
+                    logging.warning(f"Health check {name} failed: {result['error']}")
+        with self._lock:
+            self._results = results
+            self._finished_at = self.clock()
+            self._finished_wall = time.time()
+            self.rounds += 1
+
+    def _reset(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, len(self._checks)), thread_name_prefix="health"
+        )
+        self._running = {}
+
+    def _run(self):
+        while True:
+            start = self.clock()
+            self.run_once()
+            time.sleep(max(0.0, self.interval - (self.clock() - start)))
+
+    def start(self):
+        """Start probing; again after fork, since threads do not survive."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._reset()
+            threading.Thread(
+                target=self._run, daemon=True, name="health-prober"
+            ).start()
+            self._pid = os.getpid()
+
+    def status(self):
+        """``starting``, ``unhealthy`` (a critical check failed or the
+        snapshot is stale), ``degraded`` (another check failed) or
+        ``healthy``."""
+        with self._lock:
+            return self._status(self._results, self._finished_at)
+
+    def _status(self, results, finished_at):
+        if finished_at is None:
+            return STARTING
+        if self.clock() - finished_at > self.max_age:
+            return UNHEALTHY
+        if any(not r["ok"] and r["critical"] for r in results.values()):
+            return UNHEALTHY
+        if any(not r["ok"] for r in results.values()):
+            return DEGRADED
+        return HEALTHY
+
+    def snapshot(self):
+        with self._lock:
+            results, finished_at = self._results, self._finished_at
+            finished_wall, rounds = self._finished_wall, self.rounds
+        status = self._status(results, finished_at)
+        age = None if finished_at is None else round(self.clock() - finished_at, 3)
+        return {
+            "status": status,
+            "checked_at": finished_wall,
+            "age_s": age,
+            "stale": age is None or age > self.max_age,
+            "interval_s": self.interval,
+            "rounds": rounds,
+            "checks": results,
+        }
+
+
+def ready(status):
+    return status in (HEALTHY, DEGRADED)
+
+
+def instrument(app, prober, extras=None):
+    """Start ``prober`` and serve its snapshot on ``app``'s health endpoints.
+
+    ``extras()`` returns a dict merged into ``/health``; it runs per call,
+    so it should only read in-memory stats.
+    """
+    prober.start()
+    app.before_request(prober.start)
+
+    def live():
+        return jsonify({"status": "alive"}), 200
+
+    def ready_check():
+        status = prober.status()
+        return jsonify({"status": status}), 200 if ready(status) else 503
+
+    def health():
+        snapshot = prober.snapshot()
+        if extras is not None:
+            snapshot.update(extras())
+        return jsonify(snapshot), 200 if ready(snapshot["status"]) else 503
+
+    app.add_url_rule("/health/live", "health_live", live)
+    app.add_url_rule("/health/ready", "health_ready", ready_check)
+    app.add_url_rule("/health", "health", health)
+    return prober
@@ -0,0 +1,352 @@
+"""Pooled HTTP client shared by the gateway and the services.
+
+Every process keeps a ``requests.Session`` with a keep-alive connection
+pool mounted per downstream service, so hops reuse TCP connections instead
+of opening a new one per call. Each target has its own connect/read
+timeouts and idempotent calls are retried with backoff. Calls with a
+deadline go through a second session that sends them once, since every
+retry would get a fresh timeout and could outlast the deadline. Requests
+ask for, and send ``json=`` bodies in, the ``common.wire`` format.
+
+Configuration comes from the environment:
+
+    HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT,
+    HTTP_MAX_RETRIES, HTTP_BACKOFF_FACTOR, HTTP_ACCEPT_ENCODING
+
+and can be overridden per target with ``<NAME>_SERVICE_POOL_SIZE``,
+``<NAME>_SERVICE_CONNECT_TIMEOUT`` and ``<NAME>_SERVICE_READ_TIMEOUT``
+(e.g. ``TEMPLATE_SERVICE_READ_TIMEOUT=2``).
+
+``HTTP_ACCEPT_ENCODING`` defaults to ``identity``: between pods on one
+cluster network, compressing a body costs more CPU than sending it takes.
+Set it to ``gzip`` for links where bandwidth is scarce.
+
+Each target also gets a circuit breaker, an adaptive read timeout and a cap
+on calls in flight (see ``common.resilience``). Calls they refuse raise
+``CircuitOpen`` or ``Overloaded`` without touching the network; both are
+``Unavailable``, a ``requests.ConnectionError``, so existing error handling
+covers them. Connection errors, timeouts and 5xx responses count as
+failures. Half-open probes get the configured read timeout rather than the
+adaptive one, so a service that has become slower for good closes the
+breaker again and its new latencies raise the timeout.
+
+    HTTP_BREAKER_ENABLED        1 (default) or 0
+    HTTP_BREAKER_WINDOW         calls remembered (default 20)
+    HTTP_BREAKER_MIN_CALLS      calls before it may open (default 10)
+    HTTP_BREAKER_FAILURE_RATIO  share of failures that opens it (default 0.5)
+    HTTP_BREAKER_RESET          seconds open before a probe (default 5)
+    HTTP_ADAPTIVE_TIMEOUT       1 (default) or 0
+    HTTP_TIMEOUT_PERCENTILE     of recent successful calls (default 99)
+    HTTP_TIMEOUT_MULTIPLIER     applied to it (default 3)
+    HTTP_TIMEOUT_FLOOR          seconds (default 0.25)
+    HTTP_MAX_CONCURRENCY        calls in flight per target, 0 = no cap (32)
+
+``HTTP_MAX_CONCURRENCY`` can be set per target as
+``<NAME>_SERVICE_MAX_CONCURRENCY``.
+"""
+
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from common import metrics, resilience, tracing, wire
+
+POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 10))
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 1.0))
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 5.0))
+MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", 2))
+BACKOFF_FACTOR = float(os.environ.get("HTTP_BACKOFF_FACTOR", 0.05))
+ACCEPT_ENCODING = os.environ.get("HTTP_ACCEPT_ENCODING", "identity")
+BREAKER_ENABLED = os.environ.get("HTTP_BREAKER_ENABLED", "1") == "1"
+BREAKER_WINDOW = int(os.environ.get("HTTP_BREAKER_WINDOW", 20))
+BREAKER_MIN_CALLS = int(os.environ.get("HTTP_BREAKER_MIN_CALLS", 10))
+BREAKER_FAILURE_RATIO = float(os.environ.get("HTTP_BREAKER_FAILURE_RATIO", 0.5))
+BREAKER_RESET = float(os.environ.get("HTTP_BREAKER_RESET", 5.0))
+ADAPTIVE_TIMEOUT = os.environ.get("HTTP_ADAPTIVE_TIMEOUT", "1") == "1"
+TIMEOUT_PERCENTILE = float(os.environ.get("HTTP_TIMEOUT_PERCENTILE", 99))
+TIMEOUT_MULTIPLIER = float(os.environ.get("HTTP_TIMEOUT_MULTIPLIER", 3.0))
+TIMEOUT_FLOOR = float(os.environ.get("HTTP_TIMEOUT_FLOOR", 0.25))
+MAX_CONCURRENCY = int(os.environ.get("HTTP_MAX_CONCURRENCY", 32))
+
+# Remaining request budget forwarded with deadline-bounded calls so the
+# callee can bound its own downstream calls by the caller's deadline.
+BUDGET_HEADER = "X-Request-Budget-Ms"
+
+REJECTED = metrics.Counter(
+    "outbound_requests_rejected",
+    "Calls to other services refused before being sent, by target and reason.",
+    ("target", "reason"),
+)
+
+_lock = threading.Lock()
+_clients = {}
+# Keyed by whether calls through it are deadline-bound (and not retried).
+_sessions = {}
+_session_pid = None
+
+
+def _env(name, key, default, cast):
+    value = os.environ.get(f"{name.upper()}_SERVICE_{key}")
+    return cast(value) if value else default
+
+
+class Unavailable(requests.ConnectionError):
+    """A call refused without being sent; retry after ``retry_after`` s."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(Unavailable):
+    pass
+
+
+class Overloaded(Unavailable):
+    pass
+
+
+def _get_session(bounded=False):
+    # Sessions must not be shared across fork(); rebuild in the child.
+    global _session_pid
+    if not _sessions or _session_pid != os.getpid():
+        with _lock:
+            if not _sessions or _session_pid != os.getpid():
+                for retries in (True, False):
+                    session = requests.Session()
+                    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+                    _sessions[not retries] = session
+                    for client in _clients.values():
+                        client._mount(session, retries)
+                _session_pid = os.getpid()
+    return _sessions[bounded]
+
+
+class ServiceClient:
+    def __init__(
+        self,
+        name,
+        base_url,
+        pool_size=None,
+        connect_timeout=None,
+        read_timeout=None,
+        max_retries=None,
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size or _env(name, "POOL_SIZE", POOL_SIZE, int)
+        self.timeout = (
+            connect_timeout or _env(name, "CONNECT_TIMEOUT", CONNECT_TIMEOUT, float),
+            read_timeout or _env(name, "READ_TIMEOUT", READ_TIMEOUT, float),
+        )
+        self.max_retries = MAX_RETRIES if max_retries is None else max_retries
+        self.adapters = {}
+        self.breaker = (
+            resilience.CircuitBreaker(
+                name,
+                window=BREAKER_WINDOW,
+                min_calls=BREAKER_MIN_CALLS,
+                failure_ratio=BREAKER_FAILURE_RATIO,
+                reset_timeout=BREAKER_RESET,
+            )
+            if BREAKER_ENABLED
+            else None
+        )
+        self.latency = (
+            resilience.LatencyTracker(
+                self.timeout[1],
+                percentile=TIMEOUT_PERCENTILE,
+                multiplier=TIMEOUT_MULTIPLIER,
+                floor=TIMEOUT_FLOOR,
+            )
+            if ADAPTIVE_TIMEOUT
+            else None
+        )
+        self.limiter = resilience.ConcurrencyLimiter(
+            _env(name, "MAX_CONCURRENCY", MAX_CONCURRENCY, int)
+        )
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._total_time = 0.0
+
+    def _mount(self, session, retries=True):
+        # Retry covers connection failures and gateway errors; urllib3 only
+        # retries the idempotent methods (GET, HEAD, PUT, DELETE, OPTIONS).
+        # Without retries, requests' default of 0 raises read timeouts as
+        # requests.Timeout rather than wrapped in a ConnectionError.
+        retry = 0
+        if retries:
+            retry = Retry(
+                total=self.max_retries,
+                connect=self.max_retries,
+                read=self.max_retries,
+                status=self.max_retries,
+                backoff_factor=BACKOFF_FACTOR,
+                status_forcelist=(502, 503, 504),
+                raise_on_status=False,
+            )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=retry,
+        )
+        self.adapters[not retries] = adapter
+        session.mount(self.base_url + "/", adapter)
+
+    def request(self, method, path, deadline=None, **kwargs):
+        """Send a request; ``deadline`` is an absolute ``time.monotonic()``
+        value that caps the timeouts to the caller's remaining budget."""
+        if deadline is not None and deadline <= time.monotonic():
+            with self._stats_lock:
+                self._errors += 1
+            raise requests.Timeout(f"Deadline exceeded before calling {self.name}")
+        if not self.limiter.acquire():
+            REJECTED.inc(self.name, "overloaded")
+            raise Overloaded(
+                f"{self.name} already has {self.limiter.limit} calls in flight"
+            )
+        try:
+            state = self.breaker.allow() if self.breaker is not None else None
+            if self.breaker is not None and state is None:
+                REJECTED.inc(self.name, "circuit_open")
+                raise CircuitOpen(
+                    f"Circuit to {self.name} is open",
+                    retry_after=self.breaker.retry_after(),
+                )
+            # Recorded whatever happens from here on: a half-open probe that
+            # went unrecorded would leave the breaker refusing every call.
+            failed = True
+            try:
+                if "timeout" not in kwargs and self.latency is not None:
+                    if state != resilience.HALF_OPEN:
+                        kwargs["timeout"] = (self.timeout[0], self.latency.timeout())
+                response = self._send(method, path, deadline, kwargs)
+                failed = response.status_code >= 500
+                return response
+            finally:
+                if self.breaker is not None:
+                    self.breaker.record(not failed)
+        finally:
+            self.limiter.release()
+
+    def _send(self, method, path, deadline, kwargs):
+        timeout = kwargs.pop("timeout", self.timeout)
+        if deadline is not None:
+            remaining = max(deadline - time.monotonic(), 0.001)
+            if not isinstance(timeout, tuple):
+                timeout = (timeout, timeout)
+            timeout = tuple(min(t, remaining) for t in timeout)
+            # The callee gets the read timeout, which the adaptive timeout
+            # may have cut below the deadline: we stop waiting after it.
+            kwargs["headers"] = {
+                **(kwargs.get("headers") or {}),
+                BUDGET_HEADER: str(int(timeout[1] * 1000)),
+            }
+        kwargs["timeout"] = timeout
+        kwargs = wire.outbound(kwargs)
+        session = _get_session(bounded=deadline is not None)
+        with tracing.span(f"{method} {self.name}", "client", path=path) as span:
+            if span is not None:
+                kwargs["headers"] = {
+                    **(kwargs.get("headers") or {}),
+                    tracing.HEADER: span.traceparent(),
+                }
+            start = time.perf_counter()
+            status = "error"
+            failed = True
+            try:
+                response = session.request(method, self.base_url + path, **kwargs)
+                status = str(response.status_code)
+                failed = response.status_code >= 500
+                return response
+            except requests.RequestException:
+                with self._stats_lock:
+                    self._errors += 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._stats_lock:
+                    self._requests += 1
+                    self._total_time += elapsed
+                if self.latency is not None and not failed:
+                    self.latency.record(elapsed)
+                metrics.OUTBOUND_DURATION.observe(elapsed, self.name, method, status)
+                if span is not None:
+                    span.attrs["status"] = status
+
+    def probe(self, path, timeout):
+        """GET ``path`` once, for health checks. Probes bypass the breaker,
+        the adaptive timeout, the concurrency cap and the call stats: a
+        dependency that is still starting must not trip the breaker for
+        real traffic, nor a cheap probe close one that real calls opened."""
+        return _get_session(bounded=True).get(self.base_url + path, timeout=timeout)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def stats(self):
+        connections = 0
+        for adapter in list(self.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+        with self._stats_lock:
+            requests_made = self._requests
+            return {
+                "url": self.base_url,
+                "requests": requests_made,
+                "errors": self._errors,
+                "connections_opened": connections,
+                "avg_ms": round(self._total_time * 1000 / requests_made, 3)
+                if requests_made
+                else 0.0,
+                "breaker": self.breaker.stats() if self.breaker else None,
+                "latency": self.latency.stats() if self.latency else None,
+                "concurrency": self.limiter.stats(),
+            }
+
+
+def get_client(name, base_url, **kwargs):
+    """Return the process-wide client for ``name``, creating it on first use."""
+    with _lock:
+        client = _clients.get(name)
+        if client is None:
+            client = ServiceClient(name, base_url, **kwargs)
+            _clients[name] = client
+            if _sessions and _session_pid == os.getpid():
+                for bounded, session in _sessions.items():
+                    client._mount(session, retries=not bounded)
+    return client
+
+
+def incoming_deadline(headers, default, headroom=0.0):
+    """Deadline for serving a request: ``default`` seconds from now, or less
+    if the caller forwarded a smaller budget. ``headroom`` is the share of
+    the budget kept back for sending the response, so that an answer built
+    at the deadline still reaches the caller before its own timeout."""
+    budget = default
+    try:
+        budget = min(default, int(headers.get(BUDGET_HEADER, "")) / 1000)
+    except ValueError:
+        pass
+    return time.monotonic() + budget * (1 - headroom)
+
+
+def stats():
+    return {name: client.stats() for name, client in _clients.items()}
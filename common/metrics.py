@@ -0,0 +1,234 @@
+"""Prometheus text-format metrics for the gateway and the services.
+
+Metrics are module-level and registered on creation; ``render()`` returns
+the exposition text that ``/metrics`` serves. Each labelled series keeps a
+preallocated list of bucket counts, so an observation is a bisect and two
+additions under a lock that is held for no longer than that.
+
+``instrument(app)`` records every Flask request by method, route rule and
+status, tracks requests in flight and adds the ``/metrics`` endpoint.
+``common.http_client`` records outbound calls per target and ``common.db``
+records SQLite statement latency, so both are covered wherever they are
+used.
+"""
+
+import bisect
+import re
+import threading
+import time
+
+from flask import Response, g, request
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)  # fmt: skip
+FAST_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 1.0,
+)  # fmt: skip
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = [(k, self._snapshot(v)) for k, v in self._series.items()]
+        for labelvalues, value in sorted(series):
+            lines.extend(self._lines(labelvalues, value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._series[labelvalues] = self._series.get(labelvalues, 0) + amount
+
+    def _snapshot(self, value):
+        return value
+
+    def _lines(self, labelvalues, value):
+        labels = _labels(self.labelnames, labelvalues)
+        return [f"{self.name}_total{labels} {_number(value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._series[labelvalues] = value
+
+    def _lines(self, labelvalues, value):
+        labels = _labels(self.labelnames, labelvalues)
+        return [f"{self.name}{labels} {_number(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # Bucket counts (the last one is +Inf), then the sum.
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1)
+                series.append(0.0)
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *labelvalues):
+        return _Timer(self, labelvalues)
+
+    def _snapshot(self, series):
+        return list(series)
+
+    def _lines(self, labelvalues, series):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series):
+            cumulative += count
+            le = 'le="' + _number(bound) + '"'
+            labels = _labels(self.labelnames, labelvalues, le)
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _labels(self.labelnames, labelvalues)
+        lines.append(f"{self.name}_sum{labels} {_number(series[-1])}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+        return False
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time spent serving HTTP requests.",
+    ("method", "route", "status"),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served."
+)
+OUTBOUND_DURATION = Histogram(
+    "outbound_request_duration_seconds",
+    "Time spent in calls to other services, by target.",
+    ("target", "method", "status"),
+)
+SQLITE_QUERY_DURATION = Histogram(
+    "sqlite_query_duration_seconds",
+    "Time spent executing SQLite statements.",
+    ("database", "statement"),
+    buckets=FAST_BUCKETS,
+)
+TEMPLATE_RENDER_DURATION = Histogram(
+    "template_render_duration_seconds",
+    "Time spent rendering templates.",
+    ("template",),
+)
+
+_PLACEHOLDERS = re.compile(r"\?(\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+_statements = {}
+
+
+def statement_label(sql):
+    """Collapse whitespace and variable-length ``?, ?, ...`` lists so each
+    distinct statement shape gets one series."""
+    label = _statements.get(sql)
+    if label is None:
+        label = _PLACEHOLDERS.sub("?, ...", _WHITESPACE.sub(" ", sql).strip())[:200]
+        if len(_statements) < 1000:
+            _statements[sql] = label
+    return label
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc()
+
+
+def _after_request(response):
+    start = g.pop("metrics_start", None)
+    if start is not None:
+        REQUESTS_IN_FLIGHT.dec()
+        rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+        REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            request.method,
+            rule,
+            str(response.status_code),
+        )
+    return response
+
+
+def _teardown_request(exc):
+    # Requests that failed before after_request ran still leave in-flight.
+    if g.pop("metrics_start", None) is not None:
+        REQUESTS_IN_FLIGHT.dec()
+
+
+def instrument(app):
+    """Record request metrics for ``app`` and serve them at ``/metrics``."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule(
+        "/metrics", "metrics", lambda: Response(render(), content_type=CONTENT_TYPE)
+    )
+    return app
@@ -0,0 +1,190 @@
+"""Keyset (cursor) pagination over tables ordered by ``created, id``.
+
+Pages are addressed by the id of a row on the neighbouring page
+(``after=<id>`` / ``before=<id>``) rather than by an offset, so fetching any
+page costs one index seek plus ``per_page`` rows no matter how deep it is.
+Tables need an index ending in ``(created, id)``. ``iter_batches`` walks a
+whole listing the same way for streamed exports.
+
+Both also take a table split across several databases (see
+``common.sharding``): every shard answers the same keyset query and the
+rows are merged in listing order, so a page still costs one seek per shard.
+
+A cursor whose row has been deleted has no ``created`` to seek from. Where
+SQLite assigns the ids they grow with ``created``, so the listing carries on
+from the id alone. With ``ordered_ids=False`` (ids handed out in blocks by
+several processes, see ``common.sharding.IdAllocator``) a later row can
+have a lower id, and such a cursor raises ``CursorNotFound`` instead of
+skipping or repeating rows.
+"""
+
+import contextlib
+
+DEFAULT_PER_PAGE = 10
+MAX_PER_PAGE = 100
+
+
+class CursorNotFound(LookupError):
+    """The row a cursor points at is gone and ids cannot stand in for it."""
+
+
+def clamp_per_page(per_page):
+    if not per_page or per_page < 1:
+        return DEFAULT_PER_PAGE
+    return min(per_page, MAX_PER_PAGE)
+
+
+def fetch_page(
+    conn,
+    table,
+    where="1",
+    params=(),
+    per_page=DEFAULT_PER_PAGE,
+    after=None,
+    before=None,
+    descending=True,
+    columns="*",
+    ordered_ids=True,
+):
+    """Return ``{"items", "next_cursor", "prev_cursor"}`` for one page.
+
+    ``conn`` is a connection, or a list of connections with one shard of
+    ``table`` each. ``where``/``params`` restrict the listing (e.g.
+    ``post_id = ?``). With ``descending`` the newest rows come first.
+    """
+    conns = conn if isinstance(conn, list) else [conn]
+    per_page = clamp_per_page(per_page)
+    forward = before is None
+    cursor_id = after if forward else before
+    walk_descending = descending == forward
+    op = "<" if walk_descending else ">"
+    order = "DESC" if walk_descending else "ASC"
+
+    conditions = [where]
+    args = list(params)
+    if cursor_id is not None:
+        condition, cursor_args = _seek(conns, table, cursor_id, op, ordered_ids)
+        conditions.append(condition)
+        args.extend(cursor_args)
+
+    rows = _merged(
+        conns,
+        f"SELECT {columns} FROM {table} WHERE {' AND '.join(conditions)} "
+        f"ORDER BY created {order}, id {order} LIMIT ?",
+        (*args, per_page + 1),
+        walk_descending,
+    )
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    items = [dict(row) for row in rows]
+    next_cursor = prev_cursor = None
+    if items:
+        if forward:
+            next_cursor = items[-1]["id"] if has_more else None
+            prev_cursor = items[0]["id"] if after is not None else None
+        else:
+            prev_cursor = items[0]["id"] if has_more else None
+            next_cursor = items[-1]["id"]
+    return {"items": items, "next_cursor": next_cursor, "prev_cursor": prev_cursor}
+
+
+def iter_batches(
+    pool,
+    table,
+    where="1",
+    params=(),
+    after=None,
+    limit=None,
+    batch_size=500,
+    ordered_ids=True,
+):
+    """Yield lists of row dicts covering the whole listing, newest first,
+    starting after the row with id ``after``.
+
+    Each batch is one keyset query on a connection borrowed from ``pool``
+    (or from each pool, given a list of shard pools) and returned before the
+    batch is yielded, so a slow consumer never holds a connection or a read
+    transaction open. ``limit`` caps the total number of rows. The cursor is
+    looked up before the first batch, so ``CursorNotFound`` is raised by the
+    call itself rather than partway through a stream.
+    """
+    pools = pool if isinstance(pool, list) else [pool]
+    start = None
+    if after is not None:
+        with _connections(pools) as conns:
+            start = _seek(conns, table, after, "<", ordered_ids)
+    return _batches(pools, table, where, params, start, limit, batch_size)
+
+
+def _batches(pools, table, where, params, start, limit, batch_size):
+    remaining = limit
+    position = None
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        conditions = [where]
+        args = list(params)
+        if position is not None:
+            conditions.append("(created, id) < (?, ?)")
+            args.extend(position)
+        elif start is not None:
+            conditions.append(start[0])
+            args.extend(start[1])
+        with _connections(pools) as conns:
+            rows = _merged(
+                conns,
+                f"SELECT * FROM {table} WHERE {' AND '.join(conditions)} "
+                f"ORDER BY created DESC, id DESC LIMIT ?",
+                (*args, size),
+                True,
+            )[:size]
+        if not rows:
+            return
+        yield [dict(row) for row in rows]
+        if remaining is not None:
+            remaining -= len(rows)
+        if len(rows) < size:
+            return
+        position = (rows[-1]["created"], rows[-1]["id"])
+
+
+@contextlib.contextmanager
+def _connections(pools):
+    with contextlib.ExitStack() as stack:
+        yield [stack.enter_context(p.connection()) for p in pools]
+
+
+def _seek(conns, table, cursor_id, op, ordered_ids):
+    """The condition and args selecting the rows past ``cursor_id``."""
+    row = _find(conns, table, cursor_id)
+    if row is not None:
+        return f"(created, id) {op} (?, ?)", (row[0], cursor_id)
+    if not ordered_ids:
+        raise CursorNotFound(f"cursor {cursor_id} not found")
+    # The cursor row was deleted; ids grow with created, so compare on id
+    # alone.
+    return f"id {op} ?", (cursor_id,)
+
+
+def _find(conns, table, row_id):
+    """The ``created`` of row ``row_id`` in whichever shard holds it."""
+    for conn in conns:
+        row = conn.execute(
+            f"SELECT created FROM {table} WHERE id = ?", (row_id,)
+        ).fetchone()
+        if row is not None:
+            return row
+    return None
+
+
+def _merged(conns, sql, args, descending):
+    """Run ``sql`` on every shard and merge the rows by ``(created, id)``."""
+    if len(conns) == 1:
+        return conns[0].execute(sql, args).fetchall()
+    rows = []
+    for conn in conns:
+        rows.extend(conn.execute(sql, args).fetchall())
+    rows.sort(key=lambda row: (row["created"], row["id"]), reverse=descending)
+    return rows
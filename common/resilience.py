@@ -0,0 +1,250 @@
+"""Circuit breakers, adaptive timeouts and concurrency limits.
+
+``common.http_client`` gives every downstream target one of each, so a slow
+or failing service costs its callers a bounded amount of time and threads:
+
+* ``CircuitBreaker`` keeps the outcomes of the last calls. Once enough of
+  them failed it opens and calls fail at once, without touching the
+  network, until ``reset_timeout`` has passed. It is then half-open: a few
+  probe calls go through, and it closes if they all succeed or opens again
+  on the first failure.
+* ``LatencyTracker`` derives a read timeout from a percentile of recent
+  successful call latencies times a multiplier, kept between a floor and
+  the configured timeout, so a call that would normally take 20 ms is not
+  left waiting five seconds.
+* ``ConcurrencyLimiter`` caps the calls in flight; past the cap a call is
+  refused instead of queueing behind the others.
+
+``shed_load(app, limit)`` applies the same limiter to a Flask app's own
+requests and answers the excess with a quick 503 and ``Retry-After``.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+
+from flask import g, make_response, request
+
+from common import metrics
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+BREAKER_TRANSITIONS = metrics.Counter(
+    "circuit_breaker_transitions",
+    "Circuit breaker state changes, by target and new state.",
+    ("target", "state"),
+)
+REQUESTS_SHED = metrics.Counter(
+    "http_requests_shed",
+    "Incoming requests answered with 503 because too many were in flight.",
+)
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name,
+        window=20,
+        min_calls=10,
+        failure_ratio=0.5,
+        reset_timeout=5.0,
+        probes=1,
+        clock=time.monotonic,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.reset_timeout = reset_timeout
+        self.probes = probes
+        self.clock = clock
+        self.state = CLOSED
+        self.opened = 0
+        self.rejected = 0
+        self._outcomes = deque(maxlen=window)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes_left = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        self.state = state
+        BREAKER_TRANSITIONS.inc(self.name, state)
+        if state == OPEN:
+            self.opened += 1
+            self._opened_at = self.clock()
+        elif state == HALF_OPEN:
+            self._probes_left = self.probes
+            self._probe_successes = 0
+        else:
+            self._outcomes.clear()
+            self._failures = 0
+
+    def allow(self):
+        """The state a call is let through in, or None if it is refused."""
+        with self._lock:
+            if self.state == OPEN:
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return None
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if not self._probes_left:
+                    self.rejected += 1
+                    return None
+                self._probes_left -= 1
+            return self.state
+
+    def record(self, success):
+        """Record the outcome of a call that ``allow()`` let through."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if not success:
+                    self._transition(OPEN)
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.probes:
+                        self._transition(CLOSED)
+                return
+            if self.state == OPEN:
+                # A call started before the breaker opened.
+                return
+            if len(self._outcomes) == self._outcomes.maxlen:
+                self._failures -= not self._outcomes[0]
+            self._outcomes.append(success)
+            self._failures += not success
+            if len(
+                self._outcomes
+            ) >= self.min_calls and self._failures >= self.failure_ratio * len(
+                self._outcomes
+            ):
+                self._transition(OPEN)
+
+    def retry_after(self):
+        """Whole seconds until an open breaker lets a probe through."""
+        with self._lock:
+            if self.state != OPEN:
+                return 1
+            remaining = self._opened_at + self.reset_timeout - self.clock()
+            return max(1, math.ceil(remaining))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "recent_calls": len(self._outcomes),
+                "recent_failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+class LatencyTracker:
+    def __init__(
+        self,
+        ceiling,
+        percentile=99,
+        multiplier=3.0,
+        floor=0.25,
+        window=200,
+        min_samples=20,
+    ):
+        self.ceiling = ceiling
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.floor = floor
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._timeout = None
+        self._stale = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self._stale += 1
+
+    def timeout(self):
+        """The read timeout for the next call."""
+        with self._lock:
+            # Re-sorting once a tenth of the window is new follows shifts in
+            # latency without sorting on every call.
+            if len(self._samples) >= self.min_samples and (
+                self._timeout is None or self._stale * 10 >= self._samples.maxlen
+            ):
+                ordered = sorted(self._samples)
+                index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+                self._timeout = min(
+                    self.ceiling, max(self.floor, ordered[index] * self.multiplier)
+                )
+                self._stale = 0
+            return self.ceiling if self._timeout is None else self._timeout
+
+    def stats(self):
+        with self._lock:
+            timeout = self.ceiling if self._timeout is None else self._timeout
+            return {"samples": len(self._samples), "read_timeout_s": round(timeout, 3)}
+
+
+class ConcurrencyLimiter:
+    """At most ``limit`` holders at once; 0 means no limit."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.peak = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a slot without waiting; False when none is free."""
+        with self._lock:
+            if self.limit and self.in_flight >= self.limit:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "peak": self.peak,
+                "rejected": self.rejected,
+            }
+
+
+def shed_load(app, limit, exempt=("health", "health_live", "health_ready", "metrics")):
+    """Answer ``app``'s requests beyond ``limit`` in flight with a 503.
+
+    Endpoints in ``exempt`` are always served, so probes and scrapes still
+    see an overloaded process. Returns the limiter for inspection.
+    """
+    limiter = ConcurrencyLimiter(limit)
+
+    def _admit():
+        if request.endpoint in exempt:
+            return None
+        if not limiter.acquire():
+            REQUESTS_SHED.inc()
+            response = make_response("Service overloaded, try again shortly\n", 503)
+            response.headers["Retry-After"] = "1"
+            response.mimetype = "text/plain"
+            return response
+        g.load_shed_slot = True
+        return None
+
+    def _leave(exc):
+        if g.pop("load_shed_slot", False):
+            limiter.release()
+
+    app.before_request(_admit)
+    app.teardown_request(_leave)
+    return limiter
@@ -0,0 +1,124 @@
+"""Ranked full-text search over SQLite FTS5 indexes.
+
+Each searchable table has an external-content FTS5 table (``posts_fts``,
+``comments_fts``) kept in sync by triggers in the schema files, so the text
+is stored once and the index holds only tokens.
+
+User input is reduced to its words, each quoted, so FTS5 query syntax in
+a search box can never cause an error. All words must match; a word typed
+with a trailing ``*`` matches as a prefix.
+
+Results are ordered by bm25 rank. FTS5 has to score every match before it
+knows the best ones, which takes seconds for words found in most of a
+million rows, so only the newest ``SEARCH_MAX_CANDIDATES`` matches are
+ranked. The ranking is exact for queries with fewer matches; otherwise the
+response says ``"approximate": true``. Pages are numbered slices of the
+ranked candidates.
+
+A table split into shards (``common.sharding``) is searched on every shard:
+the newest candidates are taken across all of them and ranked together. Each
+shard scores with its own term statistics, which agree closely when posts
+are spread evenly by id.
+
+Snippets mark matched terms with ``HIGHLIGHT_START`` and ``HIGHLIGHT_END``.
+These are control characters rather than HTML, so whoever renders a snippet
+escapes it first and then turns the markers into tags.
+"""
+
+import os
+import re
+
+from common.pagination import clamp_per_page
+
+MAX_CANDIDATES = int(os.environ.get("SEARCH_MAX_CANDIDATES", 2000))
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+SNIPPET_TOKENS = 16
+MAX_TERMS = 10
+
+_WORD = re.compile(r"(\w+)(\*?)", re.UNICODE)
+
+
+def match_query(text):
+    """Turn free text into a safe FTS5 MATCH expression, or None if it has
+    no searchable words."""
+    terms = [f'"{word}"{star}' for word, star in _WORD.findall(text or "")[:MAX_TERMS]]
+    return " ".join(terms) or None
+
+
+def search(
+    conn,
+    table,
+    fts_table,
+    text,
+    columns,
+    snippet_column,
+    weights=None,
+    page=1,
+    per_page=None,
+    max_candidates=None,
+):
+    """Return ``{"results", "page", "per_page", "has_more", "approximate"}``
+    for one page of ``table`` rows whose ``fts_table`` entry matches ``text``.
+
+    ``conn`` is a connection, or a list of connections with one shard of
+    ``table`` each. ``snippet_column`` is the index of the FTS column to
+    excerpt and ``weights`` the bm25 weight of each FTS column.
+    """
+    conns = conn if isinstance(conn, list) else [conn]
+    per_page = clamp_per_page(per_page)
+    page = max(1, page or 1)
+    max_candidates = max_candidates or MAX_CANDIDATES
+    result = {
+        "results": [],
+        "page": page,
+        "per_page": per_page,
+        "has_more": False,
+        "approximate": False,
+    }
+    query = match_query(text)
+    if query is None:
+        return result
+
+    # FTS5 walks the index newest-first and stops at the limit, so only the
+    # candidates are scored.
+    score = f"bm25({fts_table}{''.join(f', {w}' for w in weights or ())})"
+    candidates = []
+    for conn in conns:
+        candidates.extend(
+            conn.execute(
+                f"SELECT rowid, {score} FROM {fts_table} WHERE {fts_table} MATCH ? "
+                f"ORDER BY rowid DESC LIMIT ?",
+                (query, max_candidates + 1),
+            ).fetchall()
+        )
+    if len(conns) > 1:
+        candidates.sort(key=lambda row: row[0], reverse=True)
+    result["approximate"] = len(candidates) > max_candidates
+    candidates = sorted(candidates[:max_candidates], key=lambda row: row[1])
+    scores = dict(candidates[(page - 1) * per_page : page * per_page])
+    result["has_more"] = len(candidates) > page * per_page
+    if not scores:
+        return result
+
+    # Snippets are only built for the page shown.
+    select = ", ".join(f"t.{column}" for column in columns)
+    rows = []
+    for conn in conns:
+        rows.extend(
+            conn.execute(
+                f"SELECT {fts_table}.rowid AS fts_rowid, {select}, "
+                f"snippet({fts_table}, {snippet_column}, ?, ?, '…', "
+                f"{SNIPPET_TOKENS}) AS snippet "
+                f"FROM {fts_table} JOIN {table} t ON t.id = {fts_table}.rowid "
+                f"WHERE {fts_table} MATCH ? "
+                f"AND {fts_table}.rowid IN ({','.join('?' * len(scores))})",
+                (HIGHLIGHT_START, HIGHLIGHT_END, query, *scores),
+            ).fetchall()
+        )
+    for row in rows:
+        item = dict(row)
+        item["score"] = scores[item.pop("fts_rowid")]
+        result["results"].append(item)
+    result["results"].sort(key=lambda item: item["score"])
+    return result
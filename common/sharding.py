@@ -0,0 +1,177 @@
+"""A table split by id across several SQLite files.
+
+Shard ``i`` of ``n`` holds the rows whose ``id % n == i``. Shard 0 is the
+original file and the others sit beside it with the shard number before the
+extension (``database.db``, ``database-1.db``, ...), so a single shard is
+the file the service always used. Doubling ``n`` splits every shard in two
+without moving rows between the existing ones: a row of shard ``i`` either
+stays or moves to ``i + n`` (``shard_split.py`` does this).
+
+Each shard file records its place in a ``shard_layout`` table, and
+``ShardSet.check_layout`` refuses to serve files that do not match the
+configured count.
+
+With more than one shard, ids come from an ``IdAllocator``: a counter in
+its own small SQLite file, advanced a block at a time under a write lock and
+handed out from memory, so ids stay unique across shards and processes and
+the counter is written once per block rather than once per insert. Blocks
+of consecutive ids also spread each process's inserts evenly over the
+shards.
+
+    SHARD_ID_BLOCK  ids reserved per counter update (default 100)
+"""
+
+import contextlib
+import os
+import threading
+
+from common import db
+
+ID_BLOCK = int(os.environ.get("SHARD_ID_BLOCK", 100))
+
+
+def shard_paths(path, count):
+    """The file of each of ``count`` shards whose first shard is ``path``."""
+    root, ext = os.path.splitext(path)
+    return [path] + [f"{root}-{index}{ext}" for index in range(1, count)]
+
+
+def read_layout(conn):
+    """``(shard, count)`` recorded in a shard file; ``(0, 1)`` for a file
+    that predates sharding."""
+    table = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'shard_layout'"
+    ).fetchone()
+    row = table and conn.execute("SELECT shard, count FROM shard_layout").fetchone()
+    return tuple(row) if row else (0, 1)
+
+
+class IdAllocator:
+    """Ids for ``name`` from the counter file at ``path``.
+
+    ``floor()`` returns one past the highest id already stored; a block never
+    starts below it, so a counter file older than the data cannot hand out
+    ids that are in use. Ids are unique but, with several processes each
+    working through its own block, not in insertion order, so listings
+    must not page on id alone (see ``pagination.CursorNotFound``).
+    """
+
+    def __init__(self, path, name, floor, block=ID_BLOCK):
+        self.pool = db.ConnectionPool(path, size=1)
+        self.name = name
+        self.floor = floor
+        self.block = block
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = self._end = 0
+
+    def next_id(self):
+        with self._lock:
+            # A forked child must not hand out its parent's block.
+            if self._pid != os.getpid() or self._next >= self._end:
+                self._next, self._end = self._reserve()
+                self._pid = os.getpid()
+            self._next += 1
+            return self._next - 1
+
+    def _reserve(self):
+        with self.pool.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS id_blocks "
+                "(name TEXT PRIMARY KEY, next_id INTEGER NOT NULL)"
+            )
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT next_id FROM id_blocks WHERE name = ?", (self.name,)
+            ).fetchone()
+            start = max(row[0] if row else 1, self.floor())
+            conn.execute(
+                "INSERT OR REPLACE INTO id_blocks (name, next_id) VALUES (?, ?)",
+                (self.name, start + self.block),
+            )
+        return start, start + self.block
+
+
+class ShardSet:
+    """Connection pools for the ``count`` shards of ``table`` starting at
+    ``path``; ``pool_options`` go to each ``db.ConnectionPool``. The id
+    counter lives in ``id_path``, by default ``ids.db`` beside ``path``."""
+
+    def __init__(self, path, count, table, id_path=None, **pool_options):
+        self.table = table
+        id_path = id_path or os.path.join(os.path.dirname(path), "ids.db")
+        self.pools = [
+            db.ConnectionPool(shard, **pool_options)
+            for shard in shard_paths(path, count)
+        ]
+        self.allocator = IdAllocator(id_path, table, self._floor) if count > 1 else None
+
+    def __len__(self):
+        return len(self.pools)
+
+    def pool_for(self, row_id):
+        """The pool of the shard holding ``row_id``; ``None`` means the first
+        shard, where SQLite assigns the id."""
+        if row_id is None:
+            return self.pools[0]
+        return self.pools[row_id % len(self.pools)]
+
+    def connection(self, row_id):
+        return self.pool_for(row_id).connection()
+
+    @contextlib.contextmanager
+    def connections(self):
+        """One connection per shard, in shard order, for scatter-gather reads.
+
+        Shards are always acquired in the same order, so two callers never
+        wait on each other's connections.
+        """
+        with contextlib.ExitStack() as stack:
+            yield [stack.enter_context(pool.connection()) for pool in self.pools]
+
+    def group(self, ids):
+        """``{pool: [ids]}`` for the shards holding ``ids``."""
+        groups = {}
+        for row_id in ids:
+            groups.setdefault(self.pool_for(row_id), []).append(row_id)
+        return groups
+
+    def new_id(self):
+        """An id for a new row, or None with one shard."""
+        if self.allocator is None:
+            return None
+        return self.allocator.next_id()
+
+    def _floor(self):
+        with self.connections() as conns:
+            return 1 + max(
+                conn.execute(
+                    f"SELECT MAX(COALESCE((SELECT MAX(id) FROM {self.table}), 0), "
+                    "COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0))",
+                    (self.table,),
+                ).fetchone()[0]
+                for conn in conns
+            )
+
+    def check_layout(self):
+        """Raise RuntimeError unless every shard file records its own place
+        in this many shards."""
+        for index, pool in enumerate(self.pools):
+            if index and not os.path.exists(pool.path):
+                raise RuntimeError(
+                    f"{pool.path} is missing; split shards with shard_split.py"
+                )
+            with pool.connection() as conn:
+                layout = read_layout(conn)
+            if layout != (index, len(self.pools)):
+                raise RuntimeError(
+                    f"{pool.path} holds shard {layout[0]} of {layout[1]}, "
+                    f"not {index} of {len(self.pools)}"
+                )
+
+    def start_checkpointer(self):
+        for pool in self.pools:
+            pool.start_checkpointer()
+
+    def stats(self):
+        return [pool.stats() for pool in self.pools]
@@ -0,0 +1,108 @@
+"""Coalescing of concurrent identical reads, with an optional micro-cache.
+
+``Group.do(key, fn)`` runs ``fn`` once for every caller that asks for
+``key`` while it is running: the first caller makes the call and the
+others wait for its result, or its exception. When a post is suddenly
+popular, a burst of identical reads costs the service behind it one call
+instead of one each.
+
+Given a ``cache`` (an ``LRUCache`` with a short ``ttl``), results that
+``cacheable`` accepts are also kept, so reads arriving just after a call
+finished are served without one. A writer calls ``forget(key)`` once its
+write is done. That drops the cached result and detaches the call in
+flight, which may have read the old row: later callers start a new call,
+and the detached one's result is not cached.
+"""
+
+import threading
+
+from common import metrics
+
+SINGLEFLIGHT_CALLS = metrics.Counter(
+    "singleflight_calls",
+    "Reads by group and how they were served: called, shared or cached.",
+    ("group", "outcome"),
+)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "forgotten")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.forgotten = False
+
+
+class Group:
+    def __init__(self, name, cache=None, cacheable=lambda result: True):
+        self.name = name
+        self.cache = cache
+        self.cacheable = cacheable
+        self.called = 0
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """``fn()``'s result, shared with concurrent callers of ``key``."""
+        if self.cache is not None:
+            result = self.cache.get(key)
+            if result is not None:
+                SINGLEFLIGHT_CALLS.inc(self.name, "cached")
+                return result
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.called += 1
+            else:
+                self.shared += 1
+        if not leader:
+            SINGLEFLIGHT_CALLS.inc(self.name, "shared")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        SINGLEFLIGHT_CALLS.inc(self.name, "called")
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                if (
+                    self.cache is not None
+                    and call.error is None
+                    and not call.forgotten
+                    and self.cacheable(call.result)
+                ):
+                    self.cache.set(key, call.result)
+            call.done.set()
+
+    def forget(self, key):
+        """Make the next ``do(key, ...)`` call ``fn`` again."""
+        with self._lock:
+            call = self._calls.pop(key, None)
+            if call is not None:
+                call.forgotten = True
+            if self.cache is not None:
+                self.cache.pop(key)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "called": self.called,
+                "shared": self.shared,
+                "in_flight": len(self._calls),
+            }
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
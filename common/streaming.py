@@ -0,0 +1,86 @@
+"""Streamed responses and byte-for-byte proxying.
+
+``ndjson_response`` sends rows as newline-delimited JSON, one chunked write
+per batch, so a listing of any size costs one batch of memory and the first
+rows leave before the last are read. Headers have gone out by the time a
+later batch can fail, so a failure ends the stream with an
+``{"error": ...}`` line. Clients must treat a stream that ends that way as
+incomplete.
+
+``passthrough`` relays a downstream ``requests`` response to the client
+as it arrives, without decoding it. A service uses it when it has nothing
+to add to the body, which saves a JSON decode and re-encode per hop.
+Request it with ``stream=True`` so the body is not buffered first, and
+check it with ``checked``, which closes a failed response before raising.
+``relay`` does the same for a response that was read in full, e.g. one
+shared between callers, and answers 304 itself when the caller's
+validators match.
+"""
+
+import json
+import logging
+
+from flask import Response, request
+
+NDJSON_TYPE = "application/x-ndjson"
+
+# Downstream headers worth forwarding along with a relayed body.
+PASSTHROUGH_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Vary")
+
+
+def _ndjson_chunks(batches):
+    try:
+        for batch in batches:
+            yield "".join(json.dumps(row) + "\n" for row in batch).encode()
+    except Exception as e:
+        logging.error(f"Stream failed: {str(e)}")
+        yield json.dumps({"error": "Stream interrupted"}).encode() + b"\n"
+
+
+def ndjson_response(batches):
+    """Stream an iterable of row-dict lists as NDJSON."""
+    return Response(_ndjson_chunks(batches), content_type=NDJSON_TYPE)
+
+
+def _relay(upstream):
+    # chunk_size=None yields each chunk as it arrives rather than waiting
+    # to fill a fixed size.
+    try:
+        yield from upstream.iter_content(chunk_size=None)
+    finally:
+        # Returns the connection to the pool even if the client went away.
+        upstream.close()
+
+
+def _headers(upstream):
+    return {
+        name: upstream.headers[name]
+        for name in PASSTHROUGH_HEADERS
+        if name in upstream.headers
+    }
+
+
+def checked(upstream):
+    """``upstream`` if it succeeded. Otherwise close it, so a streamed body
+    does not hold its pooled connection, and raise its ``HTTPError``."""
+    try:
+        upstream.raise_for_status()
+    except Exception:
+        upstream.close()
+        raise
+    return upstream
+
+
+def passthrough(upstream):
+    """Relay ``upstream``'s status, content type and body bytes untouched."""
+    return Response(
+        _relay(upstream), status=upstream.status_code, headers=_headers(upstream)
+    )
+
+
+def relay(upstream):
+    """Relay a fully read ``upstream`` response, or a 304 for it."""
+    response = Response(
+        upstream.content, status=upstream.status_code, headers=_headers(upstream)
+    )
+    return response.make_conditional(request)
@@ -0,0 +1,91 @@
+"""In-process verification of the HS256 tokens issued by auth_service.
+
+Services share ``JWT_SECRET_KEY`` with auth_service and verify tokens
+locally instead of calling ``/validate`` on every write. Verified tokens are
+kept in a bounded LRU cache until their ``exp`` claim passes.
+
+    TOKEN_VALIDATION      "local" (default) or "remote" to always ask auth_service
+    TOKEN_REMOTE_FALLBACK "1" to ask auth_service when local verification fails
+    TOKEN_CACHE_SIZE      number of verified tokens to keep (default 10000)
+"""
+
+import logging
+import os
+import time
+
+import jwt
+import requests
+
+from common import wire
+from common.cache import LRUCache
+
+JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "your-secret-key")
+JWT_ALGORITHM = "HS256"
+TOKEN_VALIDATION = os.environ.get("TOKEN_VALIDATION", "local")
+TOKEN_REMOTE_FALLBACK = os.environ.get("TOKEN_REMOTE_FALLBACK", "0") == "1"
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 10000))
+
+
+class TokenVerifier:
+    """Verifies tokens and returns the same payload as auth_service
+    ``/validate`` (``valid``, ``user_id``, ``username``), or None."""
+
+    def __init__(
+        self,
+        auth_client=None,
+        secret_key=JWT_SECRET_KEY,
+        mode=TOKEN_VALIDATION,
+        remote_fallback=TOKEN_REMOTE_FALLBACK,
+        cache_size=TOKEN_CACHE_SIZE,
+    ):
+        self.auth_client = auth_client
+        self.secret_key = secret_key
+        self.mode = mode
+        self.remote_fallback = remote_fallback
+        self.cache = LRUCache(cache_size, clock=time.time)
+
+    def verify(self, token):
+        if not token:
+            return None
+        if self.mode == "remote":
+            return self.verify_remote(token)
+
+        user_data = self.cache.get(token)
+        if user_data is not None:
+            return user_data
+
+        try:
+            claims = jwt.decode(
+                token,
+                self.secret_key,
+                algorithms=[JWT_ALGORITHM],
+                options={"require": ["exp"]},
+            )
+        except jwt.ExpiredSignatureError:
+            logging.warning("Expired token")
+            return None
+        except jwt.InvalidTokenError as e:
+            if self.remote_fallback:
+                return self.verify_remote(token)
+            logging.warning(f"Invalid token: {str(e)}")
+            return None
+
+        user_data = {
+            "valid": True,
+            "user_id": claims.get("user_id"),
+            "username": claims.get("username"),
+        }
+        self.cache.set(token, user_data, expires_at=claims.get("exp"))
+        return user_data
+
+    def verify_remote(self, token):
+        if self.auth_client is None:
+            return None
+        try:
+            response = self.auth_client.post("/validate", json={"token": token})
+            if response.status_code == 200:
+                return wire.decode(response)
+            return None
+        except requests.RequestException as e:
+            logging.error(f"Error validating token: {str(e)}")
+            return None
@@ -0,0 +1,209 @@
+"""Trace context propagation and span recording across the services.
+
+Requests carry a W3C ``traceparent`` header
+(``00-<trace id>-<parent span id>-<flags>``). A service that receives one
+continues that trace and honours its sampled flag; otherwise it starts a
+new trace and samples it with probability ``TRACE_SAMPLE_RATE``. The trace
+id is returned to clients in ``X-Trace-Id`` either way.
+
+Sampled traces record a span for every inbound request, outbound call made
+through ``common.http_client`` and SQL statement run on ``common.db``
+connections. Spans are written as JSON lines to ``TRACE_FILE`` when set
+(appended with one ``write`` per span, so several processes can share a
+file) or otherwise logged on the ``trace`` logger. ``trace_waterfall.py``
+reassembles them into per-request waterfalls.
+
+    TRACE_SAMPLE_RATE  fraction of new traces that are recorded (default 0.01)
+    TRACE_FILE         append spans to this file instead of logging them
+
+The current span lives in a context variable, so work handed to another
+thread must carry the context along; use ``ContextThreadPoolExecutor`` for
+fan-out pools.
+"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g, request
+
+HEADER = "traceparent"
+RESPONSE_HEADER = "X-Trace-Id"
+SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 0.01))
+TRACE_FILE = os.environ.get("TRACE_FILE")
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current = contextvars.ContextVar("trace_span", default=None)
+_service = "unknown"
+_fd = None
+_fd_pid = None
+_fd_lock = threading.Lock()
+logger = logging.getLogger("trace")
+
+
+class Span:
+    __slots__ = (
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "sampled",
+        "name",
+        "kind",
+        "attrs",
+        "start",
+        "_start_perf",
+    )
+
+    def __init__(self, trace_id, parent_id, sampled, name, kind, attrs):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.name = name
+        self.kind = kind
+        self.attrs = attrs
+        self.start = time.time()
+        self._start_perf = time.perf_counter()
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def end(self):
+        if self.sampled:
+            _emit(self, time.perf_counter() - self._start_perf)
+
+
+def _emit(span, duration, start=None):
+    record = {
+        "trace_id": span.trace_id,
+        "span_id": span.span_id,
+        "parent_id": span.parent_id,
+        "service": _service,
+        "name": span.name,
+        "kind": span.kind,
+        "start": round(span.start if start is None else start, 6),
+        "duration_ms": round(duration * 1000, 3),
+        **span.attrs,
+    }
+    line = json.dumps(record, default=str)
+    if TRACE_FILE:
+        _write(line + "\n")
+    else:
+        logger.info(line)
+
+
+def _write(line):
+    global _fd, _fd_pid
+    if _fd is None or _fd_pid != os.getpid():
+        with _fd_lock:
+            if _fd is None or _fd_pid != os.getpid():
+                _fd = os.open(TRACE_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+                _fd_pid = os.getpid()
+    try:
+        os.write(_fd, line.encode())
+    except OSError as e:
+        logging.warning(f"Could not write span to {TRACE_FILE}: {str(e)}")
+
+
+def current():
+    return _current.get()
+
+
+def headers():
+    """Headers that continue the current trace on an outbound request."""
+    span = _current.get()
+    return {HEADER: span.traceparent()} if span is not None else {}
+
+
+@contextlib.contextmanager
+def span(name, kind="internal", **attrs):
+    """Record a child span of the current one for the ``with`` block.
+
+    Yields the new span (made current for the block), the current one when
+    the trace is not sampled, or ``None`` outside a trace. Attributes set
+    on ``span.attrs`` inside the block are recorded.
+    """
+    parent = _current.get()
+    if parent is None or not parent.sampled:
+        yield parent
+        return
+    child = Span(parent.trace_id, parent.span_id, True, name, kind, attrs)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        child.end()
+
+
+def record(name, kind, duration, **attrs):
+    """Record a leaf span that ended just now and took ``duration`` seconds."""
+    parent = _current.get()
+    if parent is None or not parent.sampled:
+        return
+    leaf = Span(parent.trace_id, parent.span_id, True, name, kind, attrs)
+    _emit(leaf, duration, start=time.time() - duration)
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """Thread pool that runs each task in a copy of the submitter's context,
+    so calls made from pool threads stay in the submitting request's trace."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def _before_request():
+    match = _TRACEPARENT.match(request.headers.get(HEADER, ""))
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        sampled = bool(int(flags, 16) & 1)
+    else:
+        trace_id, parent_id = os.urandom(16).hex(), None
+        sampled = random.random() < SAMPLE_RATE
+    rule = request.url_rule.rule if request.url_rule else request.path
+    server_span = Span(
+        trace_id, parent_id, sampled, f"{request.method} {rule}", "server", {}
+    )
+    g.trace_token = _current.set(server_span)
+
+
+def _after_request(response):
+    server_span = _current.get()
+    if server_span is not None:
+        server_span.attrs["status"] = response.status_code
+        response.headers[RESPONSE_HEADER] = server_span.trace_id
+    return response
+
+
+def _teardown_request(exc):
+    token = g.pop("trace_token", None)
+    if token is None:
+        return
+    server_span = _current.get()
+    if exc is not None:
+        server_span.attrs["error"] = type(exc).__name__
+    _current.reset(token)
+    server_span.end()
+
+
+def instrument(app, service):
+    """Continue or start a trace for every request ``app`` serves and name
+    this process's spans ``service``."""
+    global _service
+    _service = service
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    return app
@@ -0,0 +1,254 @@
+"""Content negotiation between the services: JSON or MessagePack.
+
+Internal endpoints answer in MessagePack when the caller's ``Accept``
+header asks for ``application/x-msgpack`` and in JSON otherwise, and
+callers decode by the response's ``Content-Type``. So a process that
+switches format keeps working with peers that have not. ``common.http_client``
+asks for, and sends request bodies in, the format chosen by
+``INTERNAL_WIRE_FORMAT``:
+
+    INTERNAL_WIRE_FORMAT  json (default) or msgpack
+
+The codec is a stdlib MessagePack subset: nil, booleans, integers up to 64
+bits, doubles, str, bin, arrays and maps. Strings go out as raw UTF-8
+behind a length prefix, so text and HTML carry no escaping.
+"""
+
+import os
+import struct
+
+from flask import Response, jsonify, request
+
+MSGPACK_TYPE = "application/x-msgpack"
+FORMAT = os.environ.get("INTERNAL_WIRE_FORMAT", "json")
+
+
+class DecodeError(ValueError):
+    pass
+
+
+_pack_b = struct.Struct(">B").pack
+_pack_h = struct.Struct(">BH").pack
+_pack_i = struct.Struct(">BI").pack
+_pack_q = struct.Struct(">BQ").pack
+_pack_bb = struct.Struct(">BB").pack
+_pack_sb = struct.Struct(">Bb").pack
+_pack_sh = struct.Struct(">Bh").pack
+_pack_si = struct.Struct(">Bi").pack
+_pack_sq = struct.Struct(">Bq").pack
+_pack_d = struct.Struct(">Bd").pack
+
+
+def _length(out, n, fix_base, fix_max, code8, code16, code32):
+    if n <= fix_max:
+        out.append(_pack_b(fix_base | n))
+    elif code8 is not None and n < 0x100:
+        out.append(_pack_bb(code8, n))
+    elif n < 0x10000:
+        out.append(_pack_h(code16, n))
+    else:
+        out.append(_pack_i(code32, n))
+
+
+def _pack(obj, out):
+    t = type(obj)
+    if t is str:
+        data = obj.encode()
+        _length(out, len(data), 0xA0, 31, 0xD9, 0xDA, 0xDB)
+        out.append(data)
+    elif t is int:
+        if 0 <= obj < 0x80:
+            out.append(_pack_b(obj))
+        elif -32 <= obj < 0:
+            out.append(_pack_b(obj & 0xFF))
+        elif 0 <= obj < 0x10000:
+            out.append(_pack_bb(0xCC, obj) if obj < 0x100 else _pack_h(0xCD, obj))
+        elif 0 <= obj < 0x100000000:
+            out.append(_pack_i(0xCE, obj))
+        elif obj >= 0:
+            out.append(_pack_q(0xCF, obj))
+        elif obj >= -0x80:
+            out.append(_pack_sb(0xD0, obj))
+        elif obj >= -0x8000:
+            out.append(_pack_sh(0xD1, obj))
+        elif obj >= -0x80000000:
+            out.append(_pack_si(0xD2, obj))
+        else:
+            out.append(_pack_sq(0xD3, obj))
+    elif t is dict:
+        _length(out, len(obj), 0x80, 15, None, 0xDE, 0xDF)
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    elif t is list or t is tuple:
+        _length(out, len(obj), 0x90, 15, None, 0xDC, 0xDD)
+        for item in obj:
+            _pack(item, out)
+    elif obj is None:
+        out.append(b"\xc0")
+    elif t is bool:
+        out.append(b"\xc3" if obj else b"\xc2")
+    elif t is float:
+        out.append(_pack_d(0xCB, obj))
+    elif t is bytes:
+        _length(out, len(obj), 0, -1, 0xC4, 0xC5, 0xC6)
+        out.append(obj)
+    elif isinstance(obj, dict):
+        _pack(dict(obj), out)
+    elif isinstance(obj, str):
+        _pack(str(obj), out)
+    else:
+        raise TypeError(f"Cannot encode {t.__name__}")
+
+
+def packb(obj):
+    out = []
+    _pack(obj, out)
+    return b"".join(out)
+
+
+_unpack_from = struct.unpack_from
+
+
+def _unpack(data, i):
+    code = data[i]
+    i += 1
+    if code <= 0x7F:
+        return code, i
+    if 0xA0 <= code <= 0xBF:
+        end = i + (code & 0x1F)
+        return data[i:end].decode(), end
+    if 0x80 <= code <= 0x8F:
+        return _unpack_map(data, i, code & 0x0F)
+    if 0x90 <= code <= 0x9F:
+        return _unpack_array(data, i, code & 0x0F)
+    if code >= 0xE0:
+        return code - 0x100, i
+    if code == 0xC0:
+        return None, i
+    if code == 0xC2:
+        return False, i
+    if code == 0xC3:
+        return True, i
+    if code in _STR:
+        fmt, size = _STR[code]
+        (n,) = _unpack_from(fmt, data, i)
+        i += size
+        return data[i : i + n].decode(), i + n
+    if code in _NUMBERS:
+        fmt, size = _NUMBERS[code]
+        return _unpack_from(fmt, data, i)[0], i + size
+    if code in _BIN:
+        fmt, size = _BIN[code]
+        (n,) = _unpack_from(fmt, data, i)
+        i += size
+        return bytes(data[i : i + n]), i + n
+    if code in _CONTAINERS:
+        fmt, size, unpack = _CONTAINERS[code]
+        (n,) = _unpack_from(fmt, data, i)
+        return unpack(data, i + size, n)
+    raise DecodeError(f"Unsupported type byte 0x{code:02x}")
+
+
+def _unpack_map(data, i, n):
+    result = {}
+    for _ in range(n):
+        # Keys are nearly always short strings; skip the dispatch for them.
+        code = data[i]
+        if 0xA0 <= code <= 0xBF:
+            end = i + 1 + (code & 0x1F)
+            key = data[i + 1 : end].decode()
+            i = end
+        else:
+            key, i = _unpack(data, i)
+        result[key], i = _unpack(data, i)
+    return result, i
+
+
+def _unpack_array(data, i, n):
+    result = []
+    for _ in range(n):
+        item, i = _unpack(data, i)
+        result.append(item)
+    return result, i
+
+
+_STR = {0xD9: (">B", 1), 0xDA: (">H", 2), 0xDB: (">I", 4)}
+_BIN = {0xC4: (">B", 1), 0xC5: (">H", 2), 0xC6: (">I", 4)}
+_NUMBERS = {
+    0xCA: (">f", 4),
+    0xCB: (">d", 8),
+    0xCC: (">B", 1),
+    0xCD: (">H", 2),
+    0xCE: (">I", 4),
+    0xCF: (">Q", 8),
+    0xD0: (">b", 1),
+    0xD1: (">h", 2),
+    0xD2: (">i", 4),
+    0xD3: (">q", 8),
+}
+_CONTAINERS = {
+    0xDC: (">H", 2, _unpack_array),
+    0xDD: (">I", 4, _unpack_array),
+    0xDE: (">H", 2, _unpack_map),
+    0xDF: (">I", 4, _unpack_map),
+}
+
+
+def unpackb(data):
+    try:
+        obj, end = _unpack(data, 0)
+    except (IndexError, struct.error, UnicodeDecodeError) as e:
+        raise DecodeError(f"Truncated or malformed MessagePack: {str(e)}") from e
+    if end != len(data):
+        raise DecodeError("Trailing bytes after MessagePack value")
+    return obj
+
+
+def _is_msgpack(content_type):
+    return (content_type or "").split(";")[0].strip() == MSGPACK_TYPE
+
+
+def negotiated():
+    """The content type ``respond`` will use for the current request."""
+    accept = request.accept_mimetypes
+    if accept[MSGPACK_TYPE] > accept["application/json"]:
+        return MSGPACK_TYPE
+    return "application/json"
+
+
+def respond(obj, status=200):
+    """``jsonify`` unless the caller prefers MessagePack."""
+    if negotiated() == MSGPACK_TYPE:
+        return Response(packb(obj), status=status, content_type=MSGPACK_TYPE)
+    return jsonify(obj), status
+
+
+def request_data():
+    """The request body decoded by its content type, or None."""
+    if _is_msgpack(request.content_type):
+        try:
+            return unpackb(request.get_data())
+        except DecodeError:
+            return None
+    return request.get_json(silent=True)
+
+
+def decode(response):
+    """Decode a ``requests`` response by its content type."""
+    if _is_msgpack(response.headers.get("Content-Type")):
+        return unpackb(response.content)
+    return response.json()
+
+
+def outbound(kwargs):
+    """Adapt ``requests`` keyword arguments to ``FORMAT``: ask for it in
+    ``Accept`` and send a ``json=`` body in it."""
+    if FORMAT != "msgpack":
+        return kwargs
+    headers = {"Accept": f"{MSGPACK_TYPE}, application/json;q=0.9"}
+    if kwargs.get("json") is not None:
+        kwargs["data"] = packb(kwargs.pop("json"))
+        headers["Content-Type"] = MSGPACK_TYPE
+    kwargs["headers"] = {**headers, **(kwargs.get("headers") or {})}
+    return kwargs
@@ -0,0 +1,80 @@
+"""Check db_service's in-memory front-page feed against the posts table.
+
+Walks the listing the way a reader pages through it: forward from the
+first page with ``after`` cursors for ``--pages`` pages, then back with
+``before`` cursors. Each page is fetched twice, as served (from the feed
+where it covers the page) and with ``source=query``, which always queries
+the shards. Prints every page that differs and exits 1 if any did.
+``--rebuild`` then asks db_service to reload the feed and checks again.
+
+    python feed_check.py
+    python feed_check.py --url http://db-service:5001 --pages 30 --rebuild
+"""
+
+import argparse
+import sys
+
+import requests
+
+
+def fetch(url, params):
+    response = requests.get(f"{url}/posts", params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+def check(url, pages, per_page):
+    """Return the pages (as request params) whose two answers differ."""
+    mismatches = []
+    visited = 0
+
+    def compare(params):
+        nonlocal visited
+        visited += 1
+        served = fetch(url, params)
+        queried = fetch(url, {**params, "source": "query"})
+        if served != queried:
+            mismatches.append(params)
+            served_ids = [post["id"] for post in served["posts"]]
+            queried_ids = [post["id"] for post in queried["posts"]]
+            if served_ids == queried_ids:
+                print(f"Mismatch at {params}: same posts, different contents")
+            else:
+                print(f"Mismatch at {params}: feed {served_ids}, query {queried_ids}")
+        return queried
+
+    params = {"per_page": per_page}
+    for _ in range(pages):
+        page = compare(params)
+        if page["next_cursor"] is None:
+            break
+        params = {"per_page": per_page, "after": page["next_cursor"]}
+    while page["prev_cursor"] is not None:
+        page = compare({"per_page": per_page, "before": page["prev_cursor"]})
+    print(f"Checked {visited} pages of {per_page} posts.")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:5001")
+    parser.add_argument("--pages", type=int, default=25)
+    parser.add_argument("--per-page", type=int, default=10)
+    parser.add_argument(
+        "--rebuild", action="store_true", help="reload the feed after a mismatch"
+    )
+    args = parser.parse_args()
+
+    mismatches = check(args.url, args.pages, args.per_page)
+    if mismatches and args.rebuild:
+        requests.post(f"{args.url}/posts/feed/rebuild").raise_for_status()
+        print("Feed rebuilt; checking again.")
+        mismatches = check(args.url, args.pages, args.per_page)
+    if mismatches:
+        print(f"{len(mismatches)} page(s) differ.")
+        sys.exit(1)
+    print("The feed matches the posts table.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,10 @@
-import sqlite3
+"""Create database.db, comments.db and users.db with a small sample dataset.
 
-connection = sqlite3.connect('database.db')
+For larger datasets or CSV imports use ``bulk_load.py`` directly.
+"""
 
+import bulk_load
 
-with open('schema.sql') as f:
-    connection.executescript(f.read())
-
-cur = connection.cursor()
-
-cur.execute("INSERT INTO posts (title, content) VALUES (?, ?)",
-            ('First Post', 'Content for the first post')
-            )
-
-cur.execute("INSERT INTO posts (title, content) VALUES (?, ?)",
-            ('Second Post', 'Content for the second post')
-            )
-
-connection.commit()
-connection.close()
+if __name__ == "__main__":
+    for row in bulk_load.load(".", users=20, posts=50, comments=300):
+        print(f"{row['table']}: {row['rows']} rows")
@@ -1,8 +1,56 @@
+DROP TABLE IF EXISTS posts_fts;
 DROP TABLE IF EXISTS posts;
+DROP TABLE IF EXISTS shard_layout;
 
 CREATE TABLE posts (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    -- Bumped on every edit; readers derive ETags and Last-Modified from them.
+    updated TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    version INTEGER NOT NULL DEFAULT 1,
     title TEXT NOT NULL,
     content TEXT NOT NULL
 );
+
+CREATE INDEX idx_posts_created_id ON posts (created, id);
+
+-- Which shard of how many this file is (see common/sharding.py).
+-- shard_split.py rewrites it.
+CREATE TABLE shard_layout (
+    shard INTEGER NOT NULL,
+    count INTEGER NOT NULL
+);
+INSERT INTO shard_layout (shard, count) VALUES (0, 1);
+
+-- Full-text index over posts. It reads the text from the posts table
+-- (external content), so only the index itself is stored twice.
+CREATE VIRTUAL TABLE posts_fts USING fts5(
+    title, content, content='posts', content_rowid='id',
+    tokenize='porter unicode61', prefix='2 3'
+);
+
+CREATE TRIGGER posts_fts_insert AFTER INSERT ON posts
+BEGIN
+    INSERT INTO posts_fts (rowid, title, content)
+    VALUES (NEW.id, NEW.title, NEW.content);
+END;
+
+CREATE TRIGGER posts_fts_delete AFTER DELETE ON posts
+BEGIN
+    INSERT INTO posts_fts (posts_fts, rowid, title, content)
+    VALUES ('delete', OLD.id, OLD.title, OLD.content);
+END;
+
+CREATE TRIGGER posts_version_update AFTER UPDATE OF title, content ON posts
+BEGIN
+    UPDATE posts SET version = OLD.version + 1, updated = CURRENT_TIMESTAMP
+    WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER posts_fts_update AFTER UPDATE OF title, content ON posts
+BEGIN
+    INSERT INTO posts_fts (posts_fts, rowid, title, content)
+    VALUES ('delete', OLD.id, OLD.title, OLD.content);
+    INSERT INTO posts_fts (rowid, title, content)
+    VALUES (NEW.id, NEW.title, NEW.content);
+END;
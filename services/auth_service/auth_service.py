@@ -1,36 +1,142 @@
-from flask import Flask, request, jsonify
+from flask import Flask, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
 import jwt
 import datetime
 import logging
+import multiprocessing
+import os
+import sys
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common import db, health, metrics, tracing, wire  # noqa: E402
 
 app = Flask(__name__)
-app.config["SECRET_KEY"] = "your-secret-key"
+metrics.instrument(app)
+tracing.instrument(app, "auth")
+app.config["SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "your-secret-key")
 logging.basicConfig(level=logging.INFO)
 
+db_pool = db.ConnectionPool("users.db")
+db_pool.start_checkpointer()
+
 
 def get_db_connection():
-    conn = sqlite3.connect("users.db")
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_pool.connection()
 
 
-@app.route("/health", methods=["GET"])
-def health_check():
+def cpu_allowance():
+    # Honour the container CPU limit (cgroup v2) rather than the host's cores.
     try:
-        conn = get_db_connection()
-        conn.execute("SELECT 1").fetchone()
-        conn.close()
-        return jsonify({"status": "healthy"}), 200
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, int(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else 1
+
+
+# Password hashing is deliberately CPU-heavy, so it runs in a process pool
+# sized to the pod's CPU allowance instead of in request threads. Requests
+# beyond the workers plus HASH_QUEUE_SIZE waiting jobs are rejected with 503.
+# HASH_WORKERS=0 hashes inline.
+HASH_WORKERS = int(os.environ.get("AUTH_HASH_WORKERS", cpu_allowance()))
+HASH_QUEUE_SIZE = int(os.environ.get("AUTH_HASH_QUEUE_SIZE", 16))
+HASH_TIMEOUT = float(os.environ.get("AUTH_HASH_TIMEOUT", 10))
+HASH_METHOD = "pbkdf2:sha256:" + os.environ.get("AUTH_HASH_ITERATIONS", "260000")
+
+hash_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE_SIZE)
+hash_executor = None
+hash_executor_lock = threading.Lock()
+
+
+class HashQueueFull(Exception):
+    pass
+
+
+class HashTimeout(HashQueueFull):
+    """The job outlasted HASH_TIMEOUT; it keeps its slot until it ends."""
+
+
+def run_hash_job(fn, *args):
+    global hash_executor
+    if HASH_WORKERS == 0:
+        return fn(*args)
+    if not hash_slots.acquire(blocking=False):
+        raise HashQueueFull()
+    try:
+        with hash_executor_lock:
+            if hash_executor is None:
+                # forkserver avoids forking this multi-threaded process.
+                methods = multiprocessing.get_all_start_methods()
+                hash_executor = ProcessPoolExecutor(
+                    max_workers=HASH_WORKERS,
+                    mp_context=multiprocessing.get_context(
+                        "forkserver" if "forkserver" in methods else "spawn"
+                    ),
+                )
+        future = hash_executor.submit(fn, *args)
+    except BaseException:
+        hash_slots.release()
+        raise
+    # Freed when the job ends rather than when we stop waiting for it, so a
+    # job abandoned on timeout still counts against the queue bound.
+    future.add_done_callback(lambda _: hash_slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except FutureTimeout:
+        raise HashTimeout()
+
+
+def hash_password(password):
+    return run_hash_job(generate_password_hash, password, HASH_METHOD)
+
+
+def verify_password(stored_hash, password):
+    return run_hash_job(check_password_hash, stored_hash, password)
+
+
+def needs_rehash(stored_hash):
+    return stored_hash.split("$", 1)[0] != HASH_METHOD
+
+
+def rehash_password(user_id, password):
+    try:
+        new_hash = hash_password(password)
+        with get_db_connection() as conn:
+            conn.execute(
+                "UPDATE users SET password = ? WHERE id = ?", (new_hash, user_id)
+            )
+    except HashQueueFull:
+        # Try again on a later login.
+        pass
     except Exception as e:
-        logging.error(f"Health check failed: {str(e)}")
-        return jsonify({"status": "unhealthy", "error": str(e)}), 500
+        logging.error(f"Error rehashing password for user {user_id}: {str(e)}")
+
+
+def busy_response():
+    response = jsonify({"message": "Too many concurrent logins, retry shortly"})
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+def check_database():
+    with get_db_connection() as conn:
+        conn.execute("SELECT 1").fetchone()
+
+
+prober = health.Prober()
+prober.check("database", check_database)
+health.instrument(app, prober)
 
 
 @app.route("/register", methods=["POST"])
 def register():
-    data = request.json
+    data = wire.request_data()
     username = data["username"]
     password = data["password"]
 
@@ -39,16 +145,19 @@ def register():
             user = conn.execute(
                 "SELECT * FROM users WHERE username = ?", (username,)
             ).fetchone()
-            if user:
-                return jsonify({"message": "User already exists"}), 400
+        if user:
+            return jsonify({"message": "User already exists"}), 400
 
-            hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
+        with get_db_connection() as conn:
             conn.execute(
                 "INSERT INTO users (username, password) VALUES (?, ?)",
                 (username, hashed_password),
             )
             conn.commit()
         return jsonify({"message": "User created successfully"}), 201
+    except HashQueueFull:
+        return busy_response()
     except Exception as e:
         logging.error(f"Error during registration: {str(e)}")
         return jsonify({"message": "Registration failed"}), 500
@@ -56,7 +165,7 @@ def register():
 
 @app.route("/login", methods=["POST"])
 def login():
-    data = request.json
+    data = wire.request_data()
     username = data["username"]
     password = data["password"]
 
@@ -66,7 +175,13 @@ def login():
                 "SELECT * FROM users WHERE username = ?", (username,)
             ).fetchone()
 
-        if user and check_password_hash(user["password"], password):
+        if user and verify_password(user["password"], password):
+            if needs_rehash(user["password"]):
+                # Upgrade hashes made with outdated parameters in the
+                # background while the password is at hand.
+                threading.Thread(
+                    target=rehash_password, args=(user["id"], password), daemon=True
+                ).start()
             token = jwt.encode(
                 {
                     "user_id": user["id"],
@@ -79,6 +194,8 @@ def login():
             return jsonify({"token": token})
 
         return jsonify({"message": "Invalid credentials"}), 401
+    except HashQueueFull:
+        return busy_response()
     except Exception as e:
         logging.error(f"Error during login: {str(e)}")
         return jsonify({"message": "Login failed"}), 500
@@ -86,7 +203,7 @@ def login():
 
 @app.route("/validate", methods=["POST"])
 def validate_token():
-    token = request.json["token"]
+    token = wire.request_data()["token"]
     try:
         data = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
         return jsonify(
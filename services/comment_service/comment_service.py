@@ -1,75 +1,180 @@
 from flask import Flask, request, jsonify
-import sqlite3
 import logging
-import requests
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common import (  # noqa: E402
+    compression,
+    conditional,
+    db,
+    health,
+    http_client,
+    metrics,
+    pagination,
+    search,
+    tokens,
+    tracing,
+    wire,
+)
 
 app = Flask(__name__)
+metrics.instrument(app)
+tracing.instrument(app, "comment")
+compression.instrument(app)
 logging.basicConfig(level=logging.INFO)
 
-AUTH_SERVICE_URL = "http://localhost:5003"
+AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL", "http://localhost:5003")
+GROUP_COMMIT = os.environ.get("COMMENT_GROUP_COMMIT", "0") == "1"
+
+MAX_STATS_IDS = 100
+
+auth_client = http_client.get_client("auth", AUTH_SERVICE_URL)
+token_verifier = tokens.TokenVerifier(auth_client)
+
+db_pool = db.ConnectionPool("comments.db")
+db_pool.start_checkpointer()
+# Inserts from concurrent requests share commits when enabled.
+comment_writer = db.GroupCommitWriter(db_pool) if GROUP_COMMIT else None
 
 
 def get_db_connection():
-    conn = sqlite3.connect("comments.db")
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_pool.connection()
 
 
 def validate_token(token):
-    try:
-        response = requests.post(f"{AUTH_SERVICE_URL}/validate", json={"token": token})
-        if response.status_code == 200:
-            return response.json()
-        return None
-    except requests.RequestException as e:
-        logging.error(f"Error validating token: {str(e)}")
-        return None
+    return token_verifier.verify(token)
 
 
-@app.route("/health", methods=["GET"])
-def health_check():
-    try:
-        conn = get_db_connection()
+def check_database():
+    with get_db_connection() as conn:
         conn.execute("SELECT 1").fetchone()
-        conn.close()
-        return jsonify({"status": "healthy"}), 200
-    except Exception as e:
-        logging.error(f"Health check failed: {str(e)}")
-        return jsonify({"status": "unhealthy", "error": str(e)}), 500
+
+
+prober = health.Prober()
+prober.check("database", check_database)
+health.instrument(app, prober)
 
 
 @app.route("/comments/<int:post_id>", methods=["GET"])
 def get_comments(post_id):
-    page = request.args.get("page", 1, type=int)
-    per_page = request.args.get("per_page", 10, type=int)
-    offset = (page - 1) * per_page
+    per_page = pagination.clamp_per_page(request.args.get("per_page", type=int))
+    after = request.args.get("after", type=int)
+    before = request.args.get("before", type=int)
 
     try:
         with get_db_connection() as conn:
-            comments = conn.execute(
-                "SELECT * FROM comments WHERE post_id = ? LIMIT ? OFFSET ?",
-                (post_id, per_page, offset),
-            ).fetchall()
-            total = conn.execute(
-                "SELECT COUNT(*) FROM comments WHERE post_id = ?", (post_id,)
-            ).fetchone()[0]
+            # The stats row is read first: a comment added after it makes the
+            # tag stale rather than the body, which is the safe way round.
+            stats = conn.execute(
+                "SELECT comment_count, last_comment_at, version FROM post_stats "
+                "WHERE post_id = ?",
+                (post_id,),
+            ).fetchone()
+            tag = conditional.etag(
+                "comments",
+                post_id,
+                stats["version"] if stats else 0,
+                per_page,
+                after,
+                before,
+            )
+            response = conditional.not_modified(tag)
+            if response is not None:
+                return response
+            page = pagination.fetch_page(
+                conn,
+                "comments",
+                where="post_id = ?",
+                params=(post_id,),
+                per_page=per_page,
+                after=after,
+                before=before,
+                descending=False,
+            )
 
-        return jsonify(
+        return conditional.respond(
             {
-                "comments": [dict(comment) for comment in comments],
-                "total": total,
-                "page": page,
+                "comments": page["items"],
+                "total": stats["comment_count"] if stats else 0,
+                "last_comment_at": stats["last_comment_at"] if stats else None,
                 "per_page": per_page,
-            }
+                "next_cursor": page["next_cursor"],
+                "prev_cursor": page["prev_cursor"],
+            },
+            tag,
         )
     except Exception as e:
         logging.error(f"Error fetching comments: {str(e)}")
         return jsonify({"error": "Failed to fetch comments"}), 500
 
 
+@app.route("/comments/search", methods=["GET"])
+def search_comments():
+    try:
+        with get_db_connection() as conn:
+            page = search.search(
+                conn,
+                "comments",
+                "comments_fts",
+                request.args.get("q", ""),
+                columns=("id", "post_id", "created", "author"),
+                snippet_column=0,
+                page=request.args.get("page", type=int),
+                per_page=request.args.get("per_page", type=int),
+            )
+        return wire.respond(page)
+    except Exception as e:
+        logging.error(f"Error searching comments: {str(e)}")
+        return jsonify({"error": "Failed to search comments"}), 500
+
+
+@app.route("/stats", methods=["GET"])
+def get_stats():
+    try:
+        post_ids = [
+            int(post_id)
+            for post_id in request.args.get("post_ids", "").split(",")
+            if post_id
+        ][:MAX_STATS_IDS]
+    except ValueError:
+        return jsonify({"error": "post_ids must be a comma-separated id list"}), 400
+
+    stats = {
+        str(post_id): {"comment_count": 0, "last_comment_at": None}
+        for post_id in post_ids
+    }
+    if not post_ids:
+        return wire.respond({"stats": stats})
+
+    try:
+        with get_db_connection() as conn:
+            rows = conn.execute(
+                "SELECT post_id, comment_count, last_comment_at, version "
+                "FROM post_stats "
+                f"WHERE post_id IN ({','.join('?' * len(post_ids))})",
+                post_ids,
+            ).fetchall()
+        versions = dict.fromkeys(post_ids, 0)
+        for row in rows:
+            stats[str(row["post_id"])] = {
+                "comment_count": row["comment_count"],
+                "last_comment_at": row["last_comment_at"],
+            }
+            versions[row["post_id"]] = row["version"]
+        tag = conditional.etag("stats", sorted(versions.items()))
+        return conditional.respond({"stats": stats}, tag)
+    except Exception as e:
+        logging.error(f"Error fetching comment stats: {str(e)}")
+        return jsonify({"error": "Failed to fetch comment stats"}), 500
+
+
+INSERT_COMMENT = "INSERT INTO comments (post_id, content, author) VALUES (?, ?, ?)"
+
+
 @app.route("/comments", methods=["POST"])
 def add_comment():
-    data = request.json
+    data = wire.request_data()
     if (
         not data
         or "post_id" not in data
@@ -87,14 +192,14 @@ def add_comment():
         return jsonify({"error": "Unauthorized"}), 401
 
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO comments (post_id, content, author) VALUES (?, ?, ?)",
-                (data["post_id"], data["content"], user_data["username"]),
-            )
-            conn.commit()
-            comment_id = cursor.lastrowid
+        params = (data["post_id"], data["content"], user_data["username"])
+        if comment_writer is not None:
+            comment_id = comment_writer.execute(INSERT_COMMENT, params)
+        else:
+            with get_db_connection() as conn:
+                cursor = conn.execute(INSERT_COMMENT, params)
+                conn.commit()
+                comment_id = cursor.lastrowid
 
         return jsonify({"id": comment_id, "message": "Comment added successfully"}), 201
     except Exception as e:
@@ -104,7 +209,7 @@ def add_comment():
 
 @app.route("/comments/<int:comment_id>", methods=["DELETE"])
 def delete_comment(comment_id):
-    token = request.json.get("token")
+    token = (wire.request_data() or {}).get("token")
     if not token:
         return jsonify({"error": "Token is required"}), 400
 
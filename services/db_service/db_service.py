@@ -1,32 +1,184 @@
-import sqlite3
+import os
+import sys
 from flask import Flask, jsonify, request
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common import (  # noqa: E402
+    compression,
+    conditional,
+    feed,
+    health,
+    metrics,
+    pagination,
+    search,
+    sharding,
+    streaming,
+    tracing,
+    wire,
+)
+
 app = Flask(__name__)
+metrics.instrument(app)
+tracing.instrument(app, "db")
+compression.instrument(app)
 
+SHARD_COUNT = int(os.environ.get("DB_SHARDS", 1))
 
-def get_db_connection():
-    conn = sqlite3.connect("database.db")
-    conn.row_factory = sqlite3.Row
-    return conn
+# Posts are split by id over database.db, database-1.db, ...
+shards = sharding.ShardSet("database.db", SHARD_COUNT, "posts")
+shards.check_layout()
+shards.start_checkpointer()
 
+MAX_IDS = 100
+EXPORT_BATCH_SIZE = int(os.environ.get("DB_SERVICE_EXPORT_BATCH", 500))
+# Newest posts served from memory for the listing's first pages; 0 disables.
+FEED_SIZE = int(os.environ.get("DB_SERVICE_FEED_SIZE", 200))
+
+
+def get_db_connection(post_id=None):
+    return shards.connection(post_id)
+
+
+def newest_posts(limit):
+    return [
+        post
+        for batch in pagination.iter_batches(
+            shards.pools, "posts", limit=limit, batch_size=limit
+        )
+        for post in batch
+    ]
+
+
+front_page = feed.Feed(newest_posts, FEED_SIZE) if FEED_SIZE > 0 else None
 
-@app.route("/health", methods=["GET"])
-def health_check():
-    try:
-        conn = get_db_connection()
-        conn.execute("SELECT 1").fetchone()
-        conn.close()
-        return jsonify({"status": "healthy"}), 200
-    except Exception as e:
-        return jsonify({"status": "unhealthy", "error": str(e)}), 500
+
+def read_post(conn, post_id):
+    post = conn.execute("SELECT * FROM posts WHERE id = ?", (post_id,)).fetchone()
+    return dict(post) if post is not None else None
+
+
+def check_shards():
+    with shards.connections() as conns:
+        for conn in conns:
+            conn.execute("SELECT 1").fetchone()
+    return {"shards": len(shards.pools)}
+
+
+prober = health.Prober()
+prober.check("database", check_shards)
+health.instrument(
+    app,
+    prober,
+    extras=lambda: {"feed": front_page.stats() if front_page else None},
+)
 
 
 @app.route("/posts", methods=["GET"])
 def get_posts():
+    if "ids" in request.args:
+        return get_posts_by_ids()
+    page_args = {
+        "per_page": request.args.get("per_page", type=int),
+        "after": request.args.get("after", type=int),
+        "before": request.args.get("before", type=int),
+    }
+    try:
+        page = None
+        # source=query skips the feed, e.g. for feed_check.py.
+        if front_page is not None and request.args.get("source") != "query":
+            page = front_page.page(**page_args)
+        if page is None:
+            with shards.connections() as conns:
+                page = pagination.fetch_page(
+                    conns, "posts", ordered_ids=shards.allocator is None, **page_args
+                )
+        # Row versions cover edits; ids and cursors cover posts added or
+        # removed around the page.
+        tag = conditional.etag(
+            "posts",
+            [(post["id"], post["version"]) for post in page["items"]],
+            page["next_cursor"],
+            page["prev_cursor"],
+        )
+        return conditional.respond(
+            {
+                "posts": page["items"],
+                "next_cursor": page["next_cursor"],
+                "prev_cursor": page["prev_cursor"],
+            },
+            tag,
+        )
+    except pagination.CursorNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def get_posts_by_ids():
+    try:
+        ids = [int(i) for i in request.args["ids"].split(",") if i][:MAX_IDS]
+    except ValueError:
+        return jsonify({"error": "ids must be a comma-separated id list"}), 400
+    if not ids:
+        return wire.respond({"posts": [], "next_cursor": None, "prev_cursor": None})
     try:
-        with get_db_connection() as conn:
-            posts = conn.execute("SELECT * FROM posts").fetchall()
-        return jsonify([dict(post) for post in posts])
+        rows = []
+        for pool, shard_ids in shards.group(ids).items():
+            with pool.connection() as conn:
+                rows.extend(
+                    conn.execute(
+                        "SELECT * FROM posts "
+                        f"WHERE id IN ({','.join('?' * len(shard_ids))})",
+                        shard_ids,
+                    ).fetchall()
+                )
+        # Keep the requested order; ids that do not exist are left out.
+        by_id = {row["id"]: dict(row) for row in rows}
+        posts = [by_id[i] for i in ids if i in by_id]
+        tag = conditional.etag(
+            "posts", [(post["id"], post["version"]) for post in posts]
+        )
+        return conditional.respond(
+            {"posts": posts, "next_cursor": None, "prev_cursor": None}, tag
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/posts/export", methods=["GET"])
+def export_posts():
+    # Every post, newest first, as NDJSON streamed in keyset batches.
+    try:
+        batches = pagination.iter_batches(
+            shards.pools,
+            "posts",
+            after=request.args.get("after", type=int),
+            limit=request.args.get("limit", type=int),
+            batch_size=EXPORT_BATCH_SIZE,
+            ordered_ids=shards.allocator is None,
+        )
+    except pagination.CursorNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    return streaming.ndjson_response(batches)
+
+
+@app.route("/posts/search", methods=["GET"])
+def search_posts():
+    try:
+        with shards.connections() as conns:
+            page = search.search(
+                conns,
+                "posts",
+                "posts_fts",
+                request.args.get("q", ""),
+                columns=("id", "created", "title"),
+                snippet_column=1,
+                # Title matches count for more than body matches.
+                weights=(10.0, 1.0),
+                page=request.args.get("page", type=int),
+                per_page=request.args.get("per_page", type=int),
+            )
+        return wire.respond(page)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -34,30 +186,38 @@ def get_posts():
 @app.route("/posts/<int:post_id>", methods=["GET"])
 def get_post(post_id):
     try:
-        with get_db_connection() as conn:
-            post = conn.execute(
-                "SELECT * FROM posts WHERE id = ?", (post_id,)
-            ).fetchone()
+        with get_db_connection(post_id) as conn:
+            post = read_post(conn, post_id)
         if post is None:
             return jsonify({"error": "Post not found"}), 404
-        return jsonify(dict(post))
+        return conditional.respond(
+            post,
+            conditional.etag("post", post_id, post["version"]),
+            conditional.timestamp(post["updated"]),
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/posts", methods=["POST"])
 def create_post():
-    if not request.json or "title" not in request.json:
+    data = wire.request_data()
+    if not data or "title" not in data:
         return jsonify({"error": "Bad request"}), 400
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO posts (title, content) VALUES (?, ?)",
-                (request.json["title"], request.json.get("content", "")),
+        # With several shards the id is allocated first, since it picks the
+        # shard; with one, SQLite assigns it.
+        post_id = shards.new_id()
+        with get_db_connection(post_id) as conn:
+            cursor = conn.execute(
+                "INSERT INTO posts (id, title, content) VALUES (?, ?, ?)",
+                (post_id, data["title"], data.get("content", "")),
             )
             conn.commit()
             post_id = cursor.lastrowid
+            post = read_post(conn, post_id) if front_page is not None else None
+        if post is not None:
+            front_page.upsert(post)
         return jsonify({"id": post_id, "message": "Post created successfully"}), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -65,15 +225,19 @@ def create_post():
 
 @app.route("/posts/<int:post_id>", methods=["PUT"])
 def update_post(post_id):
-    if not request.json:
+    data = wire.request_data()
+    if not data:
         return jsonify({"error": "Bad request"}), 400
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(post_id) as conn:
             conn.execute(
                 "UPDATE posts SET title = ?, content = ? WHERE id = ?",
-                (request.json.get("title"), request.json.get("content"), post_id),
+                (data.get("title"), data.get("content"), post_id),
             )
             conn.commit()
+            post = read_post(conn, post_id) if front_page is not None else None
+        if post is not None:
+            front_page.upsert(post)
         return jsonify({"message": "Post updated successfully"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -82,13 +246,27 @@ def update_post(post_id):
 @app.route("/posts/<int:post_id>", methods=["DELETE"])
 def delete_post(post_id):
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(post_id) as conn:
             conn.execute("DELETE FROM posts WHERE id = ?", (post_id,))
             conn.commit()
+        if front_page is not None:
+            front_page.remove(post_id)
         return jsonify({"message": "Post deleted successfully"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/posts/feed/rebuild", methods=["POST"])
+def rebuild_feed():
+    # After writes that bypassed this service, e.g. bulk_load.py.
+    if front_page is None:
+        return jsonify({"error": "The feed is disabled"}), 404
+    try:
+        front_page.rebuild()
+        return jsonify({"feed": front_page.stats()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 if __name__ == "__main__":
     app.run(port=5001)
@@ -1,74 +1,287 @@
 from flask import Flask, jsonify, request
+from concurrent.futures import TimeoutError as FutureTimeout
 import requests
 import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common import (  # noqa: E402
+    compression,
+    conditional,
+    health,
+    http_client,
+    metrics,
+    singleflight,
+    streaming,
+    tokens,
+    tracing,
+    wire,
+)
+from common.cache import LRUCache  # noqa: E402
 
 app = Flask(__name__)
+metrics.instrument(app)
+tracing.instrument(app, "post")
+compression.instrument(app)
 logging.basicConfig(level=logging.INFO)
 
-DB_SERVICE_URL = "http://localhost:5001"
-AUTH_SERVICE_URL = "http://localhost:5003"
+DB_SERVICE_URL = os.environ.get("DB_SERVICE_URL", "http://localhost:5001")
+AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL", "http://localhost:5003")
+COMMENT_SERVICE_URL = os.environ.get("COMMENT_SERVICE_URL", "http://localhost:5005")
+
+db_client = http_client.get_client("db", DB_SERVICE_URL)
+auth_client = http_client.get_client("auth", AUTH_SERVICE_URL)
+comment_client = http_client.get_client("comment", COMMENT_SERVICE_URL)
+token_verifier = tokens.TokenVerifier(auth_client)
+
+REQUEST_DEADLINE = float(os.environ.get("POST_SERVICE_REQUEST_DEADLINE", 5.0))
+# Share of the caller's budget kept for answering: comments still missing
+# by then are left out, and the view goes out before the caller gives up.
+RESPONSE_HEADROOM = float(os.environ.get("POST_SERVICE_RESPONSE_HEADROOM", 0.1))
+fanout_executor = tracing.ContextThreadPoolExecutor(
+    max_workers=int(os.environ.get("POST_SERVICE_FANOUT_WORKERS", 32)),
+    thread_name_prefix="fanout",
+)
+
+# Concurrent reads of one post share a single db_service call. With a TTL
+# (e.g. 0.5 seconds) the result is also kept that long; edits and deletes
+# through this process drop it, those through other replicas show once it
+# expires.
+MICROCACHE_TTL = float(os.environ.get("POST_SERVICE_MICROCACHE_TTL", 0))
+post_reads = singleflight.Group(
+    "post",
+    cache=LRUCache(
+        int(os.environ.get("POST_SERVICE_MICROCACHE_SIZE", 1000)),
+        ttl=MICROCACHE_TTL,
+    )
+    if MICROCACHE_TTL > 0
+    else None,
+    cacheable=lambda response: response.status_code == 200,
+)
 
 
 def validate_token(token):
+    return token_verifier.verify(token)
+
+
+def read_post(post_id, deadline=None):
+    """db_service's response for the post, read in full and shared with
+    concurrent readers. It is never conditional; callers compare tags."""
+    return post_reads.do(
+        post_id, lambda: db_client.get(f"/posts/{post_id}", deadline=deadline)
+    )
+
+
+def add_comment_stats(posts, known_tag=None):
+    """Merge comment stats into ``posts`` and return their tag.
+
+    One batched lookup for the whole page; the listing is still served
+    without counts (and untagged) if comment_service is unavailable. If the
+    stats still match ``known_tag`` they are not sent, ``posts`` is left
+    alone and ``known_tag`` is returned.
+    """
+    if not posts:
+        return conditional.etag("stats")
     try:
-        response = requests.post(f"{AUTH_SERVICE_URL}/validate", json={"token": token})
-        if response.status_code == 200:
-            return response.json()
-        return None
+        response = comment_client.get(
+            "/stats",
+            params={"post_ids": ",".join(str(p["id"]) for p in posts)},
+            headers=conditional.if_none_match(known_tag),
+        )
+        response.raise_for_status()
+        if response.status_code == 304:
+            return known_tag
+        stats = wire.decode(response)["stats"]
     except requests.RequestException as e:
-        logging.error(f"Error validating token: {str(e)}")
+        logging.warning(f"Error fetching comment stats: {str(e)}")
         return None
+    for post in posts:
+        post.update(stats.get(str(post["id"]), {}))
+    return conditional.upstream_tag(response)
 
 
-@app.route("/health", methods=["GET"])
-def health_check():
-    db_health = requests.get(f"{DB_SERVICE_URL}/health").json()
-    auth_health = requests.get(f"{AUTH_SERVICE_URL}/health").json()
-    if db_health["status"] == "healthy" and auth_health["status"] == "healthy":
-        return jsonify({"status": "healthy"}), 200
-    return jsonify({"status": "unhealthy"}), 500
+prober = health.Prober()
+prober.dependency("db", db_client)
+prober.dependency("auth", auth_client)
+health.instrument(app, prober, extras=lambda: {"post_reads": post_reads.stats()})
 
 
 @app.route("/")
 def index():
+    # Tagged with the listing's and the stats' tags. A caller holding that
+    # tag gets a 304 when the listing is unchanged and the stats revalidate.
+    held = conditional.parts(2)
     try:
-        response = requests.get(f"{DB_SERVICE_URL}/posts")
+        response = db_client.get("/posts", params=request.args)
+        if response.status_code == 404:
+            return jsonify({"error": "Cursor not found"}), 404
         response.raise_for_status()
-        return jsonify(response.json())
+        listing_tag = conditional.upstream_tag(response)
+        known_stats = held[1] if held and held[0] == listing_tag else None
+        data = wire.decode(response)
+        stats_tag = add_comment_stats(data["posts"], known_stats)
+        tag = conditional.combine(listing_tag, stats_tag)
+        return conditional.respond(data, tag)
     except requests.RequestException as e:
         logging.error(f"Error fetching posts: {str(e)}")
         return jsonify({"error": "Failed to fetch posts"}), 500
 
 
+@app.route("/search")
+def search():
+    try:
+        response = db_client.get("/posts/search", params=request.args)
+        response.raise_for_status()
+        data = wire.decode(response)
+        add_comment_stats(data["results"])
+        return wire.respond(data)
+    except requests.RequestException as e:
+        logging.error(f"Error searching posts: {str(e)}")
+        return jsonify({"error": "Failed to search posts"}), 500
+
+
+@app.route("/export")
+def export():
+    # Nothing is added to exported posts, so db_service's stream is relayed
+    # as it arrives instead of being decoded here. A long export's batches
+    # are not timed like ordinary calls, so it gets the configured timeout.
+    try:
+        response = db_client.get(
+            "/posts/export",
+            params=request.args,
+            stream=True,
+            timeout=db_client.timeout,
+        )
+        return streaming.passthrough(streaming.checked(response))
+    except requests.RequestException as e:
+        logging.error(f"Error exporting posts: {str(e)}")
+        return jsonify({"error": "Failed to export posts"}), 500
+
+
 @app.route("/<int:post_id>")
 def post(post_id):
     try:
-        response = requests.get(f"{DB_SERVICE_URL}/posts/{post_id}")
+        response = read_post(post_id)
         response.raise_for_status()
-        return jsonify(response.json()), response.status_code
+        return streaming.relay(response)
     except requests.RequestException as e:
         logging.error(f"Error fetching post {post_id}: {str(e)}")
         return jsonify({"error": "Failed to fetch post"}), 500
 
 
+@app.route("/<int:post_id>/view")
+def post_view(post_id):
+    # Everything the post page needs in one response: the post, the first
+    # (or requested) page of comments and the comment stats. A caller
+    # holding this view's tag has both parts revalidated rather than sent.
+    deadline = http_client.incoming_deadline(
+        request.headers, REQUEST_DEADLINE, headroom=RESPONSE_HEADROOM
+    )
+    comment_args = {
+        key: request.args[key] for key in ("after", "before") if key in request.args
+    }
+    held_post, held_comments = conditional.parts(2) or (None, None)
+
+    def fetch_post():
+        return read_post(post_id, deadline)
+
+    def fetch_comments(held=None):
+        return comment_client.get(
+            f"/comments/{post_id}",
+            params=comment_args,
+            headers=conditional.if_none_match(held),
+            deadline=deadline,
+        )
+
+    post_future = fanout_executor.submit(fetch_post)
+    comments_future = fanout_executor.submit(fetch_comments, held_comments)
+
+    try:
+        post_response = post_future.result()
+        if post_response.status_code == 404:
+            return jsonify({"error": "Post not found"}), 404
+        post_response.raise_for_status()
+    except requests.RequestException as e:
+        logging.error(f"Error fetching post {post_id}: {str(e)}")
+        return jsonify({"error": "Failed to fetch post"}), 500
+
+    try:
+        comments_response = comments_future.result(
+            timeout=max(0, deadline - time.monotonic())
+        )
+        comments_response.raise_for_status()
+    except (requests.RequestException, FutureTimeout) as e:
+        logging.warning(
+            f"Error fetching comments for post {post_id}: "
+            f"{str(e) or 'deadline exceeded'}"
+        )
+        comments_response = None
+
+    post_fresh = (
+        held_post is not None and conditional.upstream_tag(post_response) == held_post
+    )
+    comments_fresh = (
+        comments_response is not None and comments_response.status_code == 304
+    )
+    if post_fresh and comments_fresh:
+        return conditional.not_modified(conditional.combine(held_post, held_comments))
+    # Only the comments were unchanged; their body is needed after all.
+    if comments_fresh:
+        try:
+            comments_response = fetch_comments()
+            comments_response.raise_for_status()
+        except requests.RequestException as e:
+            logging.warning(f"Error fetching comments for post {post_id}: {str(e)}")
+            comments_response = None
+
+    view = {
+        "post": wire.decode(post_response),
+        "comments": [],
+        "next_cursor": None,
+        "prev_cursor": None,
+        "stats": {"comment_count": None, "last_comment_at": None},
+        "comments_unavailable": comments_response is None,
+    }
+    if comments_response is None:
+        # Degraded views are not tagged, so they are never revalidated.
+        return wire.respond(view)
+    comments_data = wire.decode(comments_response)
+    view.update(
+        comments=comments_data["comments"],
+        next_cursor=comments_data["next_cursor"],
+        prev_cursor=comments_data["prev_cursor"],
+        stats={
+            "comment_count": comments_data["total"],
+            "last_comment_at": comments_data["last_comment_at"],
+        },
+    )
+    tag = conditional.combine(
+        conditional.upstream_tag(post_response),
+        conditional.upstream_tag(comments_response),
+    )
+    return conditional.respond(view, tag)
+
+
 @app.route("/create", methods=["POST"])
 def create():
-    data = request.json
+    data = wire.request_data()
     user_data = validate_token(data.get("token"))
     if not user_data:
         return jsonify({"error": "Unauthorized"}), 401
 
     try:
-        response = requests.post(
-            f"{DB_SERVICE_URL}/posts",
+        response = db_client.post(
+            "/posts",
             json={
                 "title": data["title"],
                 "content": data["content"],
-                "author": user_data["user"],
+                "author": user_data["username"],
             },
+            stream=True,
         )
-        response.raise_for_status()
-        return jsonify(response.json()), response.status_code
+        return streaming.passthrough(streaming.checked(response))
     except requests.RequestException as e:
         logging.error(f"Error creating post: {str(e)}")
         return jsonify({"error": "Failed to create post"}), 500
@@ -76,41 +289,44 @@ def create():
 
 @app.route("/<int:post_id>/edit", methods=["PUT"])
 def edit(post_id):
-    data = request.json
+    data = wire.request_data()
     user_data = validate_token(data.get("token"))
     if not user_data:
         return jsonify({"error": "Unauthorized"}), 401
 
     try:
-        response = requests.put(
-            f"{DB_SERVICE_URL}/posts/{post_id}",
+        response = db_client.put(
+            f"/posts/{post_id}",
             json={
                 "title": data["title"],
                 "content": data["content"],
-                "author": user_data["user"],
+                "author": user_data["username"],
             },
+            stream=True,
         )
-        response.raise_for_status()
-        return jsonify(response.json()), response.status_code
+        return streaming.passthrough(streaming.checked(response))
     except requests.RequestException as e:
         logging.error(f"Error updating post {post_id}: {str(e)}")
         return jsonify({"error": "Failed to update post"}), 500
+    finally:
+        post_reads.forget(post_id)
 
 
 @app.route("/<int:post_id>/delete", methods=["DELETE"])
 def delete(post_id):
-    data = request.json
+    data = wire.request_data()
     user_data = validate_token(data.get("token"))
     if not user_data:
         return jsonify({"error": "Unauthorized"}), 401
 
     try:
-        response = requests.delete(f"{DB_SERVICE_URL}/posts/{post_id}")
-        response.raise_for_status()
-        return jsonify(response.json()), response.status_code
+        response = db_client.delete(f"/posts/{post_id}", stream=True)
+        return streaming.passthrough(streaming.checked(response))
     except requests.RequestException as e:
         logging.error(f"Error deleting post {post_id}: {str(e)}")
         return jsonify({"error": "Failed to delete post"}), 500
+    finally:
+        post_reads.forget(post_id)
 
 
 if __name__ == "__main__":
@@ -1,25 +1,130 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 import logging
+import os
+import sys
+import threading
+import time
+from jinja2 import FileSystemBytecodeCache
 from jinja2.exceptions import TemplateNotFound
+from markupsafe import Markup, escape
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.append(os.path.join(BASE_DIR, "..", ".."))
+from common import (  # noqa: E402
+    assets,
+    compression,
+    health,
+    metrics,
+    search,
+    tracing,
+    wire,
+)
+
+# Hot reload re-stats template files on every render; only for development.
+HOT_RELOAD = os.environ.get("TEMPLATE_HOT_RELOAD", "0") == "1"
+WARMUP = os.environ.get("TEMPLATE_WARMUP", "1") == "1"
+CACHE_DIR = os.environ.get("TEMPLATE_CACHE_DIR", os.path.join(BASE_DIR, ".jinja_cache"))
+STATIC_DIR = os.environ.get(
+    "TEMPLATE_STATIC_DIR", os.path.join(BASE_DIR, "..", "..", "static")
+)
 
 app = Flask(__name__, template_folder="../../templates")
+app.config["TEMPLATES_AUTO_RELOAD"] = HOT_RELOAD
+metrics.instrument(app)
+tracing.instrument(app, "template")
+compression.instrument(app)
 logging.basicConfig(level=logging.INFO)
 
+os.makedirs(CACHE_DIR, exist_ok=True)
+app.jinja_options = {
+    **app.jinja_options,
+    "bytecode_cache": FileSystemBytecodeCache(CACHE_DIR),
+}
+
+# Templates build links to gateway routes; mirror them as build-only rules so
+# url_for works when rendering here.
+for rule, endpoint in (
+    ("/", "index"),
+    ("/<int:post_id>", "post"),
+    ("/create", "create"),
+    ("/<int:id>/edit", "edit"),
+    ("/<int:id>/delete", "delete"),
+    ("/login", "login"),
+    ("/register", "register"),
+    ("/logout", "logout"),
+    ("/add_comment/<int:post_id>", "add_comment"),
+    ("/search", "search"),
+):
+    app.add_url_rule(rule, endpoint, build_only=True)
+
+
+# The gateway serves static files under content-hashed names; link to those
+# so browsers can cache them for good.
+asset_names = assets.fingerprints(STATIC_DIR) if os.path.isdir(STATIC_DIR) else {}
+
+
+@app.template_global()
+def asset_url(name):
+    return f"/static/{asset_names.get(name, name)}"
+
+
+@app.template_filter("highlight")
+def highlight(snippet):
+    # Search snippets mark matches with control characters: escape the text
+    # first, then turn the markers into tags.
+    return Markup(
+        str(escape(snippet or ""))
+        .replace(search.HIGHLIGHT_START, "<mark>")
+        .replace(search.HIGHLIGHT_END, "</mark>")
+    )
 
-@app.route("/health", methods=["GET"])
-def health_check():
+
+compiled_templates = {}
+# Without warmup templates compile on first render, so there is nothing to
+# wait for before serving.
+warmup_state = {"ready": not WARMUP, "templates": 0, "seconds": None, "error": None}
+
+
+def warmup():
+    """Compile every template into memory, writing bytecode to CACHE_DIR."""
+    start = time.perf_counter()
     try:
-        # Try to render a simple template to check if the template engine is working
-        render_template("base.html")
-        return jsonify({"status": "healthy"}), 200
+        for name in app.jinja_env.list_templates():
+            compiled_templates[name] = app.jinja_env.get_template(name)
+        warmup_state["templates"] = len(compiled_templates)
+        warmup_state["seconds"] = round(time.perf_counter() - start, 4)
+        warmup_state["ready"] = True
+        logging.info(
+            f"Compiled {len(compiled_templates)} templates "
+            f"in {warmup_state['seconds']}s"
+        )
     except Exception as e:
-        logging.error(f"Health check failed: {str(e)}")
-        return jsonify({"status": "unhealthy", "error": str(e)}), 500
+        warmup_state["error"] = str(e)
+        logging.error(f"Template warmup failed: {str(e)}")
+
+
+warmup_thread = threading.Thread(target=warmup, daemon=True)
+if WARMUP:
+    warmup_thread.start()
+
+
+def check_templates():
+    if warmup_state["error"]:
+        raise RuntimeError(warmup_state["error"])
+    if not warmup_state["ready"]:
+        raise RuntimeError("warming up")
+    return {"templates": warmup_state["templates"]}
+
+
+prober = health.Prober()
+prober.check("templates", check_templates)
+health.instrument(app, prober, extras=lambda: {"warmup": warmup_state})
 
 
 @app.route("/render", methods=["POST"])
 def render():
-    data = request.json
+    data = wire.request_data()
     if not data or "template" not in data or "context" not in data:
         return jsonify(
             {"error": "Invalid request. 'template' and 'context' are required."}
@@ -32,8 +137,23 @@ def render():
         return jsonify({"error": "Invalid context. Must be a dictionary."}), 400
 
     try:
-        rendered_template = render_template(template_name, **context)
-        return jsonify({"rendered": rendered_template}), 200
+        # With hot reload the name is resolved per render so edits are seen.
+        template = (
+            template_name
+            if HOT_RELOAD
+            else compiled_templates.get(template_name, template_name)
+        )
+        start = time.perf_counter()
+        rendered_template = render_template(template, **context)
+        metrics.TEMPLATE_RENDER_DURATION.observe(
+            time.perf_counter() - start, template_name
+        )
+        # Callers that accept HTML get the page as the body instead of
+        # wrapped (and escaped) in a JSON string.
+        accept = request.accept_mimetypes
+        if accept["text/html"] > accept["application/json"]:
+            return Response(rendered_template, content_type="text/html; charset=utf-8")
+        return wire.respond({"rendered": rendered_template})
     except TemplateNotFound:
         logging.error(f"Template not found: {template_name}")
         return jsonify({"error": f"Template '{template_name}' not found"}), 404
@@ -43,4 +163,11 @@ def render():
 
 
 if __name__ == "__main__":
+    if "--warmup" in sys.argv:
+        # Used at image build time to ship a populated bytecode cache.
+        if WARMUP:
+            warmup_thread.join()
+        else:
+            warmup()
+        sys.exit(0 if warmup_state["ready"] and not warmup_state["error"] else 1)
     app.run(port=5004)
@@ -0,0 +1,117 @@
+"""Double the number of post shards by splitting every shard in two.
+
+Shard ``i`` of ``n`` keeps the posts with ``id % 2n == i`` and hands the
+rest to a new shard ``i + n`` (see ``common/sharding.py``), so no rows move
+between the shards that already exist. New files are created from
+``schema.sql`` and filled the way ``bulk_load.py`` fills them: triggers and
+indexes are off during the copy and the full-text index is rebuilt in bulk.
+Moved rows are then deleted from their old shard, which keeps its full-text
+index in step through the schema's triggers.
+
+Stop db_service first, keep a backup, and restart it with ``DB_SHARDS`` set
+to the new count; it refuses to start on a layout it does not expect.
+
+    python shard_split.py                          # database.db, 1 -> 2 shards
+    python shard_split.py --database data/database.db --times 2   # 1 -> 4
+"""
+
+import argparse
+import contextlib
+import os
+import sqlite3
+import time
+
+import bulk_load
+from common import sharding
+
+TABLE = "posts"
+
+
+def copy_shard(source, target, count, shard):
+    """Create ``target`` as shard ``shard`` of ``count`` from the rows of
+    ``source`` that belong to it."""
+    conn, deferred = bulk_load.open_database(target, "schema.sql")
+    conn.execute("ATTACH DATABASE ? AS source", (source,))
+    columns = ", ".join(
+        row[1] for row in conn.execute(f"PRAGMA source.table_info({TABLE})")
+    )
+    conn.execute("BEGIN")
+    moved = conn.execute(
+        f"INSERT INTO {TABLE} ({columns}) SELECT {columns} "
+        f"FROM source.{TABLE} WHERE id % ? = ?",
+        (count, shard),
+    ).rowcount
+    conn.execute("UPDATE shard_layout SET shard = ?, count = ?", (shard, count))
+    conn.execute("COMMIT")
+    conn.execute("DETACH DATABASE source")
+    bulk_load.rebuild_fulltext(conn)
+    bulk_load.finish_database(conn, deferred)
+    return moved
+
+
+def split(path):
+    """Split every shard of the set starting at ``path``; return per-shard
+    stats."""
+    with contextlib.closing(sqlite3.connect(path)) as conn:
+        shard, count = sharding.read_layout(conn)
+    if shard != 0:
+        raise SystemExit(f"{path} is shard {shard}, not the first shard")
+    paths = sharding.shard_paths(path, count * 2)
+    for target in paths[count:]:
+        if os.path.exists(target):
+            raise SystemExit(f"{target} already exists; remove it first")
+
+    stats = []
+    for index in range(count):
+        source, target = paths[index], paths[index + count]
+        start = time.perf_counter()
+        try:
+            moved = copy_shard(source, target, count * 2, index + count)
+        except BaseException:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(target + suffix):
+                    os.remove(target + suffix)
+            raise
+
+        # The copy is complete before anything is removed from the source.
+        conn = sqlite3.connect(source, isolation_level=None)
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            f"DELETE FROM {TABLE} WHERE id % ? = ?", (count * 2, index + count)
+        )
+        conn.execute("UPDATE shard_layout SET shard = ?, count = ?", (index, count * 2))
+        conn.execute("COMMIT")
+        conn.close()
+        stats.append(
+            {
+                "source": source,
+                "target": target,
+                "moved": moved,
+                "seconds": round(time.perf_counter() - start, 2),
+            }
+        )
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--database", default="database.db", help="the first shard's file"
+    )
+    parser.add_argument(
+        "--times", type=int, default=1, help="how many times to double (default 1)"
+    )
+    args = parser.parse_args()
+
+    for _ in range(args.times):
+        for row in split(args.database):
+            print(
+                f"{row['source']} -> {row['target']}: {row['moved']} posts "
+                f"in {row['seconds']}s"
+            )
+    with contextlib.closing(sqlite3.connect(args.database)) as conn:
+        print(f"Now {sharding.read_layout(conn)[1]} shards; set DB_SHARDS to match.")
+
+
+if __name__ == "__main__":
+    main()
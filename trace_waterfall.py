@@ -0,0 +1,123 @@
+"""Reassemble recorded spans into per-request waterfalls.
+
+Reads span JSON lines written by ``common.tracing``, either a ``TRACE_FILE``
+or service logs (anything before the first ``{`` on a line is ignored, so
+logger prefixes are fine). Without a trace id, lists the slowest traces;
+with one, prints its spans as an indented tree with each span's offset from
+the start of the trace and a bar showing where its time went.
+
+    python trace_waterfall.py spans.jsonl
+    python trace_waterfall.py spans.jsonl --trace 4bf92f3577b34da6a3ce929d0e0e4736
+
+Offsets compare wall clocks of different processes, so on separate hosts
+they are only as accurate as clock synchronisation.
+"""
+
+import argparse
+import collections
+import json
+import sys
+
+BAR_WIDTH = 40
+
+
+def read_spans(paths):
+    traces = collections.defaultdict(list)
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                start = line.find("{")
+                if start < 0:
+                    continue
+                try:
+                    span = json.loads(line[start:])
+                except ValueError:
+                    continue
+                if isinstance(span, dict) and "trace_id" in span:
+                    traces[span["trace_id"]].append(span)
+    return traces
+
+
+def trace_bounds(spans):
+    start = min(s["start"] for s in spans)
+    end = max(s["start"] + s["duration_ms"] / 1000 for s in spans)
+    return start, end
+
+
+def roots_and_children(spans):
+    ids = {s["span_id"] for s in spans}
+    children = collections.defaultdict(list)
+    roots = []
+    for span in sorted(spans, key=lambda s: s["start"]):
+        if span["parent_id"] in ids:
+            children[span["parent_id"]].append(span)
+        else:
+            # The parent was not recorded (e.g. it is the caller's span).
+            roots.append(span)
+    return roots, children
+
+
+def describe(span):
+    details = [
+        f"{key}={span[key]}"
+        for key in ("path", "statement", "status", "error")
+        if span.get(key) is not None
+    ]
+    return f"{span['service']} {span['name']}" + (
+        f"  [{', '.join(details)}]" if details else ""
+    )
+
+
+def print_waterfall(trace_id, spans):
+    start, end = trace_bounds(spans)
+    total = max(end - start, 1e-9)
+    roots, children = roots_and_children(spans)
+    print(f"Trace {trace_id}: {total * 1000:.1f} ms, {len(spans)} spans")
+    print(f"{'offset':>9} {'duration':>9}  {'':{BAR_WIDTH + 2}}  span")
+
+    def walk(span, depth):
+        offset = span["start"] - start
+        first = int(offset / total * BAR_WIDTH)
+        width = max(1, round(span["duration_ms"] / 1000 / total * BAR_WIDTH))
+        bar = (" " * first + "=" * width)[:BAR_WIDTH].ljust(BAR_WIDTH)
+        print(
+            f"{offset * 1000:>7.1f}ms {span['duration_ms']:>7.1f}ms  |{bar}|  "
+            f"{'  ' * depth}{describe(span)}"
+        )
+        for child in children[span["span_id"]]:
+            walk(child, depth + 1)
+
+    for root in roots:
+        walk(root, 0)
+
+
+def print_slowest(traces, limit):
+    rows = []
+    for trace_id, spans in traces.items():
+        start, end = trace_bounds(spans)
+        roots, _ = roots_and_children(spans)
+        rows.append((end - start, trace_id, len(spans), describe(roots[0])))
+    rows.sort(reverse=True)
+    print(f"{'duration':>10}  {'spans':>5}  {'trace id':32}  root")
+    for duration, trace_id, count, root in rows[:limit]:
+        print(f"{duration * 1000:>8.1f}ms  {count:>5}  {trace_id}  {root}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="+", help="span files or service logs")
+    parser.add_argument("--trace", help="print the waterfall of this trace id")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    traces = read_spans(args.files)
+    if args.trace:
+        if args.trace not in traces:
+            sys.exit(f"No spans for trace {args.trace}")
+        print_waterfall(args.trace, traces[args.trace])
+    else:
+        print_slowest(traces, args.limit)
+
+
+if __name__ == "__main__":
+    main()